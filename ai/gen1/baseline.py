@@ -1,5 +1,6 @@
 import lib.gamestate as gs
 import lib.choice as choice
+import lib.typechart
 
 # note that the output of main function is a single integer representing the
 # move made
@@ -24,7 +25,7 @@ def damage_calc(atker: gs.Pokemon,
         atk = atker.spa
         defense = defder.spd
 
-    Type = 1  # TODO
+    Type = lib.typechart.effectiveness(move, defder)
     percent_dmg = min(defder.hp_percent, 0.9*(((2*atker.level)/5+2)*move.power*atk/defense/50+2)*Type/defder.maxhp)
     does_kill = percent_dmg == defder.hp_percent
     print("!@" + str(percent_dmg))
@@ -64,6 +65,8 @@ def simulate(ally, oppo, ally_move=None, oppo_move=None) -> float:
     change in health % for oppo and ally, outputs change in oppo % - change in
     ally %
     """
+    # get_value marks fainted pokemon, so work on copies rather than the gamestate's own pokemon
+    ally, oppo = ally.clone(), oppo.clone()
     value = 0
     faster = ally.spe > oppo.spe
     bad = ["frozen", "sleeping"]
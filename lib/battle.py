@@ -0,0 +1,330 @@
+"""
+Battle routes the Pokemon-Showdown battle stream of a single game to the bots
+playing in it. It is independent of how the stream is read, so that both the
+one-battle-at-a-time `lib.local.Local` runner and the concurrent
+`lib.multiplex.Multiplex` runner can share it.
+"""
+
+import json
+import logging
+import time
+import lib.bots
+import lib.normalizer as normalizer
+import lib.trajectory
+from lib.phases import PhaseTimer
+
+MODE_ALL = -1
+EXPECT_LINE = 0
+EXPECT_PLAYER = 1
+EXPECT_SECRET = 2
+EXPECT_PUBLIC = 3
+EXPECT_RESULT = 4
+LOGGER = logging.getLogger("pokemon-ai.battle")
+
+
+class Battle():
+    """
+    The Battle class keeps track of where it is within the battle stream of one
+    game and forwards each line to the relevant bots. Lines are pushed in one
+    at a time through `feed`, which tells the caller when the bots have to be
+    asked for a move through `ask`.
+
+    Args:
+        bot_list (list): List of Bots to compete in this battle.
+        replay (lib.replay.ReplayWriter):
+            Optional writer that the public battle log and the gamestates of
+            the bots at every decision point are streamed to. It is closed
+            once the battle is over.
+        battle_id (str): Optional id used by the caller to tell battles apart.
+        profile_phases (bool): Whether to time the phases of the battle in `timer`.
+        trajectory (lib.trajectory.TrajectoryWriter):
+            Optional writer that the decisions of the bots are appended to
+            once the battle is over.
+
+    Attributes:
+        battle_id (str): Optional id used by the caller to tell battles apart.
+        bots (list): List of Bots to compete in this battle, starting at index 1.
+        replay (lib.replay.ReplayWriter): Optional writer the replay is streamed to.
+        trajectory (lib.trajectory.TrajectoryWriter): Optional writer the decisions of the bots are appended to.
+        decision_times (list):
+            Wall time in seconds of each call to the bot files made for this
+            battle, which decided either a single choice or a whole batch of
+            choices as counted in `decision_sizes`. A batch spanning several
+            battles is only counted in the battle of its first choice.
+        decision_sizes (list): Number of choices made by each call of `decision_times`.
+        lines (int): Number of protocol lines parsed by the gamestates of the bots.
+        timer (lib.phases.PhaseTimer): Timings of the phases of the battle, or None if not profiling.
+        features (lib.normalizer.FeatureCache): Features kept between the gamestates that are normalized.
+        finished (bool): Whether the result of the battle has been received.
+        winner (str): Name of the winning bot, or None on a tie.
+    """
+    def __init__(self, bot_list: list, replay=None, battle_id: str = None, profile_phases: bool = False,
+                 trajectory=None):
+        self.battle_id = battle_id
+        self.bots = [None]
+        self.bots.extend(bot_list)
+        self.replay = replay
+        self.trajectory = trajectory
+
+        self.mode = MODE_ALL  # Any positive number corresponds to the user's idx
+        self.expect = EXPECT_LINE
+        self.split_player = 0
+        self.secret_line = None
+        self.decision_times = []
+        self.decision_sizes = []
+        self.lines = 0
+        self.timer = PhaseTimer(1) if profile_phases else None
+        self.features = normalizer.FeatureCache() if replay or trajectory else None
+        # The turn, features, action and legal actions of every decision of each bot, kept until the battle is over
+        self.decisions = {i: [] for i in range(1, len(self.bots))}
+        self.finished = False
+        self.winner = None
+
+        for i in range(1, len(self.bots)):
+            self.bots[i].new_gamestate()
+
+    def start(self, gamemode: str) -> list:
+        """
+        Returns the commands that start this battle in the simulator.
+
+        Args:
+            gamemode (str): Format name of the gamemode to run.
+        """
+        cmds = ['>start {"formatid":"%s"}' % gamemode]
+        for i in range(1, len(self.bots)):
+            cmds.append('>player p%d {"name":"%s"}' % (i, self.bots[i].name))
+        return cmds
+
+    def result(self) -> int:
+        """
+        Returns the index of the winning bot, or 0 if the battle was a tie.
+        """
+        for i in range(1, len(self.bots)):
+            if self.winner and self.bots[i].name == self.winner:
+                return i
+        return 0
+
+    def feed(self, line: str) -> bool:
+        """
+        Processes one line of the battle stream, including its trailing
+        newline, and forwards it to the bots.
+
+        Args:
+            line (str): Line sent by the simulator.
+
+        Returns:
+            bool:
+                True if the line ended an update while some bots have a
+                pending request, meaning that the battle should be passed to
+                `ask`. The simulator won't send anything more for this battle
+                until it gets the choices.
+        """
+        if self.finished:
+            return False
+        if self.expect != EXPECT_LINE:
+            self._expected[self.expect](self, line)
+        elif line == '\n' and self.mode == MODE_ALL:
+            return self.decision_point()
+        elif line in self._markers:
+            self._markers[line](self)
+        elif line != '\n':
+            self._message(line)
+        return False
+
+    def _read_player(self, line: str):
+        """ Reads the player a sideupdate is for, from a line like ``p2``. """
+        self.mode = int(line[1])  # takes out 2 from p2
+        self.expect = EXPECT_LINE
+
+    def _read_secret(self, line: str):
+        """ Keeps the secret half of a split message until its public half arrives. """
+        self.secret_line = line
+        self.expect = EXPECT_PUBLIC
+
+    def _read_public(self, line: str):
+        """ Passes a split message to the bots, where the player it concerns gets its secret half. """
+        LOGGER.info(f'<p{self.split_player} {self.secret_line[:-1]}')
+        self._broadcast(line, self.secret_line)
+        self.expect = EXPECT_LINE
+
+    def _read_result(self, line: str):
+        """ Reads the result sent at the end of the battle and finishes it. """
+        result_json = json.loads(line)
+        LOGGER.debug(json.dumps(result_json, indent=True))
+        self.winner = result_json.get("winner") or None
+        self.finished = True
+        if self.replay:
+            self.replay.result(self.winner)
+            self.replay.close()
+        if self.trajectory:
+            self.write_trajectory()
+        self.expect = EXPECT_LINE
+
+    def _start_update(self):
+        self.mode = MODE_ALL
+
+    def _start_sideupdate(self):
+        self.expect = EXPECT_PLAYER
+
+    def _start_end(self):
+        self.expect = EXPECT_RESULT
+
+    def _message(self, line: str):
+        """ Passes a protocol message to the bots it is meant for. """
+        if self.mode != MODE_ALL:
+            LOGGER.info(f'<p{self.mode} {line[:-1]}')
+            self.read(self.mode, line)
+            self.lines += 1
+            return
+        msg = line.split("|")
+        if len(msg) > 2 and msg[1] == 'split':
+            self.split_player = int(msg[2][1])
+            self.expect = EXPECT_SECRET
+        else:
+            self._broadcast(line)
+
+    def _broadcast(self, line: str, secret_line: str = None):
+        """
+        Passes a public message to every bot and to the replay.
+
+        Args:
+            line (str): The message as seen by everyone.
+            secret_line (str): Optional secret version of the message, passed to the bot of `split_player` instead.
+        """
+        LOGGER.info(f'<all {line[:-1]}')
+        for i in range(1, len(self.bots)):
+            self.read(i, secret_line if secret_line is not None and self.split_player == i else line)
+        self.lines += len(self.bots) - 1
+        if self.replay:
+            self.replay.log(line)
+
+    # What to do with a line when it is expected to be a specific part of the stream
+    _expected = {
+        EXPECT_PLAYER: _read_player,
+        EXPECT_SECRET: _read_secret,
+        EXPECT_PUBLIC: _read_public,
+        EXPECT_RESULT: _read_result,
+    }
+
+    # The lines that start a new part of the stream
+    _markers = {
+        'update\n': _start_update,
+        'sideupdate\n': _start_sideupdate,
+        'end\n': _start_end,
+    }
+
+    def read(self, bot_idx: int, line: str):
+        """
+        Passes a line to a bot, timing it as the parse phase when profiling.
+
+        Args:
+            bot_idx (int): Index of the bot, starting at 1.
+            line (str): Line to pass to the bot.
+        """
+        if self.timer is None:
+            self.bots[bot_idx].read(line)
+            return
+        start = time.perf_counter()
+        self.bots[bot_idx].read(line)
+        self.timer.add('parse', time.perf_counter() - start)
+
+    def pending(self) -> list:
+        """
+        Returns the indices of the bots that have a pending request.
+        """
+        return [i for i in range(1, len(self.bots))
+                if self.bots[i].gamestate.request_pending and self.bots[i].gamestate.result == -1]
+
+    def decision_point(self) -> bool:
+        """
+        Called once an update has been read in full. The simulator sends the
+        requests before the update describing what happened in the turn, so
+        this is the point where the bots with a pending request can decide.
+
+        Returns:
+            bool: Whether any bot has a pending request.
+        """
+        if not self.pending():
+            return False
+
+        LOGGER.debug("---- ASK MOVE ----")
+        if self.replay:
+            for i in range(1, len(self.bots)):
+                gamestate = self.bots[i].gamestate
+                start = time.perf_counter()
+                norm = normalizer.normalize(gamestate, gamestate.player_idx, self.features)
+                if self.timer:
+                    self.timer.add('normalize', time.perf_counter() - start)
+                self.replay.snapshot(i, gamestate, norm)
+        if self.trajectory:
+            for i in self.pending():
+                gamestate = self.bots[i].gamestate
+                if all(player.get_active() for player in gamestate.players[:2]):
+                    features = normalizer.normalize_array(gamestate, gamestate.player_idx, cache=self.features)
+                    mask = lib.trajectory.legal_mask(gamestate, gamestate.player_idx)
+                    self.decisions[i].append([gamestate.turn, features, -1, mask])
+        return True
+
+    def decided(self, bot_idx: int, choice: str):
+        """
+        Records the choice a bot made at the current decision point.
+
+        Args:
+            bot_idx (int): Index of the bot, starting at 1.
+            choice (str): The choice like ``move 1``.
+        """
+        decisions = self.decisions[bot_idx]
+        if decisions and decisions[-1][2] == -1:
+            decisions[-1][2] = lib.trajectory.action_id(choice)
+
+    def write_trajectory(self):
+        """ Appends the decisions of every bot to `trajectory`, with the result of the battle as their reward. """
+        for i in range(1, len(self.bots)):
+            decisions = self.decisions[i]
+            if not decisions:
+                continue
+            if self.winner is None:
+                reward = 0
+            else:
+                reward = 1 if self.bots[i].name == self.winner else -1
+            turns, features, actions, masks = zip(*decisions)
+            self.trajectory.append(str(self.battle_id), self.bots[i].gamestate.player_idx, turns, features,
+                                   actions, masks, reward)
+            decisions.clear()
+
+
+def ask(battles: list) -> list:
+    """
+    Asks every bot with a pending request in the given battles for a move. All
+    the bots are passed to `lib.bots.choose_many` at once, so bots of the same
+    type are decided for in a single batch. Every call to a bot file is timed
+    on its own and recorded once, along with the number of choices it made,
+    in the `decision_times` and `decision_sizes` of the battle of its first
+    choice.
+
+    Args:
+        battles (list): Battles that returned True from `Battle.feed`.
+
+    Returns:
+        list: Pairs of a battle and a choice for it in the form of a simulator command like `>p1 move 1`.
+    """
+    requests = [(battle, i) for battle in battles for i in battle.pending()]
+    if not requests:
+        return []
+
+    timings = []
+    choices = lib.bots.choose_many([battle.bots[i] for battle, i in requests], timings)
+    for seconds, idxs in timings:
+        battle = requests[idxs[0]][0]
+        battle.decision_times.append(seconds)
+        battle.decision_sizes.append(len(idxs))
+        if battle.timer:
+            battle.timer.add('choose', seconds)
+
+    commands = []
+    for (battle, i), choice in zip(requests, choices):
+        if battle.trajectory and choice is not None:
+            battle.decided(i, choice)
+        if choice is not None:
+            commands.append((battle, f'>p{i} {choice}'))
+    return commands
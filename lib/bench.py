@@ -0,0 +1,409 @@
+"""
+Benchmarks for the local self-play loop. Each benchmark returns its results as
+a dict, which `write` dumps to a json file along with the commit that was
+measured, so that regressions across commits can be compared.
+"""
+
+import copy
+import json
+import logging
+import re
+import subprocess
+import time
+import tracemalloc
+import lib.bots
+import lib.gamestate
+import lib.loader
+import lib.local
+import lib.protocol
+import lib.replay
+import lib.serialize
+
+LOGGER = logging.getLogger("pokemon-ai.bench")
+
+
+def percentile(values: list, percent: float) -> float:
+    """
+    Returns the nearest-rank percentile of a sorted list of values.
+
+    Args:
+        values (list): Values sorted in ascending order.
+        percent (float): Percentile to find between 0 and 100.
+    """
+    if not values:
+        return 0
+    rank = max(0, min(len(values) - 1, int(round(percent / 100 * len(values))) - 1))
+    return values[rank]
+
+
+def battles(gen: str, bot_types: list, gamemode: str, num: int, profile_phases: bool = False) -> dict:
+    """
+    Runs `num` battles through `lib.local.Local` and measures its throughput
+    and the latency of the decisions of the bots. Decisions made one at a
+    time and batches of decisions made in a single call to a bot file are
+    reported apart, since the latency of a batch isn't that of any one of
+    its decisions.
+
+    Args:
+        gen (str): Generation of the bots such as 'gen1'.
+        bot_types (list): The bot type of each player as defined in ai/{gen}/{bot_type}.
+        gamemode (str): Format name of the gamemode to run in the local simulator.
+        num (int): Number of simulations to run.
+        profile_phases (bool): Whether to also report the timings of each phase of the battle loop.
+
+    Returns:
+        dict: The results of the benchmark.
+    """
+    bots = [lib.bots.Bot(f'b{i}', gen, bot_type) for i, bot_type in enumerate(bot_types, 1)]
+    start = time.perf_counter()
+    local = lib.local.Local(bots, gamemode, num, False, profile_phases=profile_phases)
+    seconds = time.perf_counter() - start
+    decisions = sum(local.decision_sizes)
+    times = sorted(t for t, size in zip(local.decision_times, local.decision_sizes) if size == 1)
+    batch_times = sorted(t for t, size in zip(local.decision_times, local.decision_sizes) if size > 1)
+    results = {
+        "suite": "battles",
+        "gen": gen,
+        "bots": bot_types,
+        "gamemode": gamemode,
+        "battles": num,
+        "decisions": decisions,
+        "batches": len(batch_times),
+        "batched_decisions": decisions - len(times),
+        "lines": local.lines,
+        "seconds": seconds,
+        "battles_per_sec": num / seconds,
+        "decisions_per_sec": decisions / seconds,
+        "lines_per_sec": local.lines / seconds,
+        "decision_latency_p50_ms": percentile(times, 50) * 1000,
+        "decision_latency_p99_ms": percentile(times, 99) * 1000,
+        "batch_latency_p50_ms": percentile(batch_times, 50) * 1000,
+        "batch_latency_p99_ms": percentile(batch_times, 99) * 1000,
+    }
+    if local.timer:
+        results["phases"] = local.timer.to_dict()
+    return results
+
+
+def _legacy_tokenize(line):
+    args = line.strip()[1:].split('|')
+    return args[0], args[1:]
+
+
+def _legacy_standardize_string(string):
+    return re.sub(r"[^a-zA-Z0-9]", "", string).lower()
+
+
+def _legacy_read_ident(ident_string):
+    [player, idx, name] = re.search(r"p(\d)(\w*): (.*)", ident_string).groups()
+    return int(player), idx, name
+
+
+def _legacy_read_details(detail_string):
+    [name, level] = re.search(r"([^,]+), L(\d+)", detail_string).groups()
+    return name, int(level)
+
+
+def _legacy_read_condition(condition_string):
+    faint = False
+    hp = 0
+    maxhp = 100
+    status = []
+    if re.match(r"\d+ fnt", condition_string):
+        hp = 0
+        faint = True
+    if re.match(r"(\d+)/(\d+)( \w+)*", condition_string):
+        res = re.search(r"(\d+)/(\d+)( \w+)*", condition_string).groups()
+        hp = int(res[0]) / int(res[1])
+        maxhp = int(res[1])
+        faint = False
+        for status_condition in res[2:]:
+            if status_condition is not None:
+                status.append(status_condition.strip())
+    return hp, maxhp, faint, set(status)
+
+
+# The regex based decoders GameState used before lib.protocol, kept verbatim
+# as the baseline that the protocol benchmark compares against.
+LEGACY_DECODERS = (_legacy_tokenize, _legacy_standardize_string, _legacy_read_ident,
+                   _legacy_read_details, _legacy_read_condition)
+DECODERS = (lib.protocol.tokenize, lib.protocol.standardize_string, lib.protocol.read_ident,
+            lib.protocol.read_details, lib.protocol.read_condition)
+
+
+def _decode(lines: list, decoders: tuple, out: list = None):
+    """
+    Tokenizes every line and decodes the fields that GameState decodes for
+    it, appending the decoded values to `out` if given.
+    """
+    tokenize, standardize_string, read_ident, read_details, read_condition = decoders
+    for line in lines:
+        action, args = tokenize(line)
+        if action in ('switch', 'drag'):
+            values = (read_ident(args[0]), standardize_string(read_details(args[1])[0]),
+                      read_details(args[1]), read_condition(args[2]))
+        elif action in ('-damage', '-heal', '-sethp'):
+            values = (read_ident(args[0]), read_condition(args[1]))
+        elif action == 'move':
+            values = (read_ident(args[0]), standardize_string(args[1]))
+        else:
+            values = (action, args)
+        if out is not None:
+            out.append(values)
+
+
+def _legacy_decodes(line: str) -> bool:
+    """ Returns whether the legacy decoders can decode a line, which they can't for pokemon without a level. """
+    try:
+        _decode([line], LEGACY_DECODERS)
+    except (AttributeError, ValueError):
+        return False
+    return True
+
+
+def _read_log(path: str) -> list:
+    """ Reads the protocol lines of one recorded battle log. """
+    if path.endswith('.jsonl.gz'):
+        return [record["line"] for record in lib.replay.read(path) if record["type"] == "log"]
+    with open(path) as log_file:
+        return [line for line in log_file if line.startswith('|')]
+
+
+def read_logs(paths: list) -> list:
+    """
+    Reads the lines of recorded battle logs, which are either plain protocol
+    logs like the ones saved on replay.pokemonshowdown.com or battles saved
+    by `lib.replay.ReplayWriter`.
+
+    Args:
+        paths (list): Paths of the logs.
+
+    Returns:
+        list: Every protocol line of every log.
+    """
+    lines = []
+    for path in paths:
+        lines.extend(_read_log(path))
+    return lines
+
+
+def protocol(paths: list, repeat: int = 5) -> dict:
+    """
+    Compares the throughput of the protocol tokenizer and field decoders in
+    `lib.protocol` to the regex based ones they replaced, on recorded battle
+    logs. Both are checked to decode every line to the same values. Lines
+    the legacy decoders fail on, like the details of level 100 pokemon which
+    leave out the level, are left out of the comparison.
+
+    Args:
+        paths (list): Paths of the recorded logs as accepted by `read_logs`.
+        repeat (int): Number of passes over the lines, of which the fastest is reported.
+
+    Returns:
+        dict: The results of the benchmark.
+    """
+    all_lines = read_logs(paths)
+    lines = [line for line in all_lines if _legacy_decodes(line)]
+    legacy_values = []
+    values = []
+    _decode(lines, LEGACY_DECODERS, legacy_values)
+    _decode(lines, DECODERS, values)
+    mismatches = sum(1 for legacy, new in zip(legacy_values, values) if legacy != new)
+
+    def best(decoders):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            _decode(lines, decoders)
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    legacy_seconds = best(LEGACY_DECODERS)
+    seconds = best(DECODERS)
+    return {
+        "suite": "protocol",
+        "logs": len(paths),
+        "lines": len(lines),
+        "skipped_lines": len(all_lines) - len(lines),
+        "mismatches": mismatches,
+        "legacy_lines_per_sec": len(lines) / legacy_seconds,
+        "lines_per_sec": len(lines) / seconds,
+        "speedup": legacy_seconds / seconds,
+    }
+
+
+def _snapshots(gen: str, logs: list) -> list:
+    """ Parses each log into a gamestate and returns a copy of it at the start of every turn. """
+    snapshots = []
+    for lines in logs:
+        gamestate = lib.gamestate.GameState(gen, None)
+        for line in lines:
+            gamestate.parse(line)
+            if line.startswith('|turn|'):
+                snapshots.append(copy.deepcopy(gamestate))
+    return snapshots
+
+
+def memory(gen: str, paths: list) -> dict:
+    """
+    Measures the memory held by gamestate snapshots, like the ones kept
+    around while building datasets, by parsing recorded battle logs and
+    keeping a copy of the gamestate at the start of every turn.
+
+    The logs are parsed once before measuring, so that the dex templates and
+    the other caches built on first use aren't counted.
+
+    Args:
+        gen (str): Generation of the logs such as 'gen1'.
+        paths (list): Paths of the recorded logs as accepted by `read_logs`.
+
+    Returns:
+        dict: The results of the benchmark.
+    """
+    logs = [_read_log(path) for path in paths]
+    _snapshots(gen, logs)
+
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    snapshots = _snapshots(gen, logs)
+    held = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+
+    return {
+        "suite": "memory",
+        "logs": len(paths),
+        "gamestates": len(snapshots),
+        "bytes": held,
+        "bytes_per_gamestate": held / max(len(snapshots), 1),
+    }
+
+
+def serialize(gen: str, paths: list, repeat: int = 5) -> dict:
+    """
+    Compares the size and the speed of the binary gamestate encoding in
+    `lib.serialize` to dumping `GameState.to_dict` as json, on the
+    gamestates at the start of every turn of recorded battle logs. Every
+    decoded gamestate is checked to be equal to the one that was encoded.
+
+    Args:
+        gen (str): Generation of the logs such as 'gen1'.
+        paths (list): Paths of the recorded logs as accepted by `read_logs`.
+        repeat (int): Number of passes over the gamestates, of which the fastest is reported.
+
+    Returns:
+        dict: The results of the benchmark.
+    """
+    snapshots = _snapshots(gen, [_read_log(path) for path in paths])
+    encoded = [lib.serialize.dumps(gamestate) for gamestate in snapshots]
+    dumped = [json.dumps(gamestate.to_dict()) for gamestate in snapshots]
+    mismatches = sum(1 for gamestate, data in zip(snapshots, encoded)
+                     if lib.serialize.loads(data).to_dict() != gamestate.to_dict())
+
+    def best(function, values):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for value in values:
+                function(value)
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    count = max(len(snapshots), 1)
+    json_encode = best(lambda gamestate: json.dumps(gamestate.to_dict()), snapshots)
+    json_decode = best(json.loads, dumped)
+    encode = best(lib.serialize.dumps, snapshots)
+    decode = best(lib.serialize.loads, encoded)
+    return {
+        "suite": "serialize",
+        "logs": len(paths),
+        "gamestates": len(snapshots),
+        "mismatches": mismatches,
+        "json_bytes_per_gamestate": sum(len(data.encode('utf8')) for data in dumped) / count,
+        "bytes_per_gamestate": sum(len(data) for data in encoded) / count,
+        "json_encode_us": 1e6 * json_encode / count,
+        "json_decode_us": 1e6 * json_decode / count,
+        "encode_us": 1e6 * encode / count,
+        "decode_us": 1e6 * decode / count,
+    }
+
+
+def loader(path: str, batch_size: int = 1024, workers: int = 2, prefetch: int = 4, epochs: int = 1,
+           step_ms: float = 0) -> dict:
+    """
+    Measures the throughput of `lib.loader.Loader` over a trajectory store,
+    reading the batches in the calling process and then with worker
+    processes. A training step can be simulated by sleeping between the
+    batches, which the workers can overlap with reading the next ones.
+
+    Args:
+        path (str): Directory of the trajectory store.
+        batch_size (int): Number of rows in a batch.
+        workers (int): Number of worker processes of the loader.
+        prefetch (int): Number of batches each worker may have ready.
+        epochs (int): Number of passes over the store for each way of reading it.
+        step_ms (float): Time in milliseconds slept after every batch.
+
+    Returns:
+        dict: The results of the benchmark.
+    """
+    def run(num_workers):
+        data = lib.loader.Loader(path, batch_size, num_workers, prefetch, seed=0)
+        waits = []
+        rows = 0
+        start = time.perf_counter()
+        for _ in range(epochs):
+            batches = iter(data)
+            while True:
+                wait_start = time.perf_counter()
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                waits.append(time.perf_counter() - wait_start)
+                rows += len(batch["action"])
+                if step_ms:
+                    time.sleep(step_ms / 1000)
+        return rows, time.perf_counter() - start, waits
+
+    inline_rows, inline_seconds, _ = run(0)
+    rows, seconds, waits = run(workers)
+    first_wait = waits[0] if waits else 0
+    waits = sorted(waits)
+    return {
+        "suite": "loader",
+        "rows": rows,
+        "batch_size": batch_size,
+        "workers": workers,
+        "prefetch": prefetch,
+        "epochs": epochs,
+        "step_ms": step_ms,
+        "inline_rows_per_sec": inline_rows / inline_seconds if inline_seconds else 0,
+        "rows_per_sec": rows / seconds if seconds else 0,
+        "first_batch_ms": first_wait * 1000,
+        "batch_wait_p50_ms": percentile(waits, 50) * 1000,
+        "batch_wait_p99_ms": percentile(waits, 99) * 1000,
+    }
+
+
+def commit() -> str:
+    """ Returns the hash of the checked out commit, or None outside of git. """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True, encoding='utf8').stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write(results: dict, path: str):
+    """
+    Logs the results of a benchmark and writes them as json to `path` along
+    with the commit and the time they were measured at.
+
+    Args:
+        results (dict): The results returned by a benchmark.
+        path (str): Path of the json file to write.
+    """
+    results = dict(results, commit=commit(), timestamp=time.time())
+    for key, value in results.items():
+        LOGGER.info("%s: %s", key, value)
+    with open(path, 'w') as results_file:
+        json.dump(results, results_file, indent=4)
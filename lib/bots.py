@@ -2,9 +2,14 @@
 This module holds the Bot class, which can dynamically load files that provide
 the `choose_move` function and use it as the decider for the Bot agent. The Bot
 also handles managing the GameState limited to its current knowledge of the board.
+
+Bot files may also provide a `choose_many` function, which takes a list of
+gamestates and returns a list of choices. It is used by `choose_many` in this
+module to decide for several battles with a single call.
 """
 
 import importlib
+import time
 import lib.gamestate
 
 
@@ -24,9 +29,11 @@ class Bot():
         self.name = name
         self.gamestate = None
         self.gen = gen
+        self.bot_type = bot_type
         self.new_gamestate()
         bot_module = importlib.import_module('.%s' % bot_type, package='ai.%s' % gen)
         self._choose = bot_module.choose_move
+        self._choose_many = getattr(bot_module, 'choose_many', None)
 
     def read(self, line):
         """ Reads different messages from the server and parses information.
@@ -39,17 +46,71 @@ class Bot():
 
     def choose(self):
         """  Wrapper for the internal _choose function and formats the `choice`
-        dict returned by it to a message usable in Pokemon-Showdown.
+        dict returned by it to a message usable in Pokemon-Showdown. This
+        marks the pending request of the gamestate as answered.
 
         Returns:
             str: a string declaring the move chosen by the bot in the format wanted by the Pokemon-Shodwon protocol
         """
         choice = self._choose(self.gamestate)
-        if 'modifier' in choice:
-            return f'{choice["type"]} {choice["id"]} {choice["modifier"]}'
-        return f'{choice["type"]} {choice["id"]}'
+        self.gamestate.request_pending = False
+        return format_choice(choice)
 
     def new_gamestate(self):
         """ Creates a new GameState with relevant parameters that makes it
         specific to this agent. """
         self.gamestate = lib.gamestate.GameState(self.gen, self.name)
+
+
+def format_choice(choice: dict) -> str:
+    """ Formats a `choice` dict returned by a bot file to a message usable in
+    Pokemon-Showdown.
+
+    Args:
+        choice (dict): dict with the `type`, `id` and optionally `modifier` of the choice
+
+    Returns:
+        str: the choice in the format wanted by the Pokemon-Showdown protocol
+    """
+    if 'modifier' in choice:
+        return f'{choice["type"]} {choice["id"]} {choice["modifier"]}'
+    return f'{choice["type"]} {choice["id"]}'
+
+
+def choose_many(bots: list, timings: list = None) -> list:
+    """ Makes a choice for each of the given bots. The gamestates of bots that
+    share a bot type are passed to the `choose_many` function of that bot file
+    in one call, and bot files that don't export it fall back to calling
+    `Bot.choose` one bot at a time.
+
+    Args:
+        bots (list): the Bots to make a choice for
+        timings (list): optional list to append the wall time in seconds of
+            every call to a bot file to, along with the indices of the bots
+            decided for in that call
+
+    Returns:
+        list: the choice of each bot in the same format as `Bot.choose`
+    """
+    choices = [None] * len(bots)
+    groups = dict()
+    for i, bot in enumerate(bots):
+        groups.setdefault((bot.gen, bot.bot_type), []).append(i)
+
+    for idxs in groups.values():
+        choose = bots[idxs[0]]._choose_many
+        if choose is None or len(idxs) == 1:
+            for i in idxs:
+                start = time.perf_counter()
+                choices[i] = bots[i].choose()
+                if timings is not None:
+                    timings.append((time.perf_counter() - start, [i]))
+            continue
+        start = time.perf_counter()
+        batch = choose([bots[i].gamestate for i in idxs])
+        if timings is not None:
+            timings.append((time.perf_counter() - start, idxs))
+        for i, choice in zip(idxs, batch):
+            bots[i].gamestate.request_pending = False
+            choices[i] = format_choice(choice)
+    return choices
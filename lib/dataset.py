@@ -0,0 +1,390 @@
+"""
+This module turns the replays scraped into the `replays` table of
+`data/data.db` by `replay_scraper.py` into training data.
+
+Every replay log is parsed through `iter_states` from the perspective of
+each player, and one row is emitted for every decision a player is seen making,
+which is either the move or the switch they chose at the start of a turn, or
+the pokemon they sent in after their active pokemon fainted. A row holds the
+normalized gamestate as returned by `lib.normalizer.normalize` right before
+the decision, the decision itself, and the result of the battle for that
+player:
+
+    {"replay": ..., "player": ..., "turn": ..., "action": ..., "result": ..., "features": {...}}
+
+where `action` is like ``move thunderbolt`` or ``switch starmie`` and
+`result` is 1 for a win, -1 for a loss and 0 for a tie or an unfinished
+battle.
+
+The replays are split into shards by their rowid, and the shards are built
+in parallel by a pool of worker processes, each writing one gzip compressed
+json lines file per shard, or one shard of a `lib.trajectory` store holding
+the same decisions as arrays, with the features of `normalize_array`. A
+shard is written to a temporary file that is only renamed into place once
+it is complete, so an interrupted run can be resumed by running it again,
+which skips the shards that already exist.
+"""
+
+import gzip
+import io
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import time
+import numpy as np
+import lib.normalizer
+import lib.serialize
+import lib.trajectory
+from lib.gamestate import GameState
+from lib.protocol import tokenize, read_details, standardize_string
+
+LOGGER = logging.getLogger("pokemon-ai.dataset")
+
+
+def _action(action: str, args: list) -> str:
+    """ Returns the decision made by a `|move|` or `|switch|` line, like ``move thunderbolt``. """
+    if action == 'move':
+        return f'move {standardize_string(args[1])}'
+    (name, _) = read_details(args[1])
+    return f'switch {standardize_string(name)}'
+
+
+def _lines(log):
+    """ Yields the lines of a log given either as a string or as an iterable of lines. """
+    if isinstance(log, str):
+        log = io.StringIO(log)
+    for line in log:
+        if line.startswith('|'):
+            yield line
+
+
+def _decision_point(gamestate: GameState, side: str, action: str, args: list, pending, fainted: bool):
+    """
+    Follows the decisions of a player through a line of the log, before the
+    line is parsed into the gamestate.
+
+    Args:
+        gamestate (lib.gamestate.GameState): The gamestate of the player.
+        side (str): The number of the player like ``1`` for p1.
+        action (str): The action of the line.
+        args (list): The arguments of the line.
+        pending (lib.gamestate.GameState): The clone of the latest decision point still waiting for its decision, if any.
+        fainted (bool): Whether the active pokemon of the player fainted since its last decision.
+
+    Returns:
+        (tuple, lib.gamestate.GameState, bool):
+            The decision point that got its decision as a (gamestate, decision)
+            pair, or None if there is none, followed by the new `pending` and
+            `fainted`.
+    """
+    if not args or args[0][1:2] != side:
+        return None, pending, fainted
+    if action in ('move', 'switch'):
+        if action == 'switch' and pending is None and fainted:
+            # The replacement of a fainted pokemon is chosen outside of the turn order
+            pending = gamestate.clone()
+        done = (pending, _action(action, args)) if pending is not None else None
+        return done, None, False
+    if action == 'faint':
+        # A pokemon that fainted before acting never gets to make the decision of the turn
+        done = (pending, None) if pending is not None else None
+        return done, None, True
+    return None, pending, fainted
+
+
+def iter_states(log, perspective: int, gen: str = None, snapshot: bool = False):
+    """
+    Parses a battle log one line at a time and yields the gamestate of a
+    player at every decision point, which is the start of every turn and
+    the moment a replacement has to be sent in for a fainted pokemon, along
+    with the decision the player was seen making next.
+
+    Only the gamestate of the latest decision point is kept around until its
+    decision shows up, so the log is never held in memory as a whole when it
+    is given as a file or another iterable of lines.
+
+    The gamestates are copy-on-write clones, which are cheap to take and to
+    normalize but share their unchanged players, pokemon and moves with the
+    parsed gamestate. A clone can be kept and changed through the methods of
+    GameState, like `parse` or `apply_damage`, without affecting anything
+    else, but writing to its players, pokemon or moves directly also changes
+    the ones they are shared with. Pass `snapshot` to get immutable encoded
+    snapshots instead.
+
+    Args:
+        log: The protocol log as a string, or an iterable of its lines like an open file.
+        perspective (int): Index of the player whose gamestate is yielded, where p1 is 0.
+        gen (str): Generation of the battle like ``gen1``, read from the `|gen|` line if not given.
+        snapshot (bool): Whether to yield each gamestate encoded with `lib.serialize.dumps` rather than as a clone.
+
+    Yields:
+        (lib.gamestate.GameState, str):
+            The gamestate right before the decision, as a clone or as the
+            bytes of a snapshot that `lib.serialize.loads` decodes, and the
+            decision like ``move thunderbolt`` or ``switch starmie``, or None
+            if the player wasn't seen making one before the next decision
+            point.
+    """
+    gamestate = GameState(gen or 'gen1', None)
+    gamestate.player_idx = perspective
+    side = str(perspective + 1)
+    pending = None
+    fainted = False
+    for line in _lines(log):
+        action, args = tokenize(line)
+        if action == 'gen' and gen is None:
+            gamestate.gen = f'gen{args[0]}'
+        done, pending, fainted = _decision_point(gamestate, side, action, args, pending, fainted)
+        if done is not None:
+            yield (lib.serialize.dumps(done[0]) if snapshot else done[0]), done[1]
+
+        gamestate.parse(line)
+
+        if action == 'turn':
+            if pending is not None:
+                yield (lib.serialize.dumps(pending) if snapshot else pending), None
+            pending = gamestate.clone()
+    if pending is not None:
+        yield (lib.serialize.dumps(pending) if snapshot else pending), None
+
+
+def _decisions(gen: str, log: str, perspective: int) -> list:
+    """
+    Returns the decisions a player was seen making within a replay as
+    (turn, features, action) tuples.
+    """
+    decisions = []
+    for gamestate, action in iter_states(log, perspective, gen):
+        players = gamestate.players
+        if action and players[perspective].get_active() and players[perspective ^ 1].get_active():
+            decisions.append((gamestate.turn, lib.normalizer.normalize(gamestate, perspective), action))
+    return decisions
+
+
+def _results(log) -> dict:
+    """ Returns the result of a replay for each of its players, keyed by the index of the player. """
+    players = {}
+    winner = None
+    for line in _lines(log):
+        action, args = tokenize(line)
+        if action == 'player' and len(args) > 1 and args[1]:
+            players[args[1]] = int(args[0][1]) - 1
+        elif action == 'win':
+            winner = players.get(args[0].strip())
+
+    results = {}
+    for perspective in players.values():
+        if winner is None:
+            results[perspective] = 0
+        else:
+            results[perspective] = 1 if winner == perspective else -1
+    return results
+
+
+def replay_rows(name: str, gameformat: str, log: str) -> list:
+    """
+    Returns the rows of every decision made by either player within a replay.
+
+    Args:
+        name (str): Name of the replay like ``/gen1randombattle-12345``.
+        gameformat (str): Format of the replay like ``gen1randombattle``.
+        log (str): The protocol log of the replay.
+
+    Returns:
+        list: The rows as described in the module documentation.
+    """
+    rows = []
+    for perspective, result in sorted(_results(log).items()):
+        for turn, features, action in _decisions(gameformat[:4], log, perspective):
+            rows.append({"replay": name, "player": perspective, "turn": turn, "action": action,
+                         "result": result, "features": features})
+    return rows
+
+
+def _action_id(gamestate, perspective: int, action: str) -> int:
+    """
+    Returns the action of `lib.trajectory` of a decision like ``move thunderbolt``,
+    where moves and pokemon not seen before take the next free slot.
+    """
+    kind, name = action.split(' ', 1)
+    player = gamestate.players[perspective]
+    if kind == 'move':
+        names = list(player.get_active().moves)
+        slot = names.index(name) if name in names else len(names)
+        return slot if slot < lib.trajectory.N_MOVES else -1
+    names = list(player.team)
+    slot = names.index(name) if name in names else len(names)
+    return lib.trajectory.N_MOVES + slot if slot < lib.trajectory.N_SWITCHES else -1
+
+
+def replay_columns(name: str, gameformat: str, log: str) -> dict:
+    """
+    Returns the decisions made by either player within a replay as the
+    columns of a `lib.trajectory` shard. Since a replay only shows what both
+    players could see, the legal actions are the ones allowed by the moves
+    and pokemon revealed so far, along with the action that was taken.
+
+    Args:
+        name (str): Name of the replay like ``/gen1randombattle-12345``.
+        gameformat (str): Format of the replay like ``gen1randombattle``.
+        log (str): The protocol log of the replay.
+
+    Returns:
+        dict: An array for each of `lib.trajectory.COLUMNS`.
+    """
+    results = _results(log)
+    states, players, turns, actions, masks = [], [], [], [], []
+    for perspective in sorted(results):
+        for gamestate, action in iter_states(log, perspective, gameformat[:4]):
+            if not action or not all(player.get_active() for player in gamestate.players[:2]):
+                continue
+            action_id = _action_id(gamestate, perspective, action)
+            mask = lib.trajectory.legal_mask(gamestate, perspective, secret=False)
+            if action_id >= 0:
+                mask[action_id] = True
+            states.append(gamestate)
+            players.append(perspective)
+            turns.append(gamestate.turn)
+            actions.append(action_id)
+            masks.append(mask)
+
+    features = lib.normalizer.normalize_batch(states, players)
+    return {"features": features,
+            "action": np.array(actions, dtype=np.int8),
+            "mask": np.array(masks, dtype=np.bool_).reshape(-1, lib.trajectory.N_ACTIONS),
+            "reward": np.array([results[player] for player in players], dtype=np.float32),
+            "battle": np.full(len(states), lib.trajectory.battle_id(name), dtype=np.int64),
+            "player": np.array(players, dtype=np.int8),
+            "turn": np.array(turns, dtype=np.int32)}
+
+
+def _parse_replays(cursor, gameformat: str, parse, counts: dict):
+    """
+    Yields what `parse` returns for each replay of a query, skipping the
+    replays it fails on. The number of replays read and of replays skipped
+    are added to the ``replays`` and ``failed`` entries of `counts`.
+    """
+    for name, log in cursor:
+        if isinstance(log, bytes):
+            log = log.decode('utf8', 'replace')
+        counts["replays"] += 1
+        try:
+            parsed = parse(name, gameformat, log)
+        except Exception as error:
+            LOGGER.warning("Skipping replay %s: %r", name, error)
+            counts["failed"] += 1
+            continue
+        yield parsed
+
+
+def _write_jsonl(path: str, replays) -> int:
+    """ Writes the rows of every replay as a gzip compressed json lines shard and returns the number of rows. """
+    rows = 0
+    with gzip.open(path + '.tmp', 'wt', encoding='utf8') as shard_file:
+        for replay in replays:
+            for row in replay:
+                shard_file.write(json.dumps(row))
+                shard_file.write('\n')
+            rows += len(replay)
+    os.replace(path + '.tmp', path)
+    return rows
+
+
+def _write_trajectory(path: str, name: str, replays) -> int:
+    """ Writes the columns of every replay as one shard of a trajectory store and returns the number of rows. """
+    shards = list(replays)
+    columns = {column: np.concatenate([shard[column] for shard in shards]) if shards else
+               np.empty((0,) if width is None else (0, width), dtype=dtype)
+               for column, (dtype, width) in lib.trajectory.COLUMNS.items()}
+    lib.trajectory.write_shard(os.path.dirname(path), name, columns)
+    return len(columns["action"])
+
+
+def _build_shard(job) -> (str, int, int, int):
+    """
+    Builds one shard of the dataset in a worker process, out of the replays
+    of the given format whose rowid is within [start, stop).
+    """
+    db_path, gameformat, start, stop, path, kind = job
+    counts = {"replays": 0, "failed": 0}
+    connection = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        cursor = connection.execute(
+            'SELECT name, log FROM replays WHERE gameformat = ? AND rowid >= ? AND rowid < ? ORDER BY rowid',
+            (gameformat, start, stop))
+        if kind == 'trajectory':
+            rows = _write_trajectory(path, f'{start:012d}', _parse_replays(cursor, gameformat, replay_columns, counts))
+        else:
+            rows = _write_jsonl(path, _parse_replays(cursor, gameformat, replay_rows, counts))
+    finally:
+        connection.close()
+    return path, counts["replays"], rows, counts["failed"]
+
+
+def build(db_path: str, gameformat: str, output_dir: str, workers: int = 1, shard_size: int = 1000,
+          kind: str = 'jsonl') -> dict:
+    """
+    Builds the dataset of every replay of a format in the replay database,
+    spreading the shards over `workers` processes. Shards that were already
+    written by an earlier run are skipped.
+
+    Args:
+        db_path (str): Path of the sqlite database filled by `replay_scraper.py`.
+        gameformat (str): Format of the replays to use like ``gen1randombattle``.
+        output_dir (str): Directory the shards are written to, within a directory named after the format.
+        workers (int): Number of worker processes.
+        shard_size (int): Range of rowids covered by each shard.
+        kind (str):
+            Either ``jsonl`` to write gzip compressed json lines, or
+            ``trajectory`` to write the shards of a `lib.trajectory` store.
+
+    Returns:
+        dict: The number of shards, replays, rows and failed replays that were built, and the time it took.
+    """
+    shard_dir = os.path.join(output_dir, gameformat)
+    os.makedirs(shard_dir, exist_ok=True)
+
+    connection = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        blocks = [block for (block,) in connection.execute(
+            'SELECT DISTINCT rowid / ? FROM replays WHERE gameformat = ? ORDER BY 1', (shard_size, gameformat))]
+    finally:
+        connection.close()
+
+    jobs = []
+    for block in blocks:
+        start = block * shard_size
+        path = os.path.join(shard_dir, f'shard-{start:012d}.jsonl.gz' if kind == 'jsonl' else f'shard-{start:012d}')
+        if not os.path.exists(path):
+            jobs.append((db_path, gameformat, start, start + shard_size, path, kind))
+    LOGGER.info("%d of %d shards of %s left to build", len(jobs), len(blocks), gameformat)
+
+    summary = {"shards": 0, "replays": 0, "rows": 0, "failed": 0}
+    begin = time.perf_counter()
+    if jobs:
+        with multiprocessing.Pool(max(1, min(workers, len(jobs)))) as pool:
+            for path, replays, rows, failed in pool.imap_unordered(_build_shard, jobs):
+                summary["shards"] += 1
+                summary["replays"] += replays
+                summary["rows"] += rows
+                summary["failed"] += failed
+                LOGGER.info("Wrote %s: %d replays, %d rows, %d failed", path, replays, rows, failed)
+    summary["seconds"] = time.perf_counter() - begin
+    return summary
+
+
+def read(path: str):
+    """
+    Reads the rows of a shard written by `build` one at a time.
+
+    Args:
+        path (str): Path of the shard.
+
+    Yields:
+        dict: Each row in the order it was written.
+    """
+    with gzip.open(path, 'rt', encoding='utf8') as shard_file:
+        for line in shard_file:
+            yield json.loads(line)
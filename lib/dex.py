@@ -1,21 +1,216 @@
 """
-This module loads the pokemon dexes from the `pokemon-ai/data/dex` directory as
-a global variable of this module. The data files must be pre-generated with the
-`build_dexes.py` script.
+This module loads the pokemon dexes from the `pokemon-ai/data/dex` directory,
+which must be pre-generated with the `build_dex.js` script.
 
-Attributes
+The dexes are loaded lazily, one table of one generation at a time, the
+first time they are used, so that processes which only play gen1 never pay
+for parsing the other generations or tables like the learnsets. Parsing the
+json dumps is slow, so the first time a generation is loaded each of its
+tables is also written to `data/dex/cache` as a table file, and later loads
+map the table file into memory instead. A table file is rebuilt whenever the
+modification time or the size of its json file changes.
+
+A table file holds a sorted index of the names of its entries followed by
+each entry encoded with `marshal`:
+
+    header | index entries | names and records
+
+The files are mapped read-only with `mmap`, so every process using the same
+generation shares a single copy of the tables through the page cache, and
+only decodes the few entries it actually looks up.
+
+Attributes:
+    dexes (dict):
+        The dex of each generation, keyed like ``gen1``, where each dex is a
+        dict of tables like ``Pokedex`` and ``Movedex`` as dumped from
+        Showdown's `dataCache`. Both the generations and the tables are
+        loaded on first access, and the tables are read-only mappings.
 """
 
 import json
+import logging
+import marshal
+import mmap
 import os
+import struct
+from collections.abc import Mapping
+
+LOGGER = logging.getLogger("pokemon-ai.dex")
+
+DEX_DIR = os.path.join(os.path.dirname(__file__), '../data/dex')
+CACHE_DIR = os.path.join(DEX_DIR, 'cache')
+
+MAGIC = b'PKDX'
+VERSION = 2
+
+# magic, version, mtime of the json in ns, size of the json, number of entries
+_header = struct.Struct('<4sHqqI')
+# offset and length of the name, offset and length of the record
+_entry = struct.Struct('<IHII')
+
+
+def _json_path(gen: str) -> str:
+    return os.path.join(DEX_DIR, f'{gen}.json')
+
+
+def _table_path(gen: str, table: str) -> str:
+    return os.path.join(CACHE_DIR, f'{gen}.{table}.dex')
+
+
+def _json_stat(gen: str) -> (int, int):
+    """ Returns the modification time and size a table file of a generation must match to still be valid. """
+    stat = os.stat(_json_path(gen))
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _write_table(path: str, stat: (int, int), table: dict):
+    """ Writes a table file, replacing any existing one atomically. """
+    names = sorted((name.encode('utf8'), name) for name in table)
+    data_offset = _header.size + len(names) * _entry.size
+    index = bytearray()
+    data = bytearray()
+    for encoded, name in names:
+        record = marshal.dumps(table[name], 4)
+        name_offset = data_offset + len(data)
+        data += encoded
+        index += _entry.pack(name_offset, len(encoded), name_offset + len(encoded), len(record))
+        data += record
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as table_file:
+        table_file.write(_header.pack(MAGIC, VERSION, stat[0], stat[1], len(names)))
+        table_file.write(index)
+        table_file.write(data)
+    os.replace(tmp_path, path)
+
+
+class Table(Mapping):
+    """
+    A read-only mapping over a memory mapped table file, which decodes an
+    entry every time it is looked up. The index is checked against the size
+    of the file when it is mapped, so that a truncated or damaged file is
+    rejected up front instead of failing a later lookup.
+
+    Args:
+        path (str): Path of the table file.
+        stat ((int, int)): The modification time and size of the json the table file must have been built from.
+
+    Raises:
+        ValueError: If the file isn't a valid table file built from the given json.
+    """
+    def __init__(self, path: str, stat: (int, int)):
+        with open(path, 'rb') as table_file:
+            self._mm = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < _header.size:
+            raise ValueError(f'truncated table file: {path}')
+        magic, version, mtime, size, self._count = _header.unpack_from(self._mm)
+        if magic != MAGIC or version != VERSION or (mtime, size) != stat:
+            raise ValueError(f'stale table file: {path}')
+        index_end = _header.size + self._count * _entry.size
+        if index_end > len(self._mm):
+            raise ValueError(f'truncated table file: {path}')
+        # The names and records follow each other in the order of the index, up to the end of the file
+        end = index_end
+        for name_offset, name_length, record_offset, record_length in _entry.iter_unpack(self._mm[_header.size:index_end]):
+            if name_offset != end or record_offset != name_offset + name_length:
+                raise ValueError(f'corrupt table file: {path}')
+            end = record_offset + record_length
+        if end != len(self._mm):
+            raise ValueError(f'truncated table file: {path}')
+
+    def _name(self, idx: int) -> bytes:
+        name_offset, name_length, _, _ = _entry.unpack_from(self._mm, _header.size + idx * _entry.size)
+        return self._mm[name_offset:name_offset + name_length]
+
+    def _find(self, name: bytes) -> int:
+        """ Returns the index of an entry by binary search over the sorted names, or -1 if it doesn't exist. """
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name(mid) < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count and self._name(lo) == name:
+            return lo
+        return -1
+
+    def __getitem__(self, key: str):
+        idx = self._find(key.encode('utf8')) if isinstance(key, str) else -1
+        if idx < 0:
+            raise KeyError(key)
+        _, _, record_offset, record_length = _entry.unpack_from(self._mm, _header.size + idx * _entry.size)
+        return marshal.loads(self._mm[record_offset:record_offset + record_length])
+
+    def __contains__(self, key):
+        return isinstance(key, str) and self._find(key.encode('utf8')) >= 0
+
+    def __iter__(self):
+        for idx in range(self._count):
+            yield self._name(idx).decode('utf8')
+
+    def __len__(self):
+        return self._count
+
+
+class Dex(dict):
+    """
+    The dex of one generation, which maps each of its tables on first
+    access.
+
+    Args:
+        gen (str): The string representing the gen of the dex like ``gen1``.
+    """
+    def __init__(self, gen: str):
+        super().__init__()
+        self.gen = gen
+
+    def __missing__(self, table: str):
+        stat = _json_stat(self.gen)
+        try:
+            value = self[table] = Table(_table_path(self.gen, table), stat)
+            return value
+        except (OSError, ValueError, EOFError, TypeError):
+            pass
+
+        LOGGER.debug("Building the dex table files of %s", self.gen)
+        with open(_json_path(self.gen)) as dex_file:
+            data = json.load(dex_file)
+        if table not in data:
+            raise KeyError(table)
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            for name, value in data.items():
+                _write_table(_table_path(self.gen, name), stat, value)
+            value = self[table] = Table(_table_path(self.gen, table), stat)
+        except (OSError, ValueError, EOFError, TypeError) as error:
+            LOGGER.warning("Could not write the dex table files of %s: %s", self.gen, error)
+            value = self[table] = data[table]
+        return value
+
+
+class Dexes(dict):
+    """ The dexes of every generation, keyed like ``gen1`` and created on first access. """
+    def __missing__(self, gen: str):
+        if not os.path.exists(_json_path(gen)):
+            raise KeyError(gen)
+        dex = self[gen] = Dex(gen)
+        return dex
+
 
-dexes = {}
+dexes = Dexes()
 
 
-def __init__():
-    for gen in range(1, 7 + 1):
-        with open(os.path.join(os.path.dirname(__file__), f'../data/dex/gen{gen}.json')) as dex_file:
-            dexes[f'gen{gen}'] = json.load(dex_file)
+def lookup(gen: str, table: str, key: str):
+    """
+    Returns an entry of a dex table, like the movedex entry of a move.
 
+    Args:
+        gen (str): The string representing the gen of the dex like ``gen1``.
+        table (str): Name of the table like ``Movedex`` or ``Pokedex``.
+        key (str): The standardized name of the entry.
 
-__init__()
+    Raises:
+        KeyError: If the generation, the table or the entry doesn't exist.
+    """
+    return dexes[gen][table][key]
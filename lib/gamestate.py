@@ -8,21 +8,154 @@ the future generations and the doubles respectively require far more
 complication in the code than is necessary.
 """
 
-import copy
+import array
+from collections.abc import Mapping, MutableMapping, MutableSet, Set
+import itertools
 import json
-import re
 import logging
 
-import lib.dex
+import lib.ids
+import lib.templates
+from lib.protocol import tokenize, standardize_string, read_ident, read_details, read_condition
 
 LOGGER = logging.getLogger("pokemon-ai.gamestate")
 
 
+BOOSTS = ('atk', 'def', 'spa', 'spd', 'spe', 'accuracy', 'evasion')
+
+_boost_index = {name: idx for idx, name in enumerate(BOOSTS)}
+
+# Stamps are never reused within a process, so two players or pokemon with the same stamp hold the same values
+_stamps = itertools.count(1)
+_status_bits = {}
+_status_names = []
+
+
+def _status_bit(name: str) -> int:
+    """ Returns the bit of a status, assigning the next free bit to statuses not seen before. """
+    bit = _status_bits.get(name)
+    if bit is None:
+        bit = _status_bits[name] = 1 << len(_status_names)
+        _status_names.append(name)
+    return bit
+
+
+# The major statuses always take the first bits, in the order of their ids
+for _name in lib.ids.STATUSES:
+    _status_bit(_name)
+
+
+class StatusSet(MutableSet):
+    """
+    A set of status names like ``par`` or ``confusion``, stored as a single
+    integer with one bit per status. The major statuses of `lib.ids.STATUSES`
+    have the fixed bits ``1 << (status_id - 1)``, and every other status name
+    is given the next free bit the first time it is seen, so the set behaves like a regular set of
+    strings while taking up the room of one int.
+
+    Args:
+        names: Status names the set starts out with.
+
+    Attributes:
+        bits (int): The bitfield of the statuses in the set.
+    """
+    __slots__ = ('bits',)
+
+    def __init__(self, names=()):
+        self.bits = 0
+        for name in names:
+            self.bits |= _status_bit(name)
+
+    def __contains__(self, name):
+        bit = _status_bits.get(name)
+        return bit is not None and bool(self.bits & bit)
+
+    def __iter__(self):
+        bits = self.bits
+        idx = 0
+        while bits:
+            if bits & 1:
+                yield _status_names[idx]
+            bits >>= 1
+            idx += 1
+
+    def __len__(self):
+        return bin(self.bits).count('1')
+
+    def __repr__(self):
+        return f'StatusSet({sorted(self)})'
+
+    def add(self, name):
+        self.bits |= _status_bit(name)
+
+    def discard(self, name):
+        bit = _status_bits.get(name)
+        if bit is not None:
+            self.bits &= ~bit
+
+    def clear(self):
+        self.bits = 0
+
+    def copy(self):
+        new = StatusSet()
+        new.bits = self.bits
+        return new
+
+
+class Boosts(MutableMapping):
+    """
+    The stat boosts of a player, stored as a small array of signed bytes
+    indexed by BOOSTS while still being read and written like a dict such as
+    ``boosts["atk"] += 1``.
+
+    Attributes:
+        values (array.array): The boost of each stat in the order of BOOSTS.
+    """
+    __slots__ = ('values',)
+
+    def __init__(self):
+        self.values = array.array('b', bytes(len(BOOSTS)))
+
+    def __getitem__(self, name):
+        return self.values[_boost_index[name]]
+
+    def __setitem__(self, name, value):
+        self.values[_boost_index[name]] = value
+
+    def __delitem__(self, name):
+        raise TypeError("boosts can't be deleted")
+
+    def __iter__(self):
+        return iter(BOOSTS)
+
+    def __len__(self):
+        return len(BOOSTS)
+
+    def __repr__(self):
+        return f'Boosts({dict(self)})'
+
+    def clear(self):
+        for idx in range(len(BOOSTS)):
+            self.values[idx] = 0
+
+    def copy(self):
+        new = Boosts()
+        new.values[:] = self.values
+        return new
+
+
+def _template_property(field: str):
+    """ Returns a read-only property that reads the given field of the object's template. """
+    return property(lambda self: getattr(self.template, field))
+
+
 class Move:
     """
     The Move class stores all the information related to a pokemon move and
     also can find moves based on their name and fill out the rest of the
-    information.
+    information. Every attribute other than ``gen``, ``name`` and ``pp`` is
+    read from the move's template, which is shared by all the moves of the
+    same name.
 
     Args:
         gen (str): The string representing the gen of the game like ``gen1``.
@@ -30,10 +163,12 @@ class Move:
     Attributes:
         gen (str): The string representing the gen of the game like ``gen1``.
         num (int): The move number as is shown in the official Pokedex.
+        move_id (int): The id of the move from `lib.ids`, which is 0 for an unknown move.
         name (str): The standardized string name of the Pokemeon.
         category (str): One of ``Physical``, ``Special``, or ``Status``.
         target (str): One of ``normal`` or ``self``.
         type (str): The type of the move as a string. It is the capitalized full name of the type like ``Psychic``.
+        type_id (int): The id of the type of the move from `lib.ids`.
         pp (int): Current pp left of the move.
         pp_max (int): The maximum pp for the move.
         power (int): The power of the move.
@@ -53,59 +188,38 @@ class Move:
             list or an int.
         multihit_multiplier: The average multiplier of the damage dealt by the multihit of power
         priority (int): Priority of the move which determines the order these moves execute while ignoring speed.
+        flags (dict): Read-only mapping of the showdown move flags like ``contact`` to whether the move has them.
+        template (lib.templates.MoveTemplate): The static information of the move.
     """
+    __slots__ = ('gen', 'name', 'pp', 'template', '_owner')
+
     def __init__(self, gen: str):
-        # Move meta data
         self.gen = gen
-        self.num = 0
         self.name = ""
-
-        # Move attributes
-        self.category = ""  # Physical, Special, Status
-        self.target = ""  # normal, self
-        self.type = ""
         self.pp = 0
-        self.pp_max = 0
-        self.power = 100
-        self.accuracy = 1
-        self.critratio = 1
-        self.status = ""
-        self.volatile_status = ""
-        self.status_chance = ""
-        self.drain = 0
-        self.recoil = 0
-        self.heal = 0
-
-        # TODO
-
-        self.multihit = 0
-        self.multihit_multiplier = 0
-        self.priority = 0
-
-        # Move flags
-        self.flags = {
-            "authentic": False,
-            "bite": False,
-            "bullet": False,
-            "charge": False,
-            "contact": False,
-            "dance": False,
-            "defrost": False,
-            "distance": False,
-            "gravity": False,
-            "heal": False,
-            "mirror": False,
-            "mystery": False,
-            "nonsky": False,
-            "powder": False,
-            "protect": False,
-            "pulse": False,
-            "punch": False,
-            "recharge": False,
-            "reflectable": False,
-            "snatch": False,
-            "sound": False,
-        }
+        self.template = lib.templates.DEFAULT_MOVE
+        self._owner = None
+
+    num = _template_property('num')
+    move_id = _template_property('id')
+    category = _template_property('category')  # Physical, Special, Status
+    target = _template_property('target')  # normal, self
+    type = _template_property('type')
+    type_id = _template_property('type_id')
+    pp_max = _template_property('pp_max')
+    power = _template_property('power')
+    accuracy = _template_property('accuracy')
+    critratio = _template_property('critratio')
+    status = _template_property('status')
+    volatile_status = _template_property('volatile_status')
+    status_chance = _template_property('status_chance')
+    drain = _template_property('drain')
+    recoil = _template_property('recoil')
+    heal = _template_property('heal')
+    multihit = _template_property('multihit')
+    multihit_multiplier = _template_property('multihit_multiplier')
+    priority = _template_property('priority')
+    flags = _template_property('flags')
 
     def find_move(self, guess=False):
         """
@@ -114,99 +228,58 @@ class Move:
         paramter currently does is fill in the pp stat with the pp_max since
         that is the only "unknown" part of the move.
         """
-        move = lib.dex.dexes[self.gen]["Movedex"][standardize_string(self.name)]
-        self.category = move["category"]
-        self.num = move["num"]
-        self.power = move["basePower"]
-        self.pp_max = move["pp"]
-        self.target = move["target"]
-        self.type = move["type"]
-
-        if "critRatio" in move:
-            critmults = []
-
-            gen = int(self.gen[3])
-            if gen <= 5:
-                critmults = [0, 16, 8, 4, 3, 2]
-            elif gen == 6:
-                critmults = [0, 16, 8, 2, 1]
-            elif gen > 6:
-                critmults = [0, 24, 8, 2, 1]
-            self.critratio = 1/critmults[move["critRatio"]]
-
-        if "willCrit" in move:
-            self.critratio = 1
-
-        if "status" in move:
-            self.status = move["status"]
-            self.status_chance = 1
-
-        if "recoil" in move:
-            # Pokemon showdown provides recoil as a fraction
-            self.recoil = move["recoil"][0] / move["recoil"][1]
-
-        if "heal" in move:
-            # Pokemon showdown provides heal as a fraction
-            if int(self.gen[3]) >= 5:
-                self.heal = move["heal"][0] / move["heal"][1]
-            else:
-                self.heal = 1/2
-
-        if "drain" in move:
-            # Pokemon showdown provides heal as a fraction
-            self.drain = move["drain"][0] / move["drain"][1]
-
-        if "multihit" in move:
-            # Multihit is sometimes represented as a range, in which case it is written in a list.
-            # It is otherwise written as a whole number, which then does not have probability concerns.
-            # Thankfully, the only case where multihit is a range is between 2~5, where there is a
-            # 1/3 probability for 2 or 3 hits and 1/6 probability for 4 or 5 hits. Therefore, this
-            # code only contains an exception for that case
-            if type(move["multihit"]) == list:
-                self.multihit = [2, 5]
-                self.multihit_multiplier = 4/6 + 6/6 + 4/6 + 5/6
-            else:
-                self.multihit = move["multihit"]
-                self.multihit_multiplier = move["multihit"]
-
-        if "secondary" in move:
-            if move["secondary"] and "status" in move["secondary"]:
-                if "status" in move["secondary"]:
-                    self.status = move["secondary"]["status"]
-                if "volatileStatus" in move["secondary"]:
-                    self.volatile_status = move["secondary"]["volatileStatus"]
-
-                self.status_chance = move["secondary"]["chance"] / 100
-
-        if "secondaries" in move:
-            # Since the first secondary is generally far more important, for now we will only store the first.
-            if move["secondaries"][0] and "status" in move["secondaries"][0]:
-                self.status = move["secondaries"][0]["status"]
-                self.status_chance = move["secondaries"][0]["chance"] / 100
-
-        if "flag" in move:
-            for flag in move["flags"]:
-                self.flags[flag] = True
-
-        if isinstance(move["accuracy"], int):
-            self.accuracy = move["accuracy"] / 100
-        if isinstance(move["accuracy"], bool):
-            self.accuracy = 1
-
+        self.template = lib.templates.move_template(self.gen, standardize_string(self.name))
         if guess:
-            self.pp = move["pp"]
+            self.pp = self.template.pp_max
+
+    def _fork(self, owner):
+        new = Move.__new__(Move)
+        new.gen = self.gen
+        new.name = self.name
+        new.pp = self.pp
+        new.template = self.template
+        new._owner = owner
+        return new
+
+    def clone(self):
+        """ Returns a copy of the move that can be changed without affecting this one. """
+        return self._fork(None)
+
+    def to_dict(self) -> dict:
+        """ Returns the move as a dict of plain, json serializable values. """
+        data = _plain(self.template)
+        data.update(gen=self.gen, name=self.name, pp=self.pp)
+        return data
 
 
 class Pokemon:
     """
     The Pokemon class stores all the information related to the pokemon and
     provides various functions that can help bots by accessing relevant
-    information from the Pokedex from the Pokemon-Showdown project.
+    information from the Pokedex from the Pokemon-Showdown project. The
+    pokedex number and the types are read from the species template, which is
+    shared by all the pokemon of the same species, along with their ids from
+    `lib.ids` as ``species_id`` and ``type_ids``, and the statuses are kept in
+    a StatusSet.
+
+    The ``stamp`` of a pokemon is replaced by a new one every time a
+    gamestate changes the pokemon or its moves, so that values computed from
+    a pokemon, like its normalized features, can be kept for as long as its
+    stamp stays the same.
     """
+    __slots__ = ('gen', 'player_idx', 'template', 'name', 'faint', 'level', 'maxhp', 'hp_percent', 'base_atk',
+                 'base_def', 'base_spa', 'base_spd', 'base_spe', 'mustrecharge', 'ability', 'item', 'moves',
+                 '_status', 'transformed_as', 'stamp', '_owner')
+
+    # Keys of `to_dict` in the order they are written
+    FIELDS = ('gen', 'player_idx', 'num', 'name', 'faint', 'level', 'maxhp', 'hp_percent', 'base_atk', 'base_def',
+              'base_spa', 'base_spd', 'base_spe', 'mustrecharge', 'ability', 'item', 'moves', 'status', 'types',
+              'transformed_as')
+
     def __init__(self, gen, player_idx=None):
         self.gen = gen
         self.player_idx = player_idx
-        self.num = 0
+        self.template = lib.templates.DEFAULT_SPECIES
         self.name = ""
         self.faint = False
         self.level = 0
@@ -223,9 +296,10 @@ class Pokemon:
         self.ability = ""
         self.item = ""
         self.moves = dict()
-        self.status = set()
-        self.types = []
+        self._status = StatusSet()
         self.transformed_as = None  # Is a Pokemon instance if the pokemon is transformed
+        self.stamp = next(_stamps)
+        self._owner = None
 
     def find_pokemon(self, guess=False):
         """
@@ -237,18 +311,47 @@ class Pokemon:
         Args:
             guess (bool): whether to guess the aforementioned pokemon stats.
         """
-        pokemon = lib.dex.dexes[self.gen]["Pokedex"][standardize_string(self.name)]
-        self.num = pokemon["num"]
-        self.types = pokemon["types"]
+        species = lib.templates.species_template(self.gen, standardize_string(self.name))
+        self.template = species
         if guess:
             # Assumes max EVs and max IVs
             # Presumably, it should make the bot play more safe
-            self.maxhp = (2 * pokemon["baseStats"]["hp"] + 30 + 63) * self.level / 100 + self.level + 10
-            self.base_def = ((2 * pokemon["baseStats"]["def"] + 30 + 63) * self.level / 100 + 5)
-            self.base_atk = ((2 * pokemon["baseStats"]["atk"] + 30 + 63) * self.level / 100 + 5)
-            self.base_spa = ((2 * pokemon["baseStats"]["spa"] + 30 + 63) * self.level / 100 + 5)
-            self.base_spd = ((2 * pokemon["baseStats"]["spd"] + 30 + 63) * self.level / 100 + 5)
-            self.base_spe = ((2 * pokemon["baseStats"]["spe"] + 30 + 63) * self.level / 100 + 5)
+            self.maxhp = (2 * species.base_hp + 30 + 63) * self.level / 100 + self.level + 10
+            self.base_def = ((2 * species.base_def + 30 + 63) * self.level / 100 + 5)
+            self.base_atk = ((2 * species.base_atk + 30 + 63) * self.level / 100 + 5)
+            self.base_spa = ((2 * species.base_spa + 30 + 63) * self.level / 100 + 5)
+            self.base_spd = ((2 * species.base_spd + 30 + 63) * self.level / 100 + 5)
+            self.base_spe = ((2 * species.base_spe + 30 + 63) * self.level / 100 + 5)
+
+    num = _template_property('num')
+    species_id = _template_property('id')
+    types = _template_property('types')
+    type_ids = _template_property('type_ids')
+
+    def _fork(self, owner):
+        """ Returns a copy of the pokemon owned by `owner`, which still shares its moves with this one. """
+        new = Pokemon.__new__(Pokemon)
+        for slot in Pokemon.__slots__:
+            setattr(new, slot, getattr(self, slot))
+        new.moves = dict(self.moves)
+        new._status = self._status.copy()
+        new._owner = owner
+        return new
+
+    def clone(self):
+        """ Returns a copy of the pokemon that can be changed without affecting this one. """
+        new = self._fork(None)
+        new.moves = {name: move.clone() for name, move in self.moves.items()}
+        new.stamp = next(_stamps)
+        return new
+
+    @property
+    def status(self) -> StatusSet:
+        return self._status
+
+    @status.setter
+    def status(self, names):
+        self._status = names if type(names) is StatusSet else StatusSet(names)
 
     def is_mustrecharge(self, turn):
         return turn + 2 < self.mustrecharge
@@ -294,18 +397,51 @@ class Pokemon:
     def is_leech_seeded(self):
         return False  # TODO
 
+    def to_dict(self) -> dict:
+        """ Returns the pokemon as a dict of plain, json serializable values. """
+        return {key: _plain(getattr(self, key)) for key in self.FIELDS}
+
 
 class Player:
+    """
+    The Player class stores the side of one player, which is the team as seen
+    by everyone, the secret team as sent in requests, and the boosts and
+    volatile statuses of the active pokemon.
+
+    Like the one of a pokemon, the ``stamp`` of a player is replaced every
+    time a gamestate changes the player itself, which is its active pokemon,
+    its boosts, its statuses or which pokemon are on its teams, but not when
+    only one of its pokemon changes.
+    """
+    __slots__ = ('active', 'boosts', 'volatile_status', 'team', 'secret', 'is_player', '_status', 'stamp', '_owner')
+
+    # Keys of `to_dict` in the order they are written
+    FIELDS = ('active', 'boosts', 'volatile_status', 'team', 'secret', 'is_player', 'status')
+
     def __init__(self):
         self.active = ""
-        self.boosts = dict()
-        self.volatile_status = set()
+        self.boosts = Boosts()
+        self.volatile_status = StatusSet()
+        self._status = StatusSet()
+        self.stamp = next(_stamps)
+        self._owner = None
         self.team = dict()
         self.secret = dict()
         self.is_player = False
 
-        self.reset_boost()
-        self.reset_status()
+    def _fork(self, owner):
+        """ Returns a copy of the player owned by `owner`, which still shares its pokemon with this one. """
+        new = Player.__new__(Player)
+        new.active = self.active
+        new.boosts = self.boosts.copy()
+        new.volatile_status = self.volatile_status.copy()
+        new.team = dict(self.team)
+        new.secret = dict(self.secret)
+        new.is_player = self.is_player
+        new._status = self._status.copy()
+        new.stamp = self.stamp
+        new._owner = owner
+        return new
 
     def get_active(self, secret=False):
         if secret and self.active in self.team:
@@ -314,18 +450,23 @@ class Player:
             return self.team[self.active]
         return None
 
+    @property
+    def status(self) -> StatusSet:
+        return self._status
+
+    @status.setter
+    def status(self, names):
+        self._status = names if type(names) is StatusSet else StatusSet(names)
+
     def reset_boost(self):
-        self.boosts = {
-            "atk": 0,
-            "def": 0,
-            "spa": 0,
-            "spd": 0,
-            "spe": 0,
-            "accuracy": 0,
-        }
+        self.boosts.clear()
 
     def reset_status(self):
-        self.status = set()
+        self._status.clear()
+
+    def to_dict(self) -> dict:
+        """ Returns the player as a dict of plain, json serializable values. """
+        return {key: _plain(getattr(self, key)) for key in self.FIELDS}
 
 
 class GameState:
@@ -348,12 +489,19 @@ class GameState:
             In-game name of the player or bot, used to match the player to this
             class's internal representation
         turn (int): Turn number of the game
+        request_pending (bool):
+            Whether a `|request|` has been received that the owner of this
+            gamestate hasn't made a choice for yet.
         move_history: TODO
         players (list): TODO
     """
+    __slots__ = ('gametype', 'gen', 'tier', 'player_idx', 'player_name', '_player_list', 'rated', 'result',
+                 'inactive', 'wait', 'started', 'force_switch', 'request_pending', '_player_map', 'players', 'turn',
+                 'upkeep', 'move_history', '_token', '_undo')
+
     def __init__(self, gen, name: str):
-        self._sim_args_table = {}
-        self._set_sim_table()
+        # Players, pokemon and moves owned by this token are changed in place, and copied first otherwise
+        self._token = object()
 
         # game meta data
         self.gametype = ""  # Stores gametype like "singles" or "doubles"
@@ -371,6 +519,7 @@ class GameState:
         self.wait = False
         self.started = False
         self.force_switch = False
+        self.request_pending = False  # Whether the last request still needs a choice
 
         # _player_map{name} => player idx related to that player's name
         # like "[Gen 1] Random Battle"
@@ -381,11 +530,19 @@ class GameState:
         self.upkeep = False
 
         self.move_history = []
+        self._undo = []  # Changes made by the apply_* methods, as (restore function, arguments) pairs
 
         for i in range(0, 4):
-            self.players.append(Player())
+            player = Player()
+            player._owner = self._token
+            self.players.append(player)
 
-    def __dict__(self):
+    def to_dict(self) -> dict:
+        """
+        Returns the gamestate as a dict of plain, json serializable values,
+        where sets are turned into sorted lists and the players, pokemon and
+        moves into dicts of their own.
+        """
         data = {
             "gametype": self.gametype,
             "gen": self.gen,
@@ -395,87 +552,135 @@ class GameState:
             "inactive": self.inactive,
             "started": self.started,
             "force_switch": self.force_switch,
-            "players": self.players,
+            "players": [player.to_dict() for player in self.players],
             "turn": self.turn,
             "upkeep": self.upkeep,
-            "move_history": self.move_history,
+            "move_history": _plain(self.move_history),
             "player_idx": self.player_idx,
             "player_name": self.player_name,
         }
         return data
 
     def __str__(self):
-        data = self.__dict__()
-
-        def handle(x):
-            if isinstance(x, set):
-                return list(x)
-            return x.__dict__
-
-        return json.dumps(data,
-                          default=handle,
+        return json.dumps(self.to_dict(),
                           skipkeys=True,
                           indent=4)
 
+    def clone(self):
+        """
+        Returns a copy-on-write copy of the gamestate, which can be changed
+        by parsing lines or through the `apply_*` methods just like this
+        gamestate without either of them affecting the other. The copy starts
+        out with an empty undo stack.
+
+        The copy shares its players, pokemon and moves with this gamestate.
+        Whenever either gamestate is about to change one of those, it first
+        replaces it with a copy of its own, so cloning costs the same no
+        matter how much of the battle has been seen, and only the parts that
+        are actually changed get copied.
+        """
+        new = GameState.__new__(GameState)
+        for slot in GameState.__slots__:
+            setattr(new, slot, getattr(self, slot))
+        new._player_list = list(self._player_list)
+        new._player_map = dict(self._player_map)
+        new.players = list(self.players)
+        new.move_history = list(self.move_history)
+        new._undo = []
+
+        # Neither gamestate owns the shared objects anymore, so both copy them before changing them
+        new._token = object()
+        self._token = object()
+        return new
+
+    def _own_player(self, player_idx: int) -> Player:
+        """ Returns the player of the given index, copying it first if it is shared with another gamestate. """
+        player = self.players[player_idx]
+        if player._owner is not self._token:
+            player = self.players[player_idx] = player._fork(self._token)
+        return player
+
+    def _mut_player(self, player_idx: int) -> Player:
+        """ Returns the player of the given index like `_own_player`, with a new stamp since it is about to change. """
+        player = self._own_player(player_idx)
+        player.stamp = next(_stamps)
+        return player
+
+    def _mut_pokemon(self, player_idx: int, name: str, secret: bool = False) -> Pokemon:
+        """
+        Returns a pokemon of a player, copying it first if it is shared with
+        another gamestate, and gives it a new stamp since it is about to change.
+        """
+        player = self._own_player(player_idx)
+        team = player.secret if secret else player.team
+        pokemon = team[name]
+        if pokemon._owner is not self._token:
+            pokemon = team[name] = pokemon._fork(self._token)
+        pokemon.stamp = next(_stamps)
+        return pokemon
+
+    def _mut_active(self, player_idx: int) -> Pokemon:
+        """ Returns the active pokemon of a player, copying it first if it is shared with another gamestate. """
+        return self._mut_pokemon(player_idx, self.players[player_idx].active)
+
+    def _mut_move(self, pokemon: Pokemon, move_name: str) -> Move:
+        """ Returns a move of a pokemon returned by `_mut_pokemon`, copying it first if it is shared. """
+        move = pokemon.moves[move_name]
+        if move._owner is not self._token:
+            move = pokemon.moves[move_name] = move._fork(self._token)
+        return move
+
     def _reset_boost(self, player_idx: int):
-        self.players[player_idx].reset_boost()
+        self._mut_player(player_idx).reset_boost()
 
     def _reset_status(self, player_idx: int):
-        self.players[player_idx].reset_status()
-
-    def _set_sim_table(self):
-        self._sim_args_table = {
-            'error': _error,
-            'clearpoke': self._noop,
-            'teamsize': self._noop,
-            'teampreview': self._noop,
-            'rule': self._noop,
-            'gen': self._noop,
-            '-hint': self._noop,
-            'gametype': self._set_gametype,
-            'inactive': self._set_inactive_on,
-            'inactiveoff': self._set_inactive_off,
-            'player': self._set_player,
-            'poke': self._set_team_preview,
-            'rated': self._set_rated_bool,
-            'request': self._set_request,
-            'start': self._set_start,
-            'tie': self._set_tie,
-            'tier': self._set_tier,
-            'turn': self._set_turn,
-            'upkeep': self._set_upkeep,
-            'win': self._set_win,
-
-            # Imperfect
-            '-crit': self._noop,
-            '-fail': self._noop,
-            '-immune': self._noop,
-            '-hitcount': self._noop,
-            '-miss': self._noop,
-            '-notarget': self._noop,
-            '-resisted': self._noop,
-            '-supereffective': self._noop,
-            '-prepare': self._noop,
-            'cant': self._noop,
-            '-boost': self._set_boost,
-            '-mustrecharge': self._set_mustrecharge,
-            '-cureteam': self._set_cureteam,
-            '-curestatus': self._set_curestatus,
-            '-damage': self._set_damage,
-            '-heal': self._set_damage,
-            '-sethp': self._set_hp,
-            '-start': self._set_volatile_status_start,
-            '-activate': self._set_volatile_status_start,
-            '-end': self._set_volatile_status_end,
-            '-status': self._set_status,
-            '-transform': self._set_transform,
-            '-unboost': self._set_unboost,
-            '-clearboost': self._set_clearboost,
-            '-clearallboost': self._set_clearallboost,
-            'faint': self._noimpl,
-            'move': self._set_move,
-            'switch': self._set_switch,
-        }
+        self._mut_player(player_idx).reset_status()
+
+    # The changes below are shared by the protocol handlers and the `apply_*` methods
+
+    def _switch(self, player_idx: int, name: str, level: int, hp_percent: float, faint: bool, status) -> str:
+        """ Switches in a pokemon and returns its name if it was added to the team, or None otherwise. """
+        if self.players[player_idx].get_active():
+            self._mut_active(player_idx).transformed_as = None
+
+        player = self._mut_player(player_idx)
+        player.active = name
+        player.reset_boost()
+        player.reset_status()
+
+        if name in player.team:
+            return None
+        new = Pokemon(self.gen, player_idx)
+        new._owner = self._token
+        new.name = name
+        new.level = level
+        new.hp_percent = hp_percent
+        new.faint = faint
+        new.status = status
+        new.find_pokemon(True)
+        player.team[name] = new
+        return name
+
+    def _damage(self, player_idx: int, hp_percent: float, faint: bool, status=None):
+        pokemon = self._mut_active(player_idx)
+        pokemon.hp_percent = hp_percent
+        pokemon.faint = faint
+        if status is not None:
+            pokemon.status = status
+
+    def _add_status(self, player_idx: int, status: str):
+        self._mut_active(player_idx).status.add(status)
+
+    def _boost(self, player_idx: int, stat: str, amount: int):
+        self._mut_player(player_idx).boosts[stat] += amount
+
+    def _faint(self, player_idx: int):
+        pokemon = self._mut_active(player_idx)
+        pokemon.hp_percent = 0
+        pokemon.faint = True
+
+    def _error(self, args):
+        LOGGER.error(args)
 
     def _noop(self, _):
         pass
@@ -518,12 +723,15 @@ class GameState:
             self.wait = True
         if "forceSwitch" in data:
             self.force_switch = True
+        self.request_pending = not self.wait
         if "side" in data:
             self.player_idx = int(data["side"]["id"][1]) - 1
-            self.players[self.player_idx].secret = dict()
+            player = self._mut_player(self.player_idx)
+            player.secret = dict()
             pokemons = data["side"]["pokemon"]
             for pokemon in pokemons:
                 new = Pokemon(self.gen, self.player_idx)
+                new._owner = self._token
                 (_, _, new.name) = read_ident(pokemon["ident"])
                 (_, level) = read_details(pokemon["details"])
                 (new.hp_percent, new.maxhp, new.faint, new.status) = read_condition(pokemon["condition"])
@@ -537,11 +745,12 @@ class GameState:
                 new.item = pokemon["item"]
                 for move_name in pokemon["moves"]:
                     move = Move(self.gen)
+                    move._owner = self._token
                     move.name = move_name
                     move.find_move()
                     new.moves[move_name] = move
                 new.find_pokemon(False)
-                self.players[self.player_idx].secret[standardize_string(new.name)] = new
+                player.secret[standardize_string(new.name)] = new
 
     def _set_start(self, _):
         self.started = True
@@ -550,11 +759,11 @@ class GameState:
         self.upkeep = True
 
     def _set_mustrecharge(self, args):
-        (player, idx, name) = read_ident(args[0])
+        (player, _, _) = read_ident(args[0])
         player_idx = int(player) - 1
-        self.players[player_idx].get_active().mustrecharge = self.turn
-        if idx == self.player_idx:
-            self.get_player_active().mustrecharge = self.turn
+        self._mut_active(player_idx).mustrecharge = self.turn
+        if player_idx == self.player_idx and self.players[player_idx].active in self.players[player_idx].secret:
+            self._mut_pokemon(player_idx, self.players[player_idx].active, True).mustrecharge = self.turn
 
     def _set_turn(self, args):
         self.turn = int(args[0])
@@ -571,42 +780,23 @@ class GameState:
         (name, level) = read_details(args[1])
         (hp_percent, _, faint, status) = read_condition(args[2])
         player_idx = int(player) - 1
-        name = standardize_string(name)
-
-        if self.players[player_idx].get_active():
-            self.players[player_idx].get_active().transformed_as = None
-
-        self.players[player_idx].active = name
-        self._reset_boost(player_idx)
-        self._reset_status(player_idx)
-
-        if name not in self.players[player_idx].team:
-            new = Pokemon(self.gen, player_idx)
-            new.name = name
-            new.level = level
-            new.hp_percent = hp_percent
-            new.faint = faint
-            new.status = status
-            new.find_pokemon(True)
-            self.players[player_idx].team[name] = new
+        self._switch(player_idx, standardize_string(name), level, hp_percent, faint, status)
 
     def _set_status(self, args):
         # Not sure if this and curestatus are strictly needed, but decided
         # to do it anyway for the sake of a more complete and ideally foolproof
         # system.
         player_idx = int(args[0][1]) - 1
-        pokemon = self.players[player_idx].get_active()
-        pokemon.status.add(args[1])
+        self._add_status(player_idx, args[1])
 
     def _set_cureteam(self, args):
         player_idx = int(args[0][1]) - 1
-        for pokemon in self.players[player_idx]:
-            pokemon.status = set()
+        for name in self.players[player_idx].team:
+            self._mut_pokemon(player_idx, name).status = StatusSet()
 
     def _set_curestatus(self, args):
         player_idx = int(args[0][1]) - 1
-        pokemon = self.players[player_idx].get_active()
-        pokemon.status.remove(args[1])
+        self._mut_active(player_idx).status.remove(args[1])
 
     def _set_clearboost(self, args):
         player_idx = int(args[0][1]) - 1
@@ -619,60 +809,264 @@ class GameState:
     def _set_damage(self, args):
         player_idx = int(args[0][1]) - 1
         (hp_percent, _, faint, status) = read_condition(args[1])
-        pokemon = self.players[player_idx].get_active()
-        pokemon.hp_percent = hp_percent
-        pokemon.faint = faint
-        pokemon.status = status
+        self._damage(player_idx, hp_percent, faint, status)
 
     def _set_boost(self, args):
         player_idx = int(args[0][1]) - 1
-        self.players[player_idx].boosts[args[1]] += int(args[2])
+        self._boost(player_idx, args[1], int(args[2]))
 
     def _set_unboost(self, args):
         player_idx = int(args[0][1]) - 1
-        self.players[player_idx].boosts[args[1]] -= int(args[2])
+        self._boost(player_idx, args[1], -int(args[2]))
 
     def _set_transform(self, args):
         player_idx = int(args[0][1]) - 1
         other_idx = int(args[1][1]) - 1
-        player_pokemon = self.players[player_idx].get_active()
-        other_pokemon = self.get_active(other_idx)
-        player_pokemon.transformed_as = copy.deepcopy(other_pokemon)
-        if player_idx == self.player_idx:
-            self.get_player_active().transformed_as = copy.deepcopy(other_pokemon)
+        other_pokemon = self.players[other_idx].get_active()
+        self._mut_active(player_idx).transformed_as = other_pokemon.clone()
+        if player_idx == self.player_idx and self.players[player_idx].active in self.players[player_idx].secret:
+            self._mut_pokemon(player_idx, self.players[player_idx].active, True).transformed_as = other_pokemon.clone()
+
+    def _set_faint(self, args):
+        player_idx = int(args[0][1]) - 1
+        self._faint(player_idx)
 
     def _set_hp(self, args):
         player_idx = int(args[0][1]) - 1
-        pokemon = self.players[player_idx].get_active()
         hp_percent, _, _, _ = read_condition(args[1])
-        pokemon.hp_percent = hp_percent
+        self._mut_active(player_idx).hp_percent = hp_percent
 
     def _set_move(self, args):
         player_idx = int(args[0][1]) - 1
         move_name = standardize_string(args[1])
         if move_name == 'recharge':
             return
-        pokemon = self.players[player_idx].get_active()
+        pokemon = self._mut_active(player_idx)
         if move_name not in pokemon.moves:
             move = Move(self.gen)
+            move._owner = self._token
             move.name = move_name
             move.find_move(True)
             pokemon.moves[move_name] = move
-        pokemon.moves[move_name].pp -= 1
+        self._mut_move(pokemon, move_name).pp -= 1
 
     def _set_volatile_status_start(self, args):
         player_idx = int(args[0][1]) - 1
-        self.players[player_idx].status.add(standardize_string(args[1]))
+        self._mut_player(player_idx).status.add(standardize_string(args[1]))
 
     def _set_volatile_status_end(self, args):
         player_idx = int(args[0][1]) - 1
         std_string = standardize_string(args[1])
         if std_string in self.players[player_idx].status:
-            self.players[player_idx].status.remove(standardize_string(args[1]))
+            self._mut_player(player_idx).status.remove(std_string)
+
+    def apply_damage(self, player_idx: int, hp_percent: float, faint: bool = False, status=None):
+        """
+        Sets the hp of the active pokemon of a player like a `|-damage|` or
+        `|-heal|` line would, recording the change so that `undo` can revert
+        it.
+
+        Args:
+            player_idx (int): Index of the player, where p1 is 0.
+            hp_percent (float): The new hp of the pokemon as a float between 0~1.
+            faint (bool): Whether the pokemon fainted.
+            status: The new statuses of the pokemon, or None to keep them.
+        """
+        record = self._pokemon_record(player_idx)
+        self._damage(player_idx, hp_percent, faint, status)
+        self._undo.append((GameState._restore_pokemon, record))
+
+    def apply_status(self, player_idx: int, status: str):
+        """
+        Gives the active pokemon of a player a status like a `|-status|`
+        line would, recording the change so that `undo` can revert it.
+
+        Args:
+            player_idx (int): Index of the player, where p1 is 0.
+            status (str): The status like ``par``.
+        """
+        record = self._pokemon_record(player_idx)
+        self._add_status(player_idx, status)
+        self._undo.append((GameState._restore_pokemon, record))
+
+    def apply_boost(self, player_idx: int, stat: str, amount: int):
+        """
+        Boosts a stat of a player like a `|-boost|` or `|-unboost|` line
+        would, recording the change so that `undo` can revert it.
+
+        Args:
+            player_idx (int): Index of the player, where p1 is 0.
+            stat (str): The boosted stat as listed in BOOSTS.
+            amount (int): The number of stages to add, which is negative for unboosts.
+        """
+        record = (player_idx, stat, self.players[player_idx].boosts[stat])
+        self._boost(player_idx, stat, amount)
+        self._undo.append((GameState._restore_boost, record))
+
+    def apply_switch(self, player_idx: int, name: str, level: int = 100, hp_percent: float = 1, faint: bool = False,
+                     status=()):
+        """
+        Switches in a pokemon of a player like a `|switch|` line would,
+        recording the change so that `undo` can revert it. The level, hp and
+        statuses are only used when the pokemon hasn't been seen yet.
+
+        Args:
+            player_idx (int): Index of the player, where p1 is 0.
+            name (str): The standardized name of the pokemon.
+            level (int): Level of the pokemon.
+            hp_percent (float): The hp of the pokemon as a float between 0~1.
+            faint (bool): Whether the pokemon is fainted.
+            status: The statuses of the pokemon.
+        """
+        player = self.players[player_idx]
+        active = player.get_active()
+        transformed_as = active.transformed_as if active else None
+        record = (player_idx, player.active, player.boosts.values.tobytes(), player.status.bits, transformed_as)
+        added = self._switch(player_idx, name, level, hp_percent, faint, status)
+        self._undo.append((GameState._restore_switch, record + (added,)))
+
+    def apply_faint(self, player_idx: int):
+        """
+        Faints the active pokemon of a player like a `|faint|` line would,
+        recording the change so that `undo` can revert it.
+
+        Args:
+            player_idx (int): Index of the player, where p1 is 0.
+        """
+        record = self._pokemon_record(player_idx)
+        self._faint(player_idx)
+        self._undo.append((GameState._restore_pokemon, record))
+
+    def checkpoint(self) -> int:
+        """
+        Returns the current depth of the undo stack, which can later be given
+        to `undo` to revert every change applied since.
+        """
+        return len(self._undo)
+
+    def undo(self, checkpoint: int = None):
+        """
+        Reverts changes made through the `apply_*` methods, most recent first.
+        Changes made by parsing lines are never recorded, so they should not
+        be mixed with applied changes that are going to be reverted.
+
+        Args:
+            checkpoint (int):
+                Depth of the undo stack returned by `checkpoint` to revert
+                back to. Only the most recent change is reverted if it is not
+                given.
+        """
+        if checkpoint is None:
+            checkpoint = len(self._undo) - 1
+        while len(self._undo) > checkpoint:
+            restore, record = self._undo.pop()
+            restore(self, *record)
+
+    def _pokemon_record(self, player_idx: int) -> tuple:
+        """ Returns what `_restore_pokemon` needs to restore the active pokemon of a player. """
+        name = self.players[player_idx].active
+        pokemon = self.players[player_idx].team[name]
+        return (player_idx, name, pokemon.hp_percent, pokemon.faint, pokemon.status.bits)
+
+    def _restore_pokemon(self, player_idx, name, hp_percent, faint, status_bits):
+        pokemon = self._mut_pokemon(player_idx, name)
+        pokemon.hp_percent = hp_percent
+        pokemon.faint = faint
+        pokemon.status.bits = status_bits
+
+    def _restore_boost(self, player_idx, stat, value):
+        self._mut_player(player_idx).boosts[stat] = value
+
+    def _restore_switch(self, player_idx, active, boosts, status_bits, transformed_as, added):
+        player = self._mut_player(player_idx)
+        if added is not None:
+            del player.team[added]
+        player.active = active
+        player.boosts.values[:] = array.array('b', boosts)
+        player.status.bits = status_bits
+        if active in player.team:
+            self._mut_pokemon(player_idx, active).transformed_as = transformed_as
 
     def get_boost(self, idx, name) -> int:
         return self.players[idx].boosts[name]
 
+    # Maps each protocol action to the method that handles it
+    _sim_args_table = {
+        'error': _error,
+        'clearpoke': _noop,
+        'teamsize': _noop,
+        'teampreview': _noop,
+        'rule': _noop,
+        'gen': _noop,
+        '-hint': _noop,
+
+        # Room and chat messages found in saved replays, which don't change the battle
+        'j': _noop,
+        'J': _noop,
+        'join': _noop,
+        'l': _noop,
+        'L': _noop,
+        'leave': _noop,
+        'n': _noop,
+        'N': _noop,
+        'name': _noop,
+        'c': _noop,
+        'c:': _noop,
+        'chat': _noop,
+        't:': _noop,
+        'raw': _noop,
+        'html': _noop,
+        'uhtml': _noop,
+        'title': _noop,
+        'message': _noop,
+        '-message': _noop,
+        'badge': _noop,
+
+        'gametype': _set_gametype,
+        'inactive': _set_inactive_on,
+        'inactiveoff': _set_inactive_off,
+        'player': _set_player,
+        'poke': _set_team_preview,
+        'rated': _set_rated_bool,
+        'request': _set_request,
+        'start': _set_start,
+        'tie': _set_tie,
+        'tier': _set_tier,
+        'turn': _set_turn,
+        'upkeep': _set_upkeep,
+        'win': _set_win,
+
+        # Imperfect
+        '-crit': _noop,
+        '-fail': _noop,
+        '-immune': _noop,
+        '-hitcount': _noop,
+        '-miss': _noop,
+        '-notarget': _noop,
+        '-resisted': _noop,
+        '-supereffective': _noop,
+        '-prepare': _noop,
+        'cant': _noop,
+        '-boost': _set_boost,
+        '-mustrecharge': _set_mustrecharge,
+        '-cureteam': _set_cureteam,
+        '-curestatus': _set_curestatus,
+        '-damage': _set_damage,
+        '-heal': _set_damage,
+        '-sethp': _set_hp,
+        '-start': _set_volatile_status_start,
+        '-activate': _set_volatile_status_start,
+        '-end': _set_volatile_status_end,
+        '-status': _set_status,
+        '-transform': _set_transform,
+        '-unboost': _set_unboost,
+        '-clearboost': _set_clearboost,
+        '-clearallboost': _set_clearallboost,
+        'faint': _set_faint,
+        'move': _set_move,
+        'switch': _set_switch,
+    }
+
     def parse(self, line):
         """
         Accepts line from simulator and takes appropiate action in modifying
@@ -688,73 +1082,29 @@ class GameState:
         """
         if not line:
             return
-        line = line.strip()
-        line = line[1:]
-        args = line.split('|')
-        action = args[0]
+        action, args = tokenize(line)
         if not action:
             return
-        if action in self._sim_args_table:
-            self._sim_args_table[action](args[1:])
+        handler = self._sim_args_table.get(action)
+        if handler is not None:
+            handler(self, args)
         else:
             LOGGER.error("Not Handled: %s" % action)
 
 
-def _error(args):
-    LOGGER.error(args)
-
-
-def standardize_string(string: str) -> str:
-    """
-    Standardizes a given input string such as the name of a pokemon or the
-    name of a move. The standardization consists of striping all
-    non-alphanumeric characters and making the string all lower case.
-
-    Args:
-        string (str): input name of a pokemon / move
-
-    Returns:
-        str: the standardized and sanitized string
-    """
-    return re.sub(r"[^a-zA-Z0-9]", "", string).lower()
-
-
-def read_ident(ident_string: str) -> (int, str, str):
-    """
-    Reads a string like "p1a: Magikarp" and returns the relevant data encoded
-    within that string.
-    """
-    [player, idx, name] = re.search(r"p(\d)(\w*): (.*)", ident_string).groups()
-    return int(player), idx, name
-
-
-def read_details(detail_string: str) -> (str, int):
-    """
-    Reads a string like "Magikary, L89" and returns the relevant data encoded
-    within that string.
-    """
-    [name, level] = re.search(r"([^,]+), L(\d+)", detail_string).groups()
-    return name, int(level)
-
-
-def read_condition(condition_string: str) -> (float, float, bool, set):
+def _plain(value):
     """
-    Reads a string like "100/200 slp" and returns the relevant data encoded
-    within that string.
+    Converts a value held by the gamestate classes to plain, json serializable
+    values.
     """
-    faint = False
-    hp = 0
-    maxhp = 100
-    status = []
-    if re.match(r"\d+ fnt", condition_string):
-        hp = 0
-        faint = True
-    if re.match(r"(\d+)/(\d+)( \w+)*", condition_string):
-        res = re.search(r"(\d+)/(\d+)( \w+)*", condition_string).groups()
-        hp = int(res[0]) / int(res[1])
-        maxhp = int(res[1])
-        faint = False
-        for status_condition in res[2:]:
-            if status_condition is not None:
-                status.append(status_condition.strip())
-    return hp, maxhp, faint, set(status)
+    if isinstance(value, Set):
+        return sorted(value)
+    if hasattr(value, '_asdict'):
+        return _plain(value._asdict())
+    if isinstance(value, Mapping):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    return value
@@ -0,0 +1,104 @@
+"""
+This module interns the names of species, moves, types and statuses into
+dense integer ids, so that they can be compared, stored and used to index
+arrays as small ints instead of strings.
+
+The ids of species, moves and types are given per generation in the sorted
+order of the names within the dex tables, whatever order the dex was loaded
+in, so every process using the same dex agrees on them. Id 0 is reserved
+for an unknown or missing name, like the default templates of
+`lib.templates`. Since the ids follow the dex, anything storing them is
+only valid with the dex it was built with.
+
+The major statuses are the same for every generation and have fixed ids
+in the order of STATUSES, which `lib.gamestate.StatusSet` also uses as the
+first bits of its bitfield.
+
+Attributes:
+    STATUSES (tuple): The major statuses, whose ids are their index plus one.
+"""
+
+import lib.dex
+
+STATUSES = ('brn', 'frz', 'par', 'psn', 'tox', 'slp')
+
+_status_ids = {name: idx + 1 for idx, name in enumerate(STATUSES)}
+
+# The dex table each kind of name is interned from
+_tables = {'species': 'Pokedex', 'moves': 'Movedex', 'types': 'TypeChart'}
+
+
+class IdTable:
+    """
+    The dense ids of every name of one kind within one generation.
+
+    Args:
+        names: The names in the order of their ids, starting from id 1.
+
+    Attributes:
+        names (tuple): The name of each id, where id 0 is the empty string.
+        ids (dict): The id of each name.
+    """
+    __slots__ = ('names', 'ids')
+
+    def __init__(self, names):
+        self.names = ('',) + tuple(names)
+        self.ids = {name: idx for idx, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def id(self, name: str) -> int:
+        """ Returns the id of a name, or 0 if it isn't known. """
+        return self.ids.get(name, 0)
+
+    def name(self, idx: int) -> str:
+        """
+        Returns the name of an id.
+
+        Raises:
+            IndexError: If the id is out of range.
+        """
+        return self.names[idx]
+
+
+_id_tables = {}
+
+
+def table(gen: str, kind: str) -> IdTable:
+    """
+    Returns the id table of a kind of name within a generation, building it
+    from the dex the first time it is needed.
+
+    Args:
+        gen (str): The string representing the gen of the dex like ``gen1``.
+        kind (str): One of ``species``, ``moves`` or ``types``.
+
+    Raises:
+        KeyError: If the generation or the kind doesn't exist.
+    """
+    key = (gen, kind)
+    id_table = _id_tables.get(key)
+    if id_table is None:
+        id_table = _id_tables[key] = IdTable(sorted(lib.dex.dexes[gen][_tables[kind]]))
+    return id_table
+
+
+def species_id(gen: str, name: str) -> int:
+    """ Returns the id of a standardized species name, or 0 if it isn't in the pokedex. """
+    return table(gen, 'species').id(name)
+
+
+def move_id(gen: str, name: str) -> int:
+    """ Returns the id of a standardized move name, or 0 if it isn't in the movedex. """
+    return table(gen, 'moves').id(name)
+
+
+def type_id(gen: str, name: str) -> int:
+    """ Returns the id of a type like ``Water``, or 0 if it isn't in the type chart. """
+    return table(gen, 'types').id(name)
+
+
+def status_id(name: str) -> int:
+    """ Returns the id of a major status like ``par``, or 0 if it isn't one. """
+    return _status_ids.get(name, 0)
@@ -0,0 +1,235 @@
+"""
+This module streams shuffled minibatches out of a trajectory store of
+`lib.trajectory` for training, reading them in worker processes so that the
+training loop doesn't wait on the disk.
+
+Every pass over the store shuffles all of its rows and splits them into
+batches, which are handed out to the workers in turn. Each worker owns a
+fixed number of batch slots in shared memory and gathers the rows of its
+batches straight from the memory mapped shards into a free slot, so that
+only the index of the slot goes through a pipe instead of pickled arrays.
+A slot is given back to its worker as soon as its batch has been copied out,
+so there are never more than `prefetch` batches waiting per worker. The
+batches come out in the same order whatever the number of workers, since
+the shuffle only depends on the seed and the epoch.
+
+Example:
+    loader = Loader('data/trajectories', batch_size=1024, workers=2)
+    for epoch in range(10):
+        for batch in loader:
+            train(batch["features"], batch["action"], batch["mask"], batch["reward"])
+"""
+
+import logging
+import multiprocessing
+import traceback
+
+import numpy as np
+
+from lib.trajectory import COLUMNS, TrajectoryStore
+
+LOGGER = logging.getLogger("pokemon-ai.loader")
+
+# Alignment in bytes of each array within a slot
+_ALIGN = 64
+
+
+def _layout(columns: list, batch_size: int, prefetch: int) -> (list, int):
+    """
+    Returns the offset of every column of every slot within the shared
+    memory of a worker, along with its total size in bytes.
+    """
+    layout = []
+    offset = 0
+    for _ in range(prefetch):
+        slot = {}
+        for column in columns:
+            dtype, width = COLUMNS[column]
+            shape = (batch_size,) if width is None else (batch_size, width)
+            slot[column] = (offset, shape)
+            offset += -(-np.dtype(dtype).itemsize * int(np.prod(shape)) // _ALIGN) * _ALIGN
+        layout.append(slot)
+    return layout, offset
+
+
+def _views(buffer, layout: list) -> list:
+    """ Returns the arrays of every column of every slot over the shared memory of a worker. """
+    memory = np.frombuffer(buffer, dtype=np.uint8)
+    views = []
+    for slot in layout:
+        arrays = {}
+        for column, (offset, shape) in slot.items():
+            dtype = np.dtype(COLUMNS[column][0])
+            size = dtype.itemsize * int(np.prod(shape))
+            arrays[column] = memory[offset:offset + size].view(dtype).reshape(shape)
+        views.append(arrays)
+    return views
+
+
+def _order(rows: int, shuffle: bool, seed: int, epoch: int) -> np.ndarray:
+    """ Returns the order the rows of the store are read in during an epoch. """
+    if not shuffle:
+        return np.arange(rows, dtype=np.int64)
+    return np.random.default_rng([seed, epoch]).permutation(rows)
+
+
+def _worker(job, buffer, free, ready):
+    """
+    Fills the slots of one worker with its share of the batches of an epoch,
+    receiving the free slots from the `free` connection and sending the slot
+    and the number of rows of each filled batch to the `ready` connection. A
+    None from `free` stops the worker early, and any error is sent to
+    `ready` as its formatted traceback.
+    """
+    path, names, columns, batch_size, batches, shuffle, seed, epoch, worker_idx, workers, layout = job
+    try:
+        store = TrajectoryStore(path, names)
+        views = _views(buffer, layout)
+        order = _order(len(store), shuffle, seed, epoch)
+        for batch_idx in range(worker_idx, batches, workers):
+            slot = free.recv()
+            if slot is None:
+                return
+            index = order[batch_idx * batch_size:(batch_idx + 1) * batch_size]
+            store.rows(index, columns, out={column: views[slot][column][:len(index)] for column in columns})
+            ready.send((slot, len(index)))
+    except EOFError:
+        pass
+    except Exception:
+        ready.send(traceback.format_exc())
+
+
+class Loader():
+    """
+    Iterates over shuffled minibatches of a trajectory store, one epoch per
+    iteration. Each batch is a dict holding a C-contiguous array for each of
+    the columns, where the first axis is the rows of the batch, and belongs
+    to the caller.
+
+    Only the shards that were complete when the loader was created are read,
+    even if more are written to the store later on.
+
+    Args:
+        path (str): Directory of the trajectory store.
+        batch_size (int): Number of rows in a batch.
+        workers (int): Number of worker processes, where 0 reads the batches in the calling process.
+        prefetch (int): Number of batches each worker may have ready before they are asked for.
+        columns: Names of the columns of `lib.trajectory.COLUMNS` that are read.
+        shuffle (bool): Whether to shuffle the rows every epoch, rather than reading them in order.
+        drop_last (bool): Whether to skip the last batch of an epoch if it has less than `batch_size` rows.
+        seed (int): Seed of the shuffle, a random one is used if it isn't given.
+
+    Attributes:
+        store (lib.trajectory.TrajectoryStore): The store the batches are read from.
+        epoch (int): Number of epochs started so far, which also seeds the shuffle of the next one.
+
+    Raises:
+        RuntimeError: While iterating, if a worker fails or exits before it is done.
+    """
+    def __init__(self, path: str, batch_size: int = 1024, workers: int = 2, prefetch: int = 4,
+                 columns=('features', 'action', 'mask', 'reward'), shuffle: bool = True,
+                 drop_last: bool = False, seed: int = None):
+        for column in columns:
+            if column not in COLUMNS:
+                raise ValueError(f'unknown column: {column}')
+        if batch_size < 1 or prefetch < 1 or workers < 0:
+            raise ValueError('batch_size and prefetch must be positive and workers must not be negative')
+        self.path = path
+        self.batch_size = batch_size
+        self.workers = workers
+        self.prefetch = prefetch
+        self.columns = list(columns)
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = np.random.SeedSequence().entropy if seed is None else seed
+        self.store = TrajectoryStore(path)
+        self.epoch = 0
+
+    def __len__(self):
+        """ Returns the number of batches in an epoch. """
+        rows = len(self.store)
+        if self.drop_last:
+            return rows // self.batch_size
+        return -(-rows // self.batch_size)
+
+    def __iter__(self):
+        epoch = self.epoch
+        self.epoch += 1
+        if self.workers:
+            return self._parallel(epoch)
+        return self._inline(epoch)
+
+    def _inline(self, epoch: int):
+        """ Yields the batches of an epoch read in this process. """
+        order = _order(len(self.store), self.shuffle, self.seed, epoch)
+        for batch_idx in range(len(self)):
+            yield self.store.rows(order[batch_idx * self.batch_size:(batch_idx + 1) * self.batch_size],
+                                  self.columns)
+
+    def _parallel(self, epoch: int):
+        """ Yields the batches of an epoch read by the workers, in the order of the shuffle. """
+        batches = len(self)
+        if not batches:
+            return
+        workers = min(self.workers, batches)
+        layout, size = _layout(self.columns, self.batch_size, self.prefetch)
+        context = multiprocessing.get_context()
+        buffers = [context.RawArray('B', size) for _ in range(workers)]
+        views = [_views(buffer, layout) for buffer in buffers]
+        free = []
+        ready = []
+        processes = []
+        for worker_idx in range(workers):
+            free_reader, free_writer = context.Pipe(duplex=False)
+            ready_reader, ready_writer = context.Pipe(duplex=False)
+            job = (self.path, self.store.names, self.columns, self.batch_size, batches, self.shuffle,
+                   self.seed, epoch, worker_idx, workers, layout)
+            process = context.Process(target=_worker, args=(job, buffers[worker_idx], free_reader, ready_writer),
+                                      daemon=True)
+            process.start()
+            # Only the worker keeps these ends, so that it sees EOF if this process goes away and the other way around
+            free_reader.close()
+            ready_writer.close()
+            for slot in range(min(self.prefetch, len(range(worker_idx, batches, workers)))):
+                free_writer.send(slot)
+            free.append(free_writer)
+            ready.append(ready_reader)
+            processes.append(process)
+
+        try:
+            for batch_idx in range(batches):
+                worker_idx = batch_idx % workers
+                message = self._receive(ready[worker_idx], processes[worker_idx])
+                if isinstance(message, str):
+                    raise RuntimeError(f'loader worker {worker_idx} failed:\n{message}')
+                slot, rows = message
+                batch = {column: views[worker_idx][slot][column][:rows].copy() for column in self.columns}
+                # The worker exits once it has a slot for each of its batches
+                if batch_idx + self.prefetch * workers < batches:
+                    free[worker_idx].send(slot)
+                yield batch
+        finally:
+            for connection in free:
+                try:
+                    connection.send(None)
+                except OSError:
+                    pass
+                connection.close()
+            for process in processes:
+                process.join(timeout=1)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+            for connection in ready:
+                connection.close()
+
+    @staticmethod
+    def _receive(ready, process):
+        """ Waits for the next message of a worker, failing if the worker exits without sending one. """
+        while not ready.poll(1):
+            if not process.is_alive() and not ready.poll(0):
+                raise RuntimeError(f'loader worker exited with code {process.exitcode}')
+        try:
+            return ready.recv()
+        except EOFError:
+            raise RuntimeError(f'loader worker exited with code {process.exitcode}')
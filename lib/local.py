@@ -3,23 +3,21 @@ Local uses Pokemon-Showdown's simulate battle functionality to conduct a fight
 locally.
 """
 
-from jinja2 import Template
-import json
-import copy
 import logging
+import multiprocessing
+import os
 import subprocess
-import lib.normalizer as normalizer
+import lib.bots
+import lib.multiplex
+import time
+from lib.battle import Battle, ask
+from lib.phases import PhaseTimer
+from lib.replay import ReplayWriter
+from lib.trajectory import TrajectoryWriter
 
-MODE_ALL = -1
 LOGGER = logging.getLogger("pokemon-ai.local")
 
 
-def handle(x):
-    if isinstance(x, set):
-        return list(x)
-    return x.__dict__
-
-
 class Local():
     """
     The Local class uses Pokemon-Showdown's simulate battle functionality to conduct a
@@ -30,8 +28,12 @@ class Local():
         gamemode (str): Format name of the gamemode to run in the local simulator.
         num (int): Number of simulations to run.
         save_replay (bool):
-            Boolean value which determines whether or not to save the replay to
-            'replay.html'.
+            Boolean value which determines whether or not to stream the replay
+            of every battle to `replay_dir`.
+        replay_dir (str): Directory the replays are written to as `battle-{id}.jsonl.gz`.
+        first_id (int): Id of the first battle, used to keep replay files of different runs apart.
+        profile_phases (bool): Whether to time the phases of every battle in `timer`.
+        trajectory_dir (str): Optional trajectory store the decisions of the bots are written to.
     Attributes:
         process (subprocess.Local):
             The subprocess managing the showdown BattleStream using the
@@ -39,23 +41,34 @@ class Local():
             multirunner.js file used to run real battles.
         bots (list): List of Bots to compete in a Local simulator.
         save_replay (bool):
-            Boolean value which determines whether or not to save the replay to
-            'replay.html'.
-        replay_log (list):
-            List of the log of messages that were sent to all of the bots in
-            the game which is then dumped to the replay.html file.
-        bot_gamestates (list):
-            Stores the deepcopy of each gamestate at every turn or half-turns
-            where a swith is requested of a player.
-        bot_norm(list):
-            Similar to the bot_gamestates list, but contains the normalized versions of each of the 
+            Boolean value which determines whether or not to stream the replay
+            of every battle to `replay_dir`.
+        battle (lib.battle.Battle):
+            The battle currently being run, which routes the messages of the
+            simulator to the bots.
+        results (list):
+            Number of battles won by each bot, indexed the same way as `bots`.
+            Index 0 holds the number of ties.
+        decision_times (list): Wall time in seconds of every call to the bot files, as in `lib.battle.Battle`.
+        decision_sizes (list): Number of choices made by each call of `decision_times`.
+        lines (int): Number of protocol lines parsed by the gamestates of the bots.
+        timer (lib.phases.PhaseTimer):
+            Timings of the phases of every battle, or None if not profiling.
     """
-    def __init__(self, bot_list: list, gamemode: str, num: int, save_replay: bool):
+    def __init__(self, bot_list: list, gamemode: str, num: int, save_replay: bool,
+                 replay_dir: str = 'replays', first_id: int = 0, profile_phases: bool = False,
+                 trajectory_dir: str = None):
         args = ['node', 'lib/multirunner.js', '2>/dev/null']
+        self.results = [0] * (len(bot_list) + 1)
+        self.decision_times = []
+        self.decision_sizes = []
+        self.lines = 0
+        self.timer = PhaseTimer() if profile_phases else None
+        self.battle = None
+        trajectory = TrajectoryWriter(trajectory_dir) if trajectory_dir else None
 
-        if save_replay and num > 1:
-            LOGGER.error("If saving replay, the number of simulations must be equal to 1")
-            return
+        if save_replay:
+            os.makedirs(replay_dir, exist_ok=True)
 
         self.process = subprocess.Popen(args,
                                         stdin=subprocess.PIPE,
@@ -67,49 +80,31 @@ class Local():
         self.bots.extend(bot_list)
         self.save_replay = save_replay
 
-        self.replay_log = []
-        self.bot_gamestates = [None]
-        self.bot_norm = [None]
-
-        if save_replay:
-            for i in range(1, len(self.bots)):
-                self.bot_gamestates.append([])
-                self.bot_norm.append([])
-
-        while num > 0:
-            line = self.process.stdout.readline()
+        for battle_id in range(first_id, first_id + num):
+            line = self.readline()
             if line != "START\n":
                 LOGGER.error("Something is wrong with the multirunner..?")
-            self.send('>start {"formatid":"%s"}' % gamemode)
-            for i in range(1, len(self.bots)):
-                self.bots[i].new_gamestate()
-                self.send('>player p%d {"name":"%s"}' % (i, self.bots[i].name))
+            replay = None
+            if save_replay:
+                replay = ReplayWriter(os.path.join(replay_dir, f'battle-{battle_id}.jsonl.gz'))
+            self.battle = Battle(bot_list, replay, str(battle_id), profile_phases, trajectory)
+            for cmd in self.battle.start(gamemode):
+                self.send(cmd)
             self.listener()
-            LOGGER.info("FINISHED:" + str(num))
-            num -= 1
-
+            self.results[self.battle.result()] += 1
+            self.decision_times.extend(self.battle.decision_times)
+            self.decision_sizes.extend(self.battle.decision_sizes)
+            self.lines += self.battle.lines
+            if self.timer:
+                self.timer.merge(self.battle.timer)
+            LOGGER.info("FINISHED:" + str(battle_id))
+
+        if trajectory:
+            trajectory.close()
         self.process.stdin.close()
         self.process.terminate()
         self.process.wait(timeout=0.2)
 
-        if self.save_replay:
-            data = dict()
-            data["log"] = "".join(self.replay_log)
-            for i in range(1, len(self.bots)):
-                gamestate_str = json.dumps(self.bot_gamestates[i],
-                                           default=handle,
-                                           skipkeys=True)
-                norm_str = json.dumps(self.bot_norm[i],
-                                      default=handle,
-                                      skipkeys=True)
-                data["bot"+str(i)] = gamestate_str
-                data["bot"+str(i)+"_norm"] = norm_str
-            template_file = open("./web/replay.html.tmpl", "r")
-            output_file = open("./replay.html", "w")
-            template = Template("".join(template_file.readlines()))
-            res = template.render(data)
-            output_file.write(res)
-
     def send(self, cmd):
         """
         Send a message to self.subprocess then flushes output. Appends a
@@ -118,75 +113,106 @@ class Local():
         Args:
             cmd (str): String to send to the subprocess.
         """
+        timer = self.battle.timer if self.battle else None
+        if timer:
+            start = time.perf_counter()
         LOGGER.info(cmd)
         if cmd[-1] != '\n':
             self.process.stdin.write(cmd + '\n')
         else:
             self.process.stdin.write(cmd)
         self.process.stdin.flush()
+        if timer:
+            timer.add('send', time.perf_counter() - start)
+
+    def readline(self) -> str:
+        """
+        Reads the next line from self.subprocess, timing the wait as the
+        simulate phase when profiling.
+        """
+        timer = self.battle.timer if self.battle else None
+        if timer is None:
+            return self.process.stdout.readline()
+        start = time.perf_counter()
+        line = self.process.stdout.readline()
+        timer.add('simulate', time.perf_counter() - start)
+        return line
 
     def listener(self):
         """
-        Listen for messages from self.subprocess and processes them to properly
-        forward to the bots.
+        Listen for messages from self.subprocess and forwards them to the
+        current battle until the multirunner signals that the battle is over.
         """
-        line = '\n'
-        mode = MODE_ALL  # Any positive number corresponds to the user's idx
-        while line:
-            line = self.process.stdout.readline()
-            msg = line.split("|")
-
-            if line == '\n' and mode == MODE_ALL:
-                # Shitty way of recognizing when to ask for a move.
-                # I wish there was a better way, but the showdown
-                # protocol was not designed with this in mind.
-
-                LOGGER.debug("---- ASK MOVE ----")
-                for i in range(1, len(self.bots)):
-                    if self.save_replay:
-                        ng = copy.deepcopy(self.bots[i].gamestate.__dict__())
-                        self.bot_gamestates[i].append(ng)
-                        self.bot_norm[i].append(normalizer.normalize(self.bots[i].gamestate, self.bots[i].gamestate.player_idx))
-                    if self.bots[i].gamestate.result == -1 and not self.bots[i].gamestate.wait:
-                        choice = self.bots[i].choose()
-                        if choice is not None:
-                            choice_str = f'>p{i} {choice}'
-                            self.send(choice_str)
-
-            elif line == 'update\n':
-                mode = MODE_ALL
-
-            elif line == 'sideupdate\n':
-                player = self.process.stdout.readline()
-                mode = int(player[1])  # takes out 2 from p2
-
-            elif line == 'end\n':
-                result = self.process.stdout.readline()
-                result_json = json.loads(result)
-                LOGGER.debug(json.dumps(result_json, indent=True))
-                while line.strip() != "END":
-                    line = self.process.stdout.readline()
-                self.send("\x04")
-                return
-
-            elif line != '\n':
-                if mode != MODE_ALL:
-                    LOGGER.info(f'<p{mode} {line[:-1]}')
-                    self.bots[mode].read(line)
-                else:
-                    if len(msg) > 2 and msg[1] == 'split':
-                        player_id = int(msg[2][1])
-                        secret_line = self.process.stdout.readline()
-                        public_line = self.process.stdout.readline()
-                        LOGGER.info(f'<p{player_id} {secret_line[:-1]}')
-                        LOGGER.info(f'<all {public_line[:-1]}')
-                        for i in range(1, len(self.bots)):
-                            self.bots[i].read(secret_line if player_id == i else public_line)
-                        if self.save_replay:
-                            self.replay_log.append(public_line)
-                    else:
-                        LOGGER.info(f'<all {line[:-1]}')
-                        for i in range(1, len(self.bots)):
-                            self.bots[i].read(line)
-                        if self.save_replay:
-                            self.replay_log.append(line)
+        line = self.readline()
+        while line and line != 'END\n':
+            if self.battle.feed(line):
+                for _, choice in ask([self.battle]):
+                    self.send(choice)
+            line = self.readline()
+        self.send("\x04")
+
+
+def _run_shard(job):
+    """
+    Runs one shard of battles in a worker process. The bots are created inside
+    the worker since they hold dynamically loaded modules which can't be
+    pickled across processes.
+    """
+    gen, bot_types, gamemode, num, concurrency, save_replay, replay_dir, first_id, profile_phases, trajectory_dir = job
+    if concurrency > 1:
+        runner = lib.multiplex.Multiplex(gen, bot_types, gamemode, num, concurrency,
+                                         save_replay, replay_dir, first_id, profile_phases, trajectory_dir)
+    else:
+        bots = [lib.bots.Bot(f'b{i}', gen, bot_type) for i, bot_type in enumerate(bot_types, 1)]
+        runner = Local(bots, gamemode, num, save_replay, replay_dir, first_id, profile_phases, trajectory_dir)
+    return runner.results, runner.timer
+
+
+def run_parallel(gen: str, bot_types: list, gamemode: str, num: int, workers: int, concurrency: int = 1,
+                 save_replay: bool = False, replay_dir: str = 'replays', profile_phases: bool = False,
+                 trajectory_dir: str = None) -> (list, PhaseTimer):
+    """
+    Shards `num` battles across `workers` processes, each driving its own
+    simulator subprocess and its own set of Bots, then merges the results.
+
+    Args:
+        gen (str): Generation of the bots such as 'gen1'.
+        bot_types (list): The bot type of each player as defined in ai/{gen}/{bot_type}.
+        gamemode (str): Format name of the gamemode to run in the local simulator.
+        num (int): Total number of simulations to run.
+        workers (int): Number of worker processes.
+        concurrency (int):
+            Number of battles each worker keeps in flight at once. Any value
+            above 1 runs the worker with `lib.multiplex.Multiplex`.
+        save_replay (bool): Whether to stream the replay of every battle to `replay_dir`.
+        replay_dir (str): Directory the replays are written to.
+        profile_phases (bool): Whether to time the phases of every battle.
+        trajectory_dir (str): Optional trajectory store the decisions of the bots are written to.
+
+    Returns:
+        (list, lib.phases.PhaseTimer):
+            Merged results in the same layout as `Local.results`, and the
+            merged phase timings or None if not profiling.
+
+    Raises:
+        ValueError: If `num` is negative, or `workers` or `concurrency` is less than 1.
+    """
+    if num < 0:
+        raise ValueError(f'num must not be negative, got {num}')
+    if workers < 1 or concurrency < 1:
+        raise ValueError(f'workers and concurrency must be at least 1, got {workers} and {concurrency}')
+    timer = PhaseTimer() if profile_phases else None
+    if num == 0:
+        return [0] * (len(bot_types) + 1), timer
+
+    shards = [num // workers + (1 if i < num % workers else 0) for i in range(workers)]
+    starts = [sum(shards[:i]) for i in range(workers)]
+    jobs = [(gen, bot_types, gamemode, n, concurrency, save_replay, replay_dir, start, profile_phases, trajectory_dir)
+            for n, start in zip(shards, starts) if n > 0]
+    with multiprocessing.Pool(len(jobs)) as pool:
+        shard_results = pool.map(_run_shard, jobs)
+
+    for _, shard_timer in shard_results:
+        if timer:
+            timer.merge(shard_timer)
+    return [sum(counts) for counts in zip(*[results for results, _ in shard_results])], timer
@@ -0,0 +1,178 @@
+"""
+Multiplex runs many battles concurrently within a single Pokemon-Showdown
+simulator process. Every line sent to and read from the multiplexer.js
+subprocess is tagged with the id of the battle it belongs to, so the simulator
+can keep working on other battles while the bots decide on one.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import lib.bots
+from lib.battle import Battle, ask
+from lib.phases import PhaseTimer
+from lib.replay import ReplayWriter
+from lib.trajectory import TrajectoryWriter
+
+READ_SIZE = 2 ** 16
+LOGGER = logging.getLogger("pokemon-ai.multiplex")
+
+
+class Multiplex():
+    """
+    The Multiplex class keeps up to `concurrency` battles in flight in one
+    multiplexer.js subprocess, starting a new battle whenever one finishes
+    until `num` battles have been run. Each battle gets its own set of Bots so
+    that every battle has its own GameStates.
+
+    Args:
+        gen (str): Generation of the bots such as 'gen1'.
+        bot_types (list): The bot type of each player as defined in ai/{gen}/{bot_type}.
+        gamemode (str): Format name of the gamemode to run in the local simulator.
+        num (int): Number of simulations to run.
+        concurrency (int): Maximum number of battles in flight at once.
+        save_replay (bool): Whether to stream the replay of every battle to `replay_dir`.
+        replay_dir (str): Directory the replays are written to as `battle-{id}.jsonl.gz`.
+        first_id (int): Id of the first battle, used to keep replay files of different runs apart.
+        profile_phases (bool): Whether to time the phases of every battle in `timer`.
+        trajectory_dir (str): Optional trajectory store the decisions of the bots are written to.
+
+    Attributes:
+        process (asyncio.subprocess.Process):
+            The subprocess running multiplexer.js.
+        battles (dict): The battles in flight keyed by their battle id.
+        trajectory (lib.trajectory.TrajectoryWriter): The writer of `trajectory_dir`, or None.
+        results (list):
+            Number of battles won by each bot, in the same layout as
+            `lib.local.Local.results`.
+        decision_times (list): Wall time in seconds of every call to the bot files, as in `lib.battle.Battle`.
+        decision_sizes (list): Number of choices made by each call of `decision_times`.
+        lines (int): Number of protocol lines parsed by the gamestates of the bots.
+        timer (lib.phases.PhaseTimer):
+            Timings of the phases of every battle, or None if not profiling.
+            Since the battles run concurrently, the simulate and send phases
+            are measured for the process as a whole.
+    """
+    def __init__(self, gen: str, bot_types: list, gamemode: str, num: int, concurrency: int,
+                 save_replay: bool = False, replay_dir: str = 'replays', first_id: int = 0,
+                 profile_phases: bool = False, trajectory_dir: str = None):
+        self.gen = gen
+        self.bot_types = bot_types
+        self.gamemode = gamemode
+        self.remaining = num
+        self.concurrency = concurrency
+        self.save_replay = save_replay
+        self.replay_dir = replay_dir
+        self.next_id = first_id
+        self.profile_phases = profile_phases
+        self.battles = dict()
+        self.results = [0] * (len(bot_types) + 1)
+        self.decision_times = []
+        self.decision_sizes = []
+        self.lines = 0
+        self.timer = PhaseTimer() if profile_phases else None
+        self.process = None
+        self.trajectory = TrajectoryWriter(trajectory_dir) if trajectory_dir else None
+
+        if save_replay:
+            os.makedirs(replay_dir, exist_ok=True)
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.run())
+        finally:
+            loop.close()
+            if self.trajectory:
+                self.trajectory.close()
+
+    async def run(self):
+        """
+        Starts the subprocess and routes its output to the battles until every
+        battle has finished. The output is read in chunks, and all the battles
+        that reached a decision within a chunk are asked for their moves
+        together so that bots of the same type can decide in one batch.
+        """
+        self.process = await asyncio.create_subprocess_exec('node', 'lib/multiplexer.js',
+                                                            stdin=asyncio.subprocess.PIPE,
+                                                            stdout=asyncio.subprocess.PIPE)
+        while self.remaining > 0 and len(self.battles) < self.concurrency:
+            self.start_battle()
+        await self.process.stdin.drain()
+
+        buffer = b''
+        while self.battles:
+            if self.timer:
+                start = time.perf_counter()
+            data = await self.process.stdout.read(READ_SIZE)
+            if self.timer:
+                self.timer.add('simulate', time.perf_counter() - start)
+            if not data:
+                LOGGER.error("Something is wrong with the multiplexer..?")
+                break
+            lines = (buffer + data).split(b'\n')
+            buffer = lines.pop()
+            ready = [battle for battle in map(self.route, lines) if battle is not None]
+            for battle, choice in ask(ready):
+                self.send(battle.battle_id, choice)
+            await self.process.stdin.drain()
+
+        self.process.stdin.close()
+        await self.process.wait()
+
+    def start_battle(self):
+        """ Creates a new battle with a fresh set of bots and starts it. """
+        battle_id = str(self.next_id)
+        self.next_id += 1
+        self.remaining -= 1
+        bots = [lib.bots.Bot(f'b{i}', self.gen, bot_type) for i, bot_type in enumerate(self.bot_types, 1)]
+        replay = None
+        if self.save_replay:
+            replay = ReplayWriter(os.path.join(self.replay_dir, f'battle-{battle_id}.jsonl.gz'))
+        battle = Battle(bots, replay, battle_id, self.profile_phases, self.trajectory)
+        self.battles[battle_id] = battle
+        for cmd in battle.start(self.gamemode):
+            self.send(battle_id, cmd)
+
+    def route(self, line: bytes):
+        """
+        Forwards a tagged line from the subprocess to its battle.
+
+        Args:
+            line (bytes): Line from the subprocess in the format `{battle_id}\\t{message}`.
+
+        Returns:
+            lib.battle.Battle: The battle if it is waiting on its bots to decide, otherwise None.
+        """
+        battle_id, _, msg = line.decode('utf8').partition('\t')
+        battle = self.battles[battle_id]
+        if msg == 'END':
+            self.results[battle.result()] += 1
+            self.decision_times.extend(battle.decision_times)
+            self.decision_sizes.extend(battle.decision_sizes)
+            self.lines += battle.lines
+            if self.timer:
+                self.timer.merge(battle.timer)
+            del self.battles[battle_id]
+            LOGGER.info("FINISHED:" + battle_id)
+            if self.remaining > 0:
+                self.start_battle()
+            return None
+        if battle.feed(msg + '\n'):
+            return battle
+        return None
+
+    def send(self, battle_id: str, cmd: str):
+        """
+        Queues a message tagged with its battle id to the subprocess.
+
+        Args:
+            battle_id (str): Id of the battle the message is for.
+            cmd (str): String to send to the battle.
+        """
+        if self.timer:
+            start = time.perf_counter()
+        LOGGER.info(f'{battle_id} {cmd}')
+        self.process.stdin.write(f'{battle_id}\t{cmd}\n'.encode('utf8'))
+        if self.timer:
+            self.timer.add('send', time.perf_counter() - start)
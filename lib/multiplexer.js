@@ -0,0 +1,41 @@
+/*
+ * This file runs many pokemon battles concurrently within one process.
+ *
+ * Every line read from stdin and written to stdout is prefixed with the id of
+ * the battle it belongs to and a tab, so that the python side can keep dozens
+ * of battles in flight at once and route each line to the right gamestates.
+ * A battle stream is created the first time an id is seen, and a final `END`
+ * line is written for an id once its battle is over.
+ */
+
+const DistLocation = '../thirdparty/Pokemon-Showdown'
+const BattleTextStream = require(DistLocation+'/.sim-dist/battle-stream').BattleTextStream
+const readline = require('readline')
+
+var battles = new Map()
+
+async function write(id, bs) {
+	let output = '';
+	while ((output = await bs.read())) {
+		const lines = output.split('\n')
+		lines.pop()
+		process.stdout.write(lines.map(line => `${id}\t${line}\n`).join(''))
+	}
+	process.stdout.write(`${id}\tEND\n`)
+	battles.delete(id)
+}
+
+function read(line) {
+	const tab = line.indexOf('\t')
+	const id = line.slice(0, tab)
+	let bs = battles.get(id)
+	if (!bs) {
+		bs = new BattleTextStream()
+		bs.start()
+		battles.set(id, bs)
+		write(id, bs)
+	}
+	bs.write(line.slice(tab + 1) + '\n')
+}
+
+readline.createInterface({input: process.stdin, terminal: false}).on('line', read)
@@ -3,220 +3,367 @@ Module to normalize the gamestate to be used in various ML bot implementations.
 The output of the normalize function results in the desired features ranging
 from 0 to 1 as is the standard for pytorch.
 
-The normalized array has the following structure:
-
-index => value
-
-0 => is ally active faster than opp active
-1 => percent of my unknown pokemon [0, 1]
-2 => percent of opp unknown pokemon [0, 1]
-
-for each pokemon of active [ally, opponent]:
-    0 => percentage of unknown moves [0, 1]
-    1 => level [60, 100]
-    2 => health percentage [0, 1]
-    3 => bug type
-    4 => dragon type
-    5 => electric type
-    6 => fighting type
-    7 => fire type
-    8 => flying type
-    9 => ghost type
-    10 => grass type
-    11 => ground type
-    12 => ice type
-    13 => normal type
-    14 => poison type
-    15 => psychic type
-    16 => rock type
-    17 => water type
-    18 => is poisoned
-    19 => is toxiced
-    20 => is burned
-    21 => is paralyzed
-    22 => is confused
-    23 => is frozen
-    24 => is sleeping
-    25 => base attack [0, 350] (logistic curve)
-    26 => base defense [0, 350] (logistic curve)
-    27 => base special [0, 350] (logistic curve)
-    28 => base speed [0, 350] (logistic curve)
-    29 => real attack [0, 1300] (logistic curve) (only for attack, divide by 2 if burned) (multiply based on modifiers)
-    30 => real defense [0, 1300] (logistic curve) (*2 if reflect)
-    31 => real special [0, 1300] (logistic curve)
-    32 => real speed [0, 1300] (logistic curve) (only for speed, divide by 4 if paralyzed)
-    33 => attack modifier [-6, 6]
-    34 => defense modifier [-6, 6]
-    35 => special modifier [-6, 6]
-    36 => speed modifier [-6, 6]
-    37 => used_protect (whether or not they used protect last turn)
-    38 => is_leech_seeded
-    39 => is underground (using dig)
-    40 => is in the sky (using fly)
-    41 => is recovering (after using hyper beam or something)
-    42 => is charging (using sky attack or something)
-
-    for each move of pokemon (4 times):
-            0 => move1 power (if multi-hit, pls do weighted average based on probabilities) [0, 200] (*2 manually if earthquake and opp is digging) (logistic regression !!!!!)
-            1 => move1 pp remaining [0, 1]
-            2 => move1 acc of current pokemon [0, 1]
-            3 => move1 crit chance [0, 1]
-            3.5 => move1 predicted % health damage [0, 1] (use RANDOM = 0.9)
-            4 => move1 will it kill the enemy pokemon? (for damage calc, assume RANDOM = 0.9)
-            5 => move1 bug type
-            6 => move1 dragon type
-            7 => move1 electric type
-            8 => move1 fighting type
-            9 => move1 fire type
-            10 => move1 flying type
-            11 => move1 ghost type
-            12 => move1 grass type
-            13 => move1 ground type
-            14 => move1 ice type
-            15 => move1 normal type
-            16 => move1 poison type
-            17 => move1 psychic type
-            18 => move1 rock type
-            19 => move1 water type
-            20 => move1 is_physical_attack (1 if physical move, -1 if not)
-            21 => move1 is_special_attack (1 if special move, -1 if not)
-            22 => move1 modify_ally_atk (number of stages change * 0.5)
-            23 => move1 modify_ally_def
-            24 => move1 modify_ally_spc
-            25 => move1 modify_ally_spd
-            26 => move1 modify_opp_atk
-            27 => move1 modify_opp_def
-            28 => move1 modify_opp_spc
-            29 => move1 modify_opp_spd
-            30 => move1 flinch_opp
-            31 => move1 freeze_opp
-            32 => move1 burn_opp
-            33 => move1 paralyze_opp
-            34 => move1 confuse_opp
-            35 => move1 poison_opp
-            36 => move1 toxic_opp
-            37 => move1 sleep_opp
-            38 => move1 is_counter (no mirror coat, only counter in gen 1)
-            39 => move1 traps_opp (moves like bind or clamp or whirlpool traps opponent on field)
-            40 => move1 drains_health (only true for mega drain, giga drain, since all such moves drain 50% of dmg dealt in gen 1)
-            41 => move1 has_recoil (all such moves have 25% recoil on dmg dealt, so just 1 or -1)
-            42 => move1 must_recharge (hyper beam, giga impact, etc)
-            43 => move1 OHKO (one hit KO!)
-            44 => move1 is_explosion (also implies 250 dmg)
-            45 => move1 takes_two_turns (moves like dig, fly)
-            46 => move1 recoil_if_miss (high jump kick, jump kick. Both have ½ recoil)
-            47 => move1 recovers_health (1 if recover or soft-boiled, -1 if not) (the only other health recovering move, rest, is otherwise taken care of)
-            48 => move1 is_reflect
-            49 => move1 copies_opp_move
-            50 => move1 damages_based_on_level (night shade, seismic toss)
-            51 => move1 is_rest
-            52 => move1 is_transform
-
-
-for each nonactive pokemon of [ally, opponent]:
-    0 => is fainted
-    1 => level [60, 100]
-    2 => health percentage [0, 1]
-    3 => bug type
-    4 => dragon type
-    5 => electric type
-    6 => fighting type
-    7 => fire type
-    8 => flying type
-    9 => ghost type
-    10 => grass type
-    11 => ground type
-    12 => ice type
-    13 => normal type
-    14 => poison type
-    15 => psychic type
-    16 => rock type
-    17 => water type
-    18 => is poisoned
-    19 => is toxiced
-    20 => is burned
-    21 => is paralyzed
-    22 => is frozen
-    23 => is sleeping
-    24 => base attack [0, 350] (logistic curve)
-    25 => base defense [0, 350] (logistic curve)
-    26 => base special [0, 350] (logistic curve)
-    27 => base speed [0, 350] (logistic curve)
-    28 => percent of unknown moves [0, 1]
+`normalize` returns the features as a dict keyed by their names, which only
+has the moves that are known. `normalize_array` writes the same features into
+a float32 numpy array of a fixed length instead, where every feature has the
+index given by `INDEX` and the features of unknown moves are left as 0, so
+that every gamestate becomes a row of the same layout that can be fed to a
+model as is. `FEATURES` lists the names of the features in the order of the
+array.
 
+Both can be given a `FeatureCache`, which keeps the features that only
+depend on the active pokemon, like its types, stats and moves, for as long as
+the pokemon doesn't change, so that normalizing a gamestate again after a
+turn only recomputes what changed during the turn.
 
+The normalized array has the following layout, where `{side}` is `player`
+for the player whose perspective is used and `opponent` for the other one,
+and every value is also found under its name in `normalize`:
+
+index => name => value
+
+0 => player_faster_than_opp => whether the active pokemon of the player is at least as fast
+
+then for each side, first the player and then the opponent, from index 1 and 53:
+    0 => percent_known_of_{side} => number of known pokemon of the other player / 6
+    1 => percent_known_moves_of_{side}_active => number of known moves / 4
+    2 => level_of_{side}_active => (level - MIN_LEVEL) / (100 - MIN_LEVEL)
+    3-7 => base_{stat}_{side}_active => atk, def, spa, spd and spe stat / 350
+    8-12 => real_{stat}_{side}_active => boost stage * stat / 1500 for the same stats
+    13-17 => boost_{stat}_{side}_active => (boost stage + 6) / 12 for the same stats
+    18 => is_recharging_{side}_active => whether it must recharge this turn
+    19-24 => is_{status}_{side}_active => whether it has each status of STATUS
+    25-39 => type_{type}_{side}_active => whether it has each type of TYPES
+    40-51 => move{m}_{power,pp,acc}_{side}_active => base power, pp left / max pp and accuracy of moves 0 to 3
+
+The features of moves that aren't known yet are 0 in the array and left out
+of `normalize`.
 """
 
+import numpy as np
+
+import lib.ids
+import lib.templates
+import lib.typechart
+
 TYPES = ('Bug', 'Dragon', 'Electric', 'Fighting', 'Fire', 'Flying', 'Ghost', 'Grass', 'Ground', 'Ice', 'Normal', 'Poison', 'Psychic', 'Rock', 'Water')
-STATUS = {'brn', 'frz', 'par', 'psn', 'tox', 'slp'}
+STATUS = lib.ids.STATUSES
 MIN_LEVEL = 60
 
+# Features of the active pokemon of each side, in the order they are written by `normalize_array`
+_SIDE_FEATURES = (
+    ('percent_known_of_{name}', 'percent_known_moves_of_{name}_active', 'level_of_{name}_active')
+    + tuple(f'base_{stat}_{{name}}_active' for stat in ('atk', 'def', 'spa', 'spd', 'spe'))
+    + tuple(f'real_{stat}_{{name}}_active' for stat in ('atk', 'def', 'spa', 'spd', 'spe'))
+    + tuple(f'boost_{stat}_{{name}}_active' for stat in ('atk', 'def', 'spa', 'spd', 'spe'))
+    + ('is_recharging_{name}_active',)
+    + tuple(f'is_{s}_{{name}}_active' for s in STATUS)
+    + tuple(f'type_{t.lower()}_{{name}}_active' for t in TYPES)
+    + tuple(f'move{m}_{feature}_{{name}}_active' for m in range(4) for feature in ('power', 'pp', 'acc')))
+
+FEATURES = ('player_faster_than_opp',) + tuple(
+    feature.format(name=name) for name in ('player', 'opponent') for feature in _SIDE_FEATURES)
+INDEX = {feature: idx for idx, feature in enumerate(FEATURES)}
+N_FEATURES = len(FEATURES)
+
+_SIDE_NAMES = {name: tuple(feature.format(name=name) for feature in _SIDE_FEATURES) for name in ('player', 'opponent')}
+_BOOSTED = ('atk', 'def', 'spa', 'spd', 'spe')
+# Where the features of `_pokemon_values` are split around the ones that also depend on the player
+_POKEMON_SPLIT = 7
+
+_type_ids = {}
+
+
+def _types_of(gen: str) -> tuple:
+    """ Returns the ids of TYPES within a generation. """
+    ids = _type_ids.get(gen)
+    if ids is None:
+        ids = _type_ids[gen] = tuple(lib.ids.type_id(gen, t) for t in TYPES)
+    return ids
+
+
+def _static_values(gen: str, active, moves: list) -> tuple:
+    """
+    Returns the features of a pokemon that don't change during a battle
+    unless it learns of a new move: its known moves, level and base stats, its
+    types, and the power and accuracy of each of its moves.
+    """
+    head = [len(active.moves) / 4, (active.level-MIN_LEVEL) / (100-MIN_LEVEL),
+            active.atk / 350, active.defense / 350, active.spa / 350, active.spd / 350, active.spe / 350]
+    type_mask = active.template.type_mask
+    types = [type_mask >> type_id & 1 for type_id in _types_of(gen)]
+    # TODO: if moves[m].name == "earthquake" && enemy isdiggign:
+    move_values = [(mv.power, mv.accuracy) for mv in moves]
+    return head, types, move_values
+
+
+def _pokemon_values(gen: str, active, static: tuple = None) -> list:
+    """
+    Returns the features of a side that only depend on its active pokemon,
+    which are the ones of `_static_values`, with its statuses and the pp of
+    its moves in between.
+    """
+    moves = list(active.moves.values())[:4]
+    head, types, move_values = static or _static_values(gen, active, moves)
+    bits = active.status.bits
+    # The statuses of STATUS have the first bits of a StatusSet in the same order
+    values = head + [bits >> bit & 1 for bit in range(len(STATUS))] + types
+    for (power, accuracy), mv in zip(move_values, moves):
+        values.extend((power, mv.pp / mv.pp_max if mv.pp_max else 0, accuracy))
+        # TODO: n[f'move{m}_crit_{name}_active'] = moves[m].accuracy
+    return values
+
+
+class FeatureCache:
+    """
+    Keeps the features of the active pokemon normalized most recently, so
+    that normalizing a gamestate again only recomputes what changed since.
+
+    The features of a pokemon are kept by its stamp, which a gamestate
+    replaces whenever it changes the pokemon, so they are reused as is until
+    the pokemon changes. Since a pokemon changes most turns, by losing hp or
+    pp, the features that only change when a move is revealed are also kept
+    by the species, level, stats and moves of the pokemon, so that only its
+    statuses and pp have to be read again then. Stamps are never reused, so
+    one cache can be shared by all the gamestates of a process.
+
+    Args:
+        size (int): Number of pokemon whose features are kept.
+
+    Attributes:
+        hits (int): Number of times the features of an unchanged pokemon were reused.
+        static_hits (int): Number of times only the statuses and pp of a pokemon had to be read.
+        misses (int): Number of times all the features of a pokemon had to be computed.
+    """
+    def __init__(self, size: int = 64):
+        self.size = size
+        self.hits = 0
+        self.static_hits = 0
+        self.misses = 0
+        self._pokemon = {}
+        self._static = {}
+
+    @staticmethod
+    def _store(table: dict, key, value, size: int):
+        if len(table) >= size:
+            del table[next(iter(table))]
+        table[key] = value
+
+    def pokemon_values(self, gen: str, active) -> list:
+        """ Returns `_pokemon_values` of a pokemon, computing only what changed since it was last seen. """
+        values = self._pokemon.get(active.stamp)
+        if values is not None:
+            self.hits += 1
+            return values
+
+        moves = list(active.moves.values())[:4]
+        key = (gen, active.template.id, active.level, active.base_atk, active.base_def, active.base_spa,
+               active.base_spd, active.base_spe) + tuple(mv.template.id for mv in moves)
+        static = self._static.get(key)
+        if static is None:
+            self.misses += 1
+            static = _static_values(gen, active, moves)
+            self._store(self._static, key, static, self.size)
+        else:
+            self.static_hits += 1
+        values = _pokemon_values(gen, active, static)
+        self._store(self._pokemon, active.stamp, values, self.size)
+        return values
+
+
+def _side_values(g, idx: int, cache: FeatureCache = None) -> list:
+    """ Returns the features of the active pokemon of a player in the order of `_SIDE_FEATURES`. """
+    player = g.players[idx]
+    active = player.get_active()
+    # _BOOSTED are the first stats of lib.gamestate.BOOSTS
+    boosts = player.boosts.values[:len(_BOOSTED)]
+    if cache is None:
+        pokemon = _pokemon_values(g.gen, active)
+    else:
+        pokemon = cache.pokemon_values(g.gen, active)
+    stats = (active.atk, active.defense, active.spa, active.spd, active.spe)
+    values = [len(g.players[idx-1].team) / 6]
+    values += pokemon[:_POKEMON_SPLIT]
+    values += [boost * stat / 1500 for boost, stat in zip(boosts, stats)]
+    values += [(boost + 6) / 12 for boost in boosts]
+    # TODO:
+    # n[f'used_protect_{name}_active'] =
+    # n[f'is_leech_seeded_{name}_active']
+    # n[f'is_flying_{name}_active']
+    # n[f'is_underground_{name}_active']
+    values.append(int(active.mustrecharge + 2 > g.turn))
+    # n[f'is_charging_{name}_active']
+    values += pokemon[_POKEMON_SPLIT:]
+    return values
 
-def damage_calc(gamestate):
-    pass
 
-def normalize(g, player_idx):
+def normalize(g, player_idx, cache: FeatureCache = None) -> dict:
+    """
+    Normalizes a gamestate from the perspective of a player into a dict of
+    features keyed by their names, which only has the moves that are known.
+
+    Args:
+        g (lib.gamestate.GameState): The gamestate, where both players have an active pokemon.
+        player_idx (int): Index of the player whose perspective is used.
+        cache (FeatureCache): Optional cache to reuse the features of pokemon that haven't changed.
+    """
     pi = player_idx
-    oi = pi^1
+    oi = pi ^ 1
     n = dict()
-    n['player_faster_than_opp'] = g.players[pi].get_active().spe >= g.players[oi].get_active().spe
-
-    for i in (('player', pi, oi), ('opponent', oi, pi)):
-        name, idx, opp = i
-        active = g.players[idx].get_active()
-        n[f'percent_known_of_{name}'] = len(g.players[idx-1].team) / 6
-        n[f'percent_known_moves_of_{name}_active'] = len(active.moves) / 4
-        n[f'level_of_{name}_active'] = (active.level-MIN_LEVEL) / (100-MIN_LEVEL)
-
-        n[f'base_atk_{name}_active'] = active.atk / 350
-        n[f'base_def_{name}_active'] = active.defense / 350
-        n[f'base_spa_{name}_active'] = active.spa / 350
-        n[f'base_spd_{name}_active'] = active.spd / 350
-        n[f'base_spe_{name}_active'] = active.spe / 350
-
-        n[f'real_atk_{name}_active'] = g.players[idx].boosts['atk'] * active.atk / 1500
-        n[f'real_def_{name}_active'] = g.players[idx].boosts['def'] * active.defense / 1500
-        n[f'real_spa_{name}_active'] = g.players[idx].boosts['spa'] * active.spa / 1500
-        n[f'real_spd_{name}_active'] = g.players[idx].boosts['spd'] * active.spd / 1500
-        n[f'real_spe_{name}_active'] = g.players[idx].boosts['spe'] * active.spe / 1500
-
-        n[f'boost_atk_{name}_active'] = (g.get_boost(idx, 'atk') + 6) / 12
-        n[f'boost_def_{name}_active'] = (g.get_boost(idx, 'def') + 6) / 12
-        n[f'boost_spa_{name}_active'] = (g.get_boost(idx, 'spa') + 6) / 12
-        n[f'boost_spd_{name}_active'] = (g.get_boost(idx, 'spd') + 6) / 12
-        n[f'boost_spe_{name}_active'] = (g.get_boost(idx, 'spe') + 6) / 12
-
-        # TODO:
-        # n[f'used_protect_{name}_active'] =
-        # n[f'is_leech_seeded_{name}_active']
-        # n[f'is_flying_{name}_active']
-        # n[f'is_underground_{name}_active']
-        n[f'is_recharging_{name}_active'] = active.mustrecharge + 2 > g.turn
-        # n[f'is_charging_{name}_active']
-
-        for s in STATUS:
-            n[f'is_{s}_{name}_active'] = s in active.status
-
-        for t in TYPES:
-            n[f'type_{t.lower()}_{name}_active'] = t in active.types
-
-        moves = [ x for x in active.moves.values() ]
-        for m in range(0,4):
-            if m < len(moves):
-                mv = moves[m]
-                power = mv.power
-                # TODO: if moves[m].name == "earthquake" && enemy isdiggign:
-                #
-                n[f'move{m}_power_{name}_active'] = power
-                n[f'move{m}_pp_{name}_active'] = mv.pp / mv.pp_max
-                n[f'move{m}_acc_{name}_active'] = mv.accuracy
-                # TODO: n[f'move{m}_crit_{name}_active'] = moves[m].accuracy
-
-        if name == 'player':
-            pass
-            # use full information of player
-
-    for key in n:
-        if type(n[key]) == bool:
-            n[key] = 1 if n[key] else 0
+    n['player_faster_than_opp'] = int(g.players[pi].get_active().spe >= g.players[oi].get_active().spe)
+    for name, idx in (('player', pi), ('opponent', oi)):
+        # Features of unknown moves are left out, since there are fewer values than names then
+        n.update(zip(_SIDE_NAMES[name], _side_values(g, idx, cache)))
     return n
+
+
+def normalize_array(g, player_idx, out=None, cache: FeatureCache = None):
+    """
+    Normalizes a gamestate from the perspective of a player into a fixed
+    layout array, holding the same features as `normalize`.
+
+    Args:
+        g (lib.gamestate.GameState): The gamestate, where both players have an active pokemon.
+        player_idx (int): Index of the player whose perspective is used.
+        out (numpy.ndarray): A float32 array of length N_FEATURES to write into, like a row of a bigger array.
+        cache (FeatureCache): Optional cache to reuse the features of pokemon that haven't changed.
+
+    Returns:
+        numpy.ndarray: The array of length N_FEATURES, indexed by INDEX.
+    """
+    if out is None:
+        out = np.zeros(N_FEATURES, dtype=np.float32)
+    else:
+        out[:] = 0
+    pi = player_idx
+    oi = pi ^ 1
+    out[0] = g.players[pi].get_active().spe >= g.players[oi].get_active().spe
+    out_offset = 1
+    for idx in (pi, oi):
+        values = _side_values(g, idx, cache)
+        out[out_offset:out_offset + len(values)] = values
+        out_offset += len(_SIDE_FEATURES)
+    return out
+
+
+_species_columns = {}
+_move_columns = {}
+
+
+def _species_table(gen: str) -> np.ndarray:
+    """ Returns the type columns of every species of a generation, indexed by species id. """
+    table = _species_columns.get(gen)
+    if table is None:
+        species_types = lib.typechart.species_types(gen)
+        type_ids = np.array(_types_of(gen))
+        table = ((species_types[:, :, None] == type_ids) & (type_ids != 0)).any(axis=1).astype(np.float32)
+        table = _species_columns[gen] = table
+    return table
+
+
+def _move_table(gen: str) -> np.ndarray:
+    """ Returns the power, accuracy and max pp of every move of a generation, indexed by move id. """
+    table = _move_columns.get(gen)
+    if table is None:
+        moves = lib.ids.table(gen, 'moves')
+        table = np.empty((len(moves), 3), dtype=np.float32)
+        for move_id in range(len(moves)):
+            template = lib.templates.move_template_by_id(gen, move_id)
+            table[move_id] = (template.power, template.accuracy, template.pp_max)
+        table = _move_columns[gen] = table
+    return table
+
+
+# Columns of the per side values gathered by `_gather_side`
+_STATS = slice(3, 8)
+_BOOSTS = slice(8, 13)
+_RECHARGE = 13
+_STATUS = 14
+_SPECIES = 15
+_MOVE_IDS = slice(16, 20)
+_MOVE_PPS = slice(20, 24)
+_GATHERED = 24
+
+
+def _gather_side(g, idx: int) -> list:
+    """ Returns the values of the active pokemon of a player needed by `normalize_batch`, in the columns above. """
+    player = g.players[idx]
+    active = player.get_active()
+    boosts = player.boosts
+    moves = list(active.moves.values())[:4]
+    values = [len(g.players[idx-1].team), len(active.moves), active.level,
+              active.atk, active.defense, active.spa, active.spd, active.spe,
+              boosts['atk'], boosts['def'], boosts['spa'], boosts['spd'], boosts['spe'],
+              active.mustrecharge, active.status.bits, active.template.id]
+    values.extend(mv.template.id for mv in moves)
+    values.extend(0 for _ in range(4 - len(moves)))
+    values.extend(mv.pp for mv in moves)
+    values.extend(0 for _ in range(4 - len(moves)))
+    return values
+
+
+def _fill_side(out, gen: str, side: np.ndarray, turns: np.ndarray):
+    """ Writes the columns of one side for rows of the same generation, in the order of `_SIDE_FEATURES`. """
+    stats = side[:, _STATS]
+    boosts = side[:, _BOOSTS]
+    out[:, 0] = side[:, 0] / 6
+    out[:, 1] = side[:, 1] / 4
+    out[:, 2] = (side[:, 2] - MIN_LEVEL) / (100 - MIN_LEVEL)
+    out[:, 3:8] = stats / 350
+    out[:, 8:13] = boosts * stats / 1500
+    out[:, 13:18] = (boosts + 6) / 12
+    out[:, 18] = side[:, _RECHARGE] + 2 > turns
+    bits = side[:, _STATUS].astype(np.int64)
+    # The statuses of STATUS have the first bits of a StatusSet in the same order
+    for bit in range(len(STATUS)):
+        out[:, 19 + bit] = bits >> bit & 1
+    offset = 19 + len(STATUS)
+    out[:, offset:offset + len(TYPES)] = _species_table(gen)[side[:, _SPECIES].astype(np.int64)]
+    offset += len(TYPES)
+
+    moves = _move_table(gen)[side[:, _MOVE_IDS].astype(np.int64)]
+    known = np.arange(4) < side[:, 1:2]
+    pp_max = moves[:, :, 2]
+    pp = np.divide(side[:, _MOVE_PPS], pp_max, out=np.zeros_like(pp_max), where=pp_max != 0)
+    values = np.stack((moves[:, :, 0], pp, moves[:, :, 1]), axis=2) * known[:, :, None]
+    out[:, offset:offset + 12] = values.reshape(-1, 12)
+
+
+def normalize_batch(gamestates, player_idxs, out=None):
+    """
+    Normalizes many gamestates at once into the rows of a 2-D array, in the
+    same layout as `normalize_array`. The values of every gamestate are
+    gathered in a single pass, and the columns that only depend on the
+    species and the moves, like the types, the power and the accuracy, are
+    read from tables built once per generation from the dex.
+
+    Args:
+        gamestates: The gamestates, where both players have an active pokemon.
+        player_idxs: The index of the player whose perspective is used for each gamestate, or one index for all of them.
+        out (numpy.ndarray): A float32 array of shape (len(gamestates), N_FEATURES) to write into.
+
+    Returns:
+        numpy.ndarray: The array with one row per gamestate, indexed by INDEX.
+    """
+    gamestates = list(gamestates)
+    if isinstance(player_idxs, int):
+        player_idxs = [player_idxs] * len(gamestates)
+    if out is None:
+        out = np.empty((len(gamestates), N_FEATURES), dtype=np.float32)
+
+    rows = {}
+    for row, (g, pi) in enumerate(zip(gamestates, player_idxs)):
+        rows.setdefault(g.gen, []).append((row, g, pi))
+
+    for gen, batch in rows.items():
+        index = np.array([row for row, _, _ in batch])
+        turns = np.array([g.turn for _, g, _ in batch], dtype=np.float64)
+        sides = np.array([[_gather_side(g, pi), _gather_side(g, pi ^ 1)] for _, g, pi in batch], dtype=np.float64)
+        sides = sides.reshape(len(batch), 2, _GATHERED)
+        block = np.zeros((len(batch), N_FEATURES), dtype=np.float32)
+        block[:, 0] = sides[:, 0, 7] >= sides[:, 1, 7]
+        for side in range(2):
+            offset = 1 + side * len(_SIDE_FEATURES)
+            _fill_side(block[:, offset:offset + len(_SIDE_FEATURES)], gen, sides[:, side], turns)
+        out[index] = block
+    return out
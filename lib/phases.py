@@ -0,0 +1,79 @@
+"""
+Optional timing of the phases of the local battle loop, used to find out where
+the time of a slow run goes. The phases are:
+
+    simulate
+        Waiting on the simulator to send the next part of the battle stream.
+    parse
+        Parsing protocol lines in `GameState.parse`.
+    choose
+        Deciding on moves in the bot files.
+    normalize
+        Normalizing gamestates for the replays with `lib.normalizer.normalize`.
+    send
+        Logging and writing commands to the simulator.
+
+The runners only hold a PhaseTimer when profiling is turned on, and otherwise
+skip the timing entirely.
+"""
+
+PHASES = ('simulate', 'parse', 'choose', 'normalize', 'send')
+
+
+class PhaseTimer():
+    """
+    The PhaseTimer class accumulates the wall time and the number of calls of
+    each phase.
+
+    Args:
+        battles (int): Number of battles the timer starts out covering.
+
+    Attributes:
+        seconds (dict): Total wall time in seconds of each phase.
+        calls (dict): Number of times each phase was timed.
+        battles (int): Number of battles covered by the timer.
+    """
+    def __init__(self, battles: int = 0):
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.calls = dict.fromkeys(PHASES, 0)
+        self.battles = battles
+
+    def add(self, phase: str, seconds: float):
+        """
+        Adds one timed call of a phase.
+
+        Args:
+            phase (str): Name of the phase as listed in PHASES.
+            seconds (float): Wall time taken by the call.
+        """
+        self.seconds[phase] += seconds
+        self.calls[phase] += 1
+
+    def merge(self, other):
+        """
+        Adds the timings of another PhaseTimer to this one.
+
+        Args:
+            other (PhaseTimer): The timer to add.
+        """
+        for phase in PHASES:
+            self.seconds[phase] += other.seconds[phase]
+            self.calls[phase] += other.calls[phase]
+        self.battles += other.battles
+
+    def to_dict(self) -> dict:
+        """ Returns the timings as a json serializable dict. """
+        return {"battles": self.battles, "seconds": dict(self.seconds), "calls": dict(self.calls)}
+
+    def summary(self) -> str:
+        """ Returns a table of the total, per battle and per call time of each phase. """
+        battles = max(self.battles, 1)
+        total = sum(self.seconds.values()) or 1
+        lines = ['%-10s %10s %10s %8s %14s %14s' % ('phase', 'calls', 'seconds', 'share', 'ms/battle', 'us/call')]
+        for phase in PHASES:
+            seconds = self.seconds[phase]
+            calls = self.calls[phase]
+            lines.append('%-10s %10d %10.3f %7.1f%% %14.3f %14.3f' % (
+                phase, calls, seconds, 100 * seconds / total,
+                1000 * seconds / battles, 1e6 * seconds / calls if calls else 0))
+        return '\n'.join(lines)
@@ -0,0 +1,89 @@
+"""
+This module tokenizes Pokemon-Showdown protocol lines and decodes the fields
+found within them, like the `p1a: Magikarp` idents, the `Magikarp, L89`
+details and the `100/200 slp` conditions.
+
+Every protocol line a bot receives goes through here, so the decoders are
+written with plain string operations rather than regular expressions, and the
+standardized names are cached since the same few hundred names come up over
+and over again.
+"""
+
+import re
+import sys
+
+MAX_CACHED_NAMES = 1 << 16
+
+_non_alphanumeric = re.compile(r"[^a-zA-Z0-9]")
+_standardized = {}
+
+
+def tokenize(line: str) -> (str, list):
+    """
+    Splits a protocol line like `|move|p1a: Magikarp|Splash` into its action
+    and its arguments.
+
+    Args:
+        line (str): Line sent by the simulator, with or without the trailing newline.
+
+    Returns:
+        (str, list): The action like `move` and the list of its arguments.
+    """
+    args = line.strip()[1:].split('|')
+    return args[0], args[1:]
+
+
+def standardize_string(string: str) -> str:
+    """
+    Standardizes a given input string such as the name of a pokemon or the
+    name of a move. The standardization consists of striping all
+    non-alphanumeric characters and making the string all lower case.
+
+    Args:
+        string (str): input name of a pokemon / move
+
+    Returns:
+        str: the standardized and sanitized string
+    """
+    standardized = _standardized.get(string)
+    if standardized is None:
+        if len(_standardized) >= MAX_CACHED_NAMES:
+            _standardized.clear()
+        standardized = sys.intern(_non_alphanumeric.sub("", string).lower())
+        _standardized[string] = standardized
+    return standardized
+
+
+def read_ident(ident_string: str) -> (int, str, str):
+    """
+    Reads a string like "p1a: Magikarp" and returns the relevant data encoded
+    within that string.
+    """
+    colon = ident_string.index(': ')
+    return int(ident_string[1]), ident_string[2:colon], ident_string[colon + 2:]
+
+
+def read_details(detail_string: str) -> (str, int):
+    """
+    Reads a string like "Magikarp, L89" and returns the relevant data encoded
+    within that string. Showdown leaves out the level of level 100 pokemon, in
+    which case the level is 100.
+    """
+    fields = detail_string.split(', ')
+    for field in fields[1:]:
+        if field[:1] == 'L' and field[1:].isdigit():
+            return fields[0], int(field[1:])
+    return fields[0], 100
+
+
+def read_condition(condition_string: str) -> (float, float, bool, set):
+    """
+    Reads a string like "100/200 slp" and returns the relevant data encoded
+    within that string.
+    """
+    hp_string, _, statuses = condition_string.partition(' ')
+    slash = hp_string.find('/')
+    if slash < 0:
+        return 0, 100, statuses == 'fnt' and hp_string.isdigit(), set()
+    maxhp = int(hp_string[slash + 1:])
+    return int(hp_string[:slash]) / maxhp, maxhp, False, set(statuses.split())
@@ -0,0 +1,157 @@
+"""
+This module streams the replay data of battles to disk while they are being
+run, so that the memory used while saving replays doesn't grow with the number
+or the length of the battles.
+
+Each battle is written to its own gzip compressed file with one JSON record
+per line. The records are one of:
+
+    {"type": "log", "line": ...}
+        A line of the public battle log.
+    {"type": "state", "bot": ..., "turn": ..., "gamestate": ..., "norm": ...}
+        The first gamestate of a bot and its normalized version, written at
+        its first decision point.
+    {"type": "delta", "bot": ..., "turn": ..., "gamestate": ..., "norm": ...}
+        The changes to the gamestate of a bot and its normalized version since
+        its previous decision point, in the format of `lib.timeline.diff`.
+    {"type": "result", "winner": ...}
+        The name of the winning bot, or null on a tie.
+
+A saved battle can be turned into the `replay.html` viewer with `render`.
+"""
+
+import gzip
+import json
+from jinja2 import Template
+from lib.timeline import Timeline, diff
+
+
+class ReplayWriter():
+    """
+    The ReplayWriter appends the records of one battle to a compressed file as
+    they come in.
+
+    Args:
+        path (str): Path of the file to write, usually ending in `.jsonl.gz`.
+
+    Attributes:
+        path (str): Path of the file being written.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.file = gzip.open(path, 'wt', encoding='utf8')
+        self._last = dict()
+
+    def _write(self, record: dict):
+        self.file.write(json.dumps(record, skipkeys=True))
+        self.file.write('\n')
+
+    def log(self, line: str):
+        """
+        Appends a line of the public battle log.
+
+        Args:
+            line (str): Line of the battle log including its trailing newline.
+        """
+        self._write({"type": "log", "line": line})
+
+    def snapshot(self, bot_idx: int, gamestate, norm: dict):
+        """
+        Appends the gamestate of a bot and its normalized version. Only the
+        first snapshot of each bot is written in full, and every later one is
+        written as the delta from the previous snapshot of that bot.
+
+        Args:
+            bot_idx (int): Index of the bot within the battle, starting at 1.
+            gamestate (lib.gamestate.GameState): Gamestate of the bot.
+            norm (dict): Normalized gamestate as returned by `lib.normalizer.normalize`.
+        """
+        state = gamestate.to_dict()
+        if bot_idx in self._last:
+            last_state, last_norm = self._last[bot_idx]
+            self._write({"type": "delta", "bot": bot_idx, "turn": gamestate.turn,
+                         "gamestate": diff(last_state, state), "norm": diff(last_norm, norm)})
+        else:
+            self._write({"type": "state", "bot": bot_idx, "turn": gamestate.turn,
+                         "gamestate": state, "norm": norm})
+        self._last[bot_idx] = (state, norm)
+
+    def result(self, winner: str):
+        """
+        Appends the result of the battle.
+
+        Args:
+            winner (str): Name of the winning bot, or None on a tie.
+        """
+        self._write({"type": "result", "winner": winner})
+
+    def close(self):
+        """ Flushes and closes the file. """
+        self.file.close()
+
+
+def read(path: str):
+    """
+    Reads the records of a battle saved by a ReplayWriter one at a time.
+
+    Args:
+        path (str): Path of the saved battle.
+
+    Yields:
+        dict: Each record in the order it was written.
+    """
+    with gzip.open(path, 'rt', encoding='utf8') as replay_file:
+        for line in replay_file:
+            yield json.loads(line)
+
+
+def timelines(path: str) -> (list, dict, dict):
+    """
+    Reads a battle saved by a ReplayWriter back into timelines.
+
+    Args:
+        path (str): Path of the saved battle.
+
+    Returns:
+        (list, dict, dict):
+            The lines of the public battle log, and the gamestate and
+            normalized gamestate timelines keyed by bot index.
+    """
+    log = []
+    gamestates = dict()
+    norms = dict()
+    for record in read(path):
+        if record["type"] == "log":
+            log.append(record["line"])
+        elif record["type"] == "state":
+            gamestates[record["bot"]] = Timeline(record["gamestate"])
+            norms[record["bot"]] = Timeline(record["norm"])
+        elif record["type"] == "delta":
+            gamestates[record["bot"]].append(record["gamestate"])
+            norms[record["bot"]].append(record["norm"])
+    return log, gamestates, norms
+
+
+def render(path: str, output: str = './replay.html', template: str = './web/replay.html.tmpl'):
+    """
+    Renders a battle saved by a ReplayWriter to the html replay viewer. The
+    gamestates are embedded as timelines, which the viewer rebuilds as it
+    steps through them.
+
+    Args:
+        path (str): Path of the saved battle.
+        output (str): Path of the html file to write.
+        template (str): Path of the jinja template of the viewer.
+    """
+    log, gamestates, norms = timelines(path)
+
+    data = dict()
+    data["log"] = "".join(log)
+    for i in gamestates:
+        data["bot"+str(i)] = json.dumps(gamestates[i].to_dict())
+        data["bot"+str(i)+"_norm"] = json.dumps(norms[i].to_dict())
+
+    with open(template, "r") as template_file:
+        template = Template(template_file.read())
+    with open(output, "w") as output_file:
+        output_file.write(template.render(data))
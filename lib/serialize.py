@@ -0,0 +1,194 @@
+"""
+This module encodes gamestates into a compact binary format that can be
+loaded back into an equal GameState, for storing large numbers of snapshots.
+
+An encoded gamestate is a header followed by the gamestate as a tree of
+tuples of plain values written with `marshal`:
+
+    magic (4 bytes) | version (uint16, little endian) | marshal data
+
+Moves and species are written as the ids of their templates from `lib.ids`,
+which are looked up again when decoding, so a gamestate can only be decoded
+with the dex it was encoded with. Statuses are written as names since only
+the bits of the major statuses are the same in every process. Gamestates of
+version 1, which wrote the names of the templates instead of their ids, can
+still be decoded. A stream of
+encoded gamestates can be written with `write` and read back with `read`,
+where each gamestate is prefixed by its length.
+"""
+
+import array
+import marshal
+import struct
+
+import lib.gamestate
+import lib.templates
+from lib.gamestate import GameState, Player, Pokemon, Move, StatusSet, Boosts
+
+MAGIC = b'PKGS'
+VERSION = 2
+
+_header = struct.Struct('<4sH')
+_length = struct.Struct('<I')
+
+# Order of the fields within the encoded tuples
+GAMESTATE_FIELDS = ('gametype', 'gen', 'tier', 'player_idx', 'player_name', '_player_list', 'rated', 'result',
+                    'inactive', 'wait', 'started', 'force_switch', 'request_pending', '_player_map', 'turn', 'upkeep',
+                    'move_history')
+POKEMON_FIELDS = ('gen', 'player_idx', 'name', 'faint', 'level', 'maxhp', 'hp_percent', 'base_atk', 'base_def',
+                  'base_spa', 'base_spd', 'base_spe', 'mustrecharge', 'ability', 'item')
+
+
+def _encode_move(move: Move) -> tuple:
+    return (move.gen, move.name, move.pp, move.template.id)
+
+
+def _encode_pokemon(pokemon: Pokemon) -> tuple:
+    transformed_as = pokemon.transformed_as
+    return (tuple(getattr(pokemon, field) for field in POKEMON_FIELDS),
+            pokemon.template.id,
+            tuple((name, _encode_move(move)) for name, move in pokemon.moves.items()),
+            tuple(pokemon.status),
+            None if transformed_as is None else _encode_pokemon(transformed_as))
+
+
+def _encode_player(player: Player) -> tuple:
+    return (player.active,
+            player.boosts.values.tobytes(),
+            tuple(player.volatile_status),
+            tuple((name, _encode_pokemon(pokemon)) for name, pokemon in player.team.items()),
+            tuple((name, _encode_pokemon(pokemon)) for name, pokemon in player.secret.items()),
+            player.is_player,
+            tuple(player.status))
+
+
+def _decode_move(data: tuple, owner) -> Move:
+    move = Move.__new__(Move)
+    move.gen, move.name, move.pp, template = data
+    if type(template) is int:
+        move.template = lib.templates.move_template_by_id(move.gen, template)
+    elif template:
+        move.template = lib.templates.move_template(move.gen, template)
+    else:
+        move.template = lib.templates.DEFAULT_MOVE
+    move._owner = owner
+    return move
+
+
+def _decode_pokemon(data: tuple, owner) -> Pokemon:
+    fields, template, moves, status, transformed_as = data
+    pokemon = Pokemon.__new__(Pokemon)
+    for field, value in zip(POKEMON_FIELDS, fields):
+        setattr(pokemon, field, value)
+    if type(template) is int:
+        pokemon.template = lib.templates.species_template_by_id(pokemon.gen, template)
+    elif template:
+        pokemon.template = lib.templates.species_template(pokemon.gen, template)
+    else:
+        pokemon.template = lib.templates.DEFAULT_SPECIES
+    pokemon.moves = {name: _decode_move(move, owner) for name, move in moves}
+    pokemon._status = StatusSet(status)
+    # Pokemon stored as transformed_as are never changed in place, like the ones made by `Pokemon.clone`
+    pokemon.transformed_as = None if transformed_as is None else _decode_pokemon(transformed_as, None)
+    pokemon.stamp = next(lib.gamestate._stamps)
+    pokemon._owner = owner
+    return pokemon
+
+
+def _decode_player(data: tuple, owner) -> Player:
+    active, boosts, volatile_status, team, secret, is_player, status = data
+    player = Player.__new__(Player)
+    player.active = active
+    player.boosts = Boosts()
+    player.boosts.values = array.array('b', boosts)
+    player.volatile_status = StatusSet(volatile_status)
+    player.team = {name: _decode_pokemon(pokemon, owner) for name, pokemon in team}
+    player.secret = {name: _decode_pokemon(pokemon, owner) for name, pokemon in secret}
+    player.is_player = is_player
+    player._status = StatusSet(status)
+    player.stamp = next(lib.gamestate._stamps)
+    player._owner = owner
+    return player
+
+
+def dumps(gamestate: GameState) -> bytes:
+    """
+    Encodes a gamestate, including its players, pokemon and moves.
+
+    Args:
+        gamestate (lib.gamestate.GameState): The gamestate to encode.
+
+    Returns:
+        bytes: The encoded gamestate.
+    """
+    tree = (tuple(getattr(gamestate, field) for field in GAMESTATE_FIELDS),
+            tuple(_encode_player(player) for player in gamestate.players))
+    return _header.pack(MAGIC, VERSION) + marshal.dumps(tree, 4)
+
+
+def loads(data: bytes) -> GameState:
+    """
+    Decodes a gamestate encoded by `dumps` into a new GameState equal to the
+    one that was encoded.
+
+    Args:
+        data (bytes): The encoded gamestate.
+
+    Returns:
+        lib.gamestate.GameState: The decoded gamestate.
+
+    Raises:
+        ValueError: If the data isn't an encoded gamestate of a supported version.
+    """
+    if len(data) < _header.size:
+        raise ValueError('truncated gamestate')
+    magic, version = _header.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('not an encoded gamestate')
+    if version not in (1, VERSION):
+        raise ValueError(f'unsupported gamestate version: {version}')
+    fields, players = marshal.loads(memoryview(data)[_header.size:])
+
+    gamestate = GameState.__new__(GameState)
+    for field, value in zip(GAMESTATE_FIELDS, fields):
+        setattr(gamestate, field, value)
+    gamestate._token = object()
+    gamestate._undo = []
+    gamestate.players = [_decode_player(player, gamestate._token) for player in players]
+    return gamestate
+
+
+def write(stream, gamestate: GameState):
+    """
+    Appends an encoded gamestate to a binary stream, prefixed by its length.
+
+    Args:
+        stream: A binary file-like object opened for writing.
+        gamestate (lib.gamestate.GameState): The gamestate to write.
+    """
+    data = dumps(gamestate)
+    stream.write(_length.pack(len(data)))
+    stream.write(data)
+
+
+def read(stream):
+    """
+    Reads back the gamestates appended to a binary stream by `write`.
+
+    Args:
+        stream: A binary file-like object opened for reading.
+
+    Yields:
+        lib.gamestate.GameState: Each gamestate in the order it was written.
+    """
+    while True:
+        prefix = stream.read(_length.size)
+        if not prefix:
+            return
+        if len(prefix) < _length.size:
+            raise ValueError('truncated gamestate stream')
+        (length,) = _length.unpack(prefix)
+        data = stream.read(length)
+        if len(data) < length:
+            raise ValueError('truncated gamestate stream')
+        yield loads(data)
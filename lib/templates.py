@@ -0,0 +1,225 @@
+"""
+This module builds immutable move and species templates from the dex. A
+template holds everything about a move or a species that never changes during
+a battle, and is built only once per generation and name, so that every
+`Move` and `Pokemon` of that kind shares the same template and only holds the
+fields that do change, like `pp` and `hp_percent`, itself.
+"""
+
+import collections
+import types
+
+import lib.dex
+import lib.ids
+
+FLAGS = ("authentic", "bite", "bullet", "charge", "contact", "dance", "defrost", "distance", "gravity", "heal",
+         "mirror", "mystery", "nonsky", "powder", "protect", "pulse", "punch", "recharge", "reflectable", "snatch",
+         "sound")
+
+
+class MoveTemplate(collections.namedtuple('MoveTemplate', [
+        'name', 'num', 'id', 'category', 'target', 'type', 'type_id', 'pp_max', 'power', 'accuracy', 'critratio',
+        'status', 'volatile_status', 'status_chance', 'drain', 'recoil', 'heal', 'multihit', 'multihit_multiplier',
+        'priority', 'flags'])):
+    """
+    The static information of a move, as described by the attributes of the
+    same name of `lib.gamestate.Move`, along with the ids of the move and its
+    type as given by `lib.ids`. The flags are a read-only mapping shared by all
+    the moves with the same flags. Templates are never copied, so that
+    copies of a gamestate keep sharing them.
+    """
+    __slots__ = ()
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class SpeciesTemplate(collections.namedtuple('SpeciesTemplate', [
+        'name', 'num', 'id', 'types', 'type_ids', 'type_mask', 'base_hp', 'base_atk', 'base_def', 'base_spa',
+        'base_spd', 'base_spe'])):
+    """
+    The static information of a species, which is its pokedex number, its
+    types and its base stats as listed in the pokedex. The species and its
+    types are also given as ids from `lib.ids`, and `type_mask` has the bit
+    ``1 << type_id`` set for each of its types.
+    """
+    __slots__ = ()
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+_flags = {}
+_moves = {}
+_species = {}
+
+
+def _shared_flags(flags: dict):
+    """ Returns a read-only flags mapping, shared between equal flags. """
+    key = tuple(sorted(flag for flag, value in flags.items() if value))
+    if key not in _flags:
+        data = dict.fromkeys(FLAGS, False)
+        data.update(dict.fromkeys(key, True))
+        _flags[key] = types.MappingProxyType(data)
+    return _flags[key]
+
+
+DEFAULT_MOVE = MoveTemplate(name="", num=0, id=0, category="", target="", type="", type_id=0, pp_max=0, power=100,
+                            accuracy=1, critratio=1, status="", volatile_status="", status_chance="", drain=0,
+                            recoil=0, heal=0, multihit=0, multihit_multiplier=0, priority=0,
+                            flags=_shared_flags({}))
+DEFAULT_SPECIES = SpeciesTemplate(name="", num=0, id=0, types=(), type_ids=(), type_mask=0, base_hp=100,
+                                  base_atk=100, base_def=100, base_spa=100, base_spd=100, base_spe=100)
+
+
+def _build_move(gen: str, name: str) -> MoveTemplate:
+    move = lib.dex.lookup(gen, "Movedex", name)
+    fields = DEFAULT_MOVE._asdict()
+    fields["name"] = name
+    fields["category"] = move["category"]
+    fields["num"] = move["num"]
+    fields["id"] = lib.ids.move_id(gen, name)
+    fields["power"] = move["basePower"]
+    fields["pp_max"] = move["pp"]
+    fields["target"] = move["target"]
+    fields["type"] = move["type"]
+    fields["type_id"] = lib.ids.type_id(gen, move["type"])
+    fields["priority"] = move.get("priority", 0)
+
+    if "critRatio" in move:
+        critmults = []
+
+        gen_num = int(gen[3])
+        if gen_num <= 5:
+            critmults = [0, 16, 8, 4, 3, 2]
+        elif gen_num == 6:
+            critmults = [0, 16, 8, 2, 1]
+        elif gen_num > 6:
+            critmults = [0, 24, 8, 2, 1]
+        fields["critratio"] = 1/critmults[move["critRatio"]]
+
+    if "willCrit" in move:
+        fields["critratio"] = 1
+
+    if "status" in move:
+        fields["status"] = move["status"]
+        fields["status_chance"] = 1
+
+    if "recoil" in move:
+        # Pokemon showdown provides recoil as a fraction
+        fields["recoil"] = move["recoil"][0] / move["recoil"][1]
+
+    if "heal" in move:
+        # Pokemon showdown provides heal as a fraction
+        if int(gen[3]) >= 5:
+            fields["heal"] = move["heal"][0] / move["heal"][1]
+        else:
+            fields["heal"] = 1/2
+
+    if "drain" in move:
+        # Pokemon showdown provides heal as a fraction
+        fields["drain"] = move["drain"][0] / move["drain"][1]
+
+    if "multihit" in move:
+        # Multihit is sometimes represented as a range, in which case it is written in a list.
+        # It is otherwise written as a whole number, which then does not have probability concerns.
+        # Thankfully, the only case where multihit is a range is between 2~5, where there is a
+        # 1/3 probability for 2 or 3 hits and 1/6 probability for 4 or 5 hits. Therefore, this
+        # code only contains an exception for that case
+        if type(move["multihit"]) == list:
+            fields["multihit"] = (2, 5)
+            fields["multihit_multiplier"] = 4/6 + 6/6 + 4/6 + 5/6
+        else:
+            fields["multihit"] = move["multihit"]
+            fields["multihit_multiplier"] = move["multihit"]
+
+    if "secondary" in move:
+        if move["secondary"] and "status" in move["secondary"]:
+            if "status" in move["secondary"]:
+                fields["status"] = move["secondary"]["status"]
+            if "volatileStatus" in move["secondary"]:
+                fields["volatile_status"] = move["secondary"]["volatileStatus"]
+
+            fields["status_chance"] = move["secondary"]["chance"] / 100
+
+    if "secondaries" in move:
+        # Since the first secondary is generally far more important, for now we will only store the first.
+        if move["secondaries"][0] and "status" in move["secondaries"][0]:
+            fields["status"] = move["secondaries"][0]["status"]
+            fields["status_chance"] = move["secondaries"][0]["chance"] / 100
+
+    if "flags" in move:
+        fields["flags"] = _shared_flags(move["flags"])
+
+    if isinstance(move["accuracy"], int):
+        fields["accuracy"] = move["accuracy"] / 100
+    if isinstance(move["accuracy"], bool):
+        fields["accuracy"] = 1
+
+    return MoveTemplate(**fields)
+
+
+def _build_species(gen: str, name: str) -> SpeciesTemplate:
+    pokemon = lib.dex.lookup(gen, "Pokedex", name)
+    stats = pokemon["baseStats"]
+    type_ids = tuple(lib.ids.type_id(gen, type_name) for type_name in pokemon["types"])
+    type_mask = 0
+    for type_id in type_ids:
+        if type_id:
+            type_mask |= 1 << type_id
+    return SpeciesTemplate(name=name, num=pokemon["num"], id=lib.ids.species_id(gen, name),
+                           types=tuple(pokemon["types"]), type_ids=type_ids, type_mask=type_mask,
+                           base_hp=stats["hp"], base_atk=stats["atk"], base_def=stats["def"],
+                           base_spa=stats["spa"], base_spd=stats["spd"], base_spe=stats["spe"])
+
+
+def move_template(gen: str, name: str) -> MoveTemplate:
+    """
+    Returns the template of a move, building it from the movedex the first
+    time the move is looked up in the given generation.
+
+    Args:
+        gen (str): The string representing the gen of the game like ``gen1``.
+        name (str): The standardized name of the move.
+    """
+    table = _moves.setdefault(gen, {})
+    template = table.get(name)
+    if template is None:
+        template = table[name] = _build_move(gen, name)
+    return template
+
+
+def species_template(gen: str, name: str) -> SpeciesTemplate:
+    """
+    Returns the template of a species, building it from the pokedex the first
+    time the species is looked up in the given generation.
+
+    Args:
+        gen (str): The string representing the gen of the game like ``gen1``.
+        name (str): The standardized name of the species.
+    """
+    table = _species.setdefault(gen, {})
+    template = table.get(name)
+    if template is None:
+        template = table[name] = _build_species(gen, name)
+    return template
+
+
+def move_template_by_id(gen: str, move_id: int) -> MoveTemplate:
+    """ Returns the template of a move given its id from `lib.ids`, where id 0 is the default template. """
+    if not move_id:
+        return DEFAULT_MOVE
+    return move_template(gen, lib.ids.table(gen, 'moves').name(move_id))
+
+
+def species_template_by_id(gen: str, species_id: int) -> SpeciesTemplate:
+    """ Returns the template of a species given its id from `lib.ids`, where id 0 is the default template. """
+    if not species_id:
+        return DEFAULT_SPECIES
+    return species_template(gen, lib.ids.table(gen, 'species').name(species_id))
@@ -0,0 +1,161 @@
+"""
+This module delta encodes the history of a gamestate. Instead of storing a
+full copy of the gamestate at every turn, a timeline stores one full base
+snapshot followed by the changes made to it at every later turn, and can
+rebuild the full snapshot at any point from those.
+
+Snapshots are the plain dicts returned by `lib.gamestate.GameState.to_dict`.
+A delta is a list of operations, where each operation is either
+
+    [path, value]
+        Sets the value found at `path` to `value`.
+    [path]
+        Deletes the dict key found at `path`.
+
+and `path` is the list of dict keys and list indices leading to the value,
+like `["players", 0, "boosts", "atk"]`. The same format is read by
+`web/replay.js` to rebuild the gamestates in the replay viewer.
+"""
+
+import copy
+
+
+def diff(old, new, path=None) -> list:
+    """
+    Returns the delta that turns the snapshot `old` into the snapshot `new`.
+    Dicts and lists of the same length are compared item by item, and
+    anything else is replaced as a whole.
+
+    Args:
+        old: The earlier snapshot.
+        new: The later snapshot.
+        path (list): Path of the given values within the snapshot.
+
+    Returns:
+        list: The operations that turn `old` into `new`.
+    """
+    if path is None:
+        path = []
+    if type(old) is dict and type(new) is dict:
+        ops = []
+        for key, value in new.items():
+            if key in old:
+                ops.extend(diff(old[key], value, path + [key]))
+            else:
+                ops.append([path + [key], value])
+        for key in old:
+            if key not in new:
+                ops.append([path + [key]])
+        return ops
+    if type(old) is list and type(new) is list and len(old) == len(new):
+        ops = []
+        for i, (old_value, new_value) in enumerate(zip(old, new)):
+            ops.extend(diff(old_value, new_value, path + [i]))
+        return ops
+    if type(old) is type(new) and old == new:
+        return []
+    return [[path, new]]
+
+
+def patch(state, delta: list):
+    """
+    Applies a delta to a snapshot in place. The values set by the delta are
+    copied, so that the delta can be applied again later.
+
+    Args:
+        state: The snapshot the delta was computed from.
+        delta (list): The operations returned by `diff`.
+
+    Returns:
+        The patched snapshot, which is only a different object from `state`
+        if the delta replaced it as a whole.
+    """
+    for op in delta:
+        path = op[0]
+        if not path:
+            state = copy.deepcopy(op[1])
+            continue
+        target = state
+        for key in path[:-1]:
+            target = target[key]
+        if len(op) > 1:
+            target[path[-1]] = copy.deepcopy(op[1])
+        else:
+            del target[path[-1]]
+    return state
+
+
+class Timeline():
+    """
+    The Timeline class stores a sequence of snapshots as a base snapshot and
+    the deltas between each consecutive pair of snapshots.
+
+    Args:
+        base: The first snapshot of the timeline, if already known.
+
+    Attributes:
+        base: The first snapshot of the timeline.
+        deltas (list): The delta from each snapshot to the next one.
+    """
+    def __init__(self, base=None):
+        self.base = base
+        self.deltas = []
+        self._last = copy.deepcopy(base)
+        # Whether _last is a private copy that append may patch in place, rather than a snapshot given to record
+        self._last_owned = True
+
+    def __len__(self):
+        if self.base is None:
+            return 0
+        return len(self.deltas) + 1
+
+    def record(self, state):
+        """
+        Appends a snapshot to the timeline. The snapshot must not be modified
+        afterwards.
+
+        Args:
+            state: The snapshot to append.
+        """
+        if self.base is None:
+            self.base = state
+        else:
+            self.deltas.append(diff(self._last, state))
+        self._last = state
+        self._last_owned = False
+
+    def append(self, delta: list):
+        """
+        Appends a snapshot given as the delta from the last snapshot. The
+        last snapshot is patched in place, so appending only costs as much as
+        the delta.
+
+        Args:
+            delta (list): The operations returned by `diff`.
+        """
+        self.deltas.append(delta)
+        if not self._last_owned:
+            self._last = copy.deepcopy(self._last)
+            self._last_owned = True
+        self._last = patch(self._last, delta)
+
+    def state_at(self, idx: int):
+        """
+        Rebuilds the full snapshot at the given position in the timeline.
+
+        Args:
+            idx (int): Position of the snapshot, where 0 is the base snapshot.
+
+        Returns:
+            A new copy of the snapshot.
+        """
+        if idx < 0 or idx >= len(self):
+            raise IndexError(f'timeline index out of range: {idx}')
+        state = copy.deepcopy(self.base)
+        for delta in self.deltas[:idx]:
+            state = patch(state, delta)
+        return state
+
+    def to_dict(self) -> dict:
+        """ Returns the timeline as a json serializable dict. """
+        return {"base": self.base, "deltas": self.deltas}
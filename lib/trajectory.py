@@ -0,0 +1,303 @@
+"""
+This module stores trajectories for training as columns of fixed width
+numpy arrays, so that they can be memory mapped and sampled from without
+loading everything.
+
+A trajectory store is a directory of shards, where each shard is a directory
+holding one ``.npy`` file per column, all with one row per decision:
+
+    features  float32 (rows, lib.normalizer.N_FEATURES)
+                  The gamestate right before the decision as given by `lib.normalizer.normalize_array`.
+    action    int8    (rows,)
+                  The decision as an index into the actions, or -1 if it isn't known.
+    mask      bool    (rows, N_ACTIONS)
+                  Which actions were legal, as far as the gamestate tells.
+    reward    float32 (rows,)
+                  The result of the battle for the deciding player, 1 for a win, -1 for a loss and 0 otherwise.
+    battle    int64   (rows,)
+                  Id of the battle the decision was made in, as given by `battle_id`.
+    player    int8    (rows,)
+                  Index of the deciding player, where p1 is 0.
+    turn      int32   (rows,)
+                  The turn of the decision.
+
+The actions are the four move slots of the active pokemon followed by the six
+slots of the team, like the choices ``move 1`` through ``move 4`` and
+``switch 1`` through ``switch 6``.
+
+Each shard is written to a temporary directory that is renamed into place
+once it is complete, so readers never see a partial shard and several
+processes can write to the same store at once, as long as they give their
+shards different names.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+import lib.normalizer
+
+LOGGER = logging.getLogger("pokemon-ai.trajectory")
+
+N_MOVES = 4
+N_SWITCHES = 6
+N_ACTIONS = N_MOVES + N_SWITCHES
+
+# The dtype and the width of each column, where a width of None is a single value per row
+COLUMNS = {
+    "features": (np.float32, lib.normalizer.N_FEATURES),
+    "action": (np.int8, None),
+    "mask": (np.bool_, N_ACTIONS),
+    "reward": (np.float32, None),
+    "battle": (np.int64, None),
+    "player": (np.int8, None),
+    "turn": (np.int32, None),
+}
+
+
+def battle_id(name: str) -> int:
+    """ Returns the id of a battle, which is a stable 63 bit hash of its name. """
+    digest = hashlib.blake2b(name.encode('utf8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') >> 1
+
+
+def action_id(choice: str) -> int:
+    """
+    Returns the action of a choice like ``move 1`` or ``switch 3``, or -1 if
+    it is neither.
+    """
+    parts = choice.split()
+    if len(parts) < 2 or not parts[1].isdigit():
+        return -1
+    slot = int(parts[1]) - 1
+    if parts[0] == 'move' and 0 <= slot < N_MOVES:
+        return slot
+    if parts[0] == 'switch' and 0 <= slot < N_SWITCHES:
+        return N_MOVES + slot
+    return -1
+
+
+def legal_mask(gamestate, player_idx: int, secret: bool = True) -> np.ndarray:
+    """
+    Returns the actions a player can take in a gamestate, as far as it tells.
+    Every known move of the active pokemon can be used unless a switch is
+    forced, and every pokemon of the team that isn't active or fainted can
+    be switched in.
+
+    Args:
+        gamestate (lib.gamestate.GameState): The gamestate of the decision.
+        player_idx (int): Index of the deciding player.
+        secret (bool):
+            Whether to read the team sent in the requests, which is in the
+            order of the switch choices, rather than the team seen so far.
+    """
+    mask = np.zeros(N_ACTIONS, dtype=np.bool_)
+    player = gamestate.players[player_idx]
+    team = player.secret if secret and player.secret else player.team
+    active = team.get(player.active)
+    if active is not None and not (secret and gamestate.force_switch):
+        mask[:min(len(active.moves), N_MOVES)] = True
+    for slot, (name, pokemon) in enumerate(list(team.items())[:N_SWITCHES]):
+        mask[N_MOVES + slot] = name != player.active and not pokemon.faint
+    return mask
+
+
+def write_shard(path: str, name: str, columns: dict) -> str:
+    """
+    Writes one shard into a store, replacing any shard of the same name.
+    A temporary directory left over by a writer that crashed is cleared
+    first. Readers that already opened a replaced shard keep reading the
+    old one.
+
+    Args:
+        path (str): Directory of the store.
+        name (str): Name of the shard, unique within the store.
+        columns (dict): An array for each of COLUMNS, all with the same number of rows.
+
+    Returns:
+        str: The directory of the shard.
+    """
+    rows = len(columns["action"])
+    shard_dir = os.path.join(path, f'shard-{name}')
+    tmp_dir = f'{shard_dir}.tmp'
+    if os.path.isdir(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    for column, (dtype, width) in COLUMNS.items():
+        array = np.asarray(columns[column], dtype=dtype)
+        shape = (rows,) if width is None else (rows, width)
+        if array.shape != shape:
+            raise ValueError(f'column {column} has shape {array.shape} instead of {shape}')
+        np.save(os.path.join(tmp_dir, f'{column}.npy'), array)
+    if os.path.isdir(shard_dir):
+        # A directory can only be renamed over an empty one, so the old shard is moved out of the way first
+        old_dir = f'{shard_dir}.old'
+        if os.path.isdir(old_dir):
+            shutil.rmtree(old_dir)
+        os.replace(shard_dir, old_dir)
+        os.replace(tmp_dir, shard_dir)
+        shutil.rmtree(old_dir)
+    else:
+        os.replace(tmp_dir, shard_dir)
+    return shard_dir
+
+
+class TrajectoryWriter():
+    """
+    Appends the decisions of battles to a store, buffering them in memory
+    until there are enough of them for a shard.
+
+    Args:
+        path (str): Directory of the store, created if it doesn't exist.
+        shard_size (int): Number of rows buffered before they are written as a shard.
+        prefix (str):
+            Prefix of the names of the shards and of the battles written by
+            this writer, which has to be unique between writers of the same
+            store. A random one is used if it isn't given.
+
+    Attributes:
+        rows (int): Number of rows written so far, including the buffered ones.
+        shards (list): Directories of the shards written so far.
+    """
+    def __init__(self, path: str, shard_size: int = 65536, prefix: str = None):
+        self.path = path
+        self.shard_size = shard_size
+        self.prefix = uuid.uuid4().hex[:12] if prefix is None else prefix
+        self.rows = 0
+        self.shards = []
+        self._buffer = {column: [] for column in COLUMNS}
+        self._buffered = 0
+        os.makedirs(path, exist_ok=True)
+
+    def append(self, battle: str, player: int, turns, features, actions, masks, reward: float):
+        """
+        Appends the decisions of one player in one battle.
+
+        Args:
+            battle (str): Name of the battle, which is made unique to this writer by its prefix.
+            player (int): Index of the deciding player.
+            turns: The turn of each decision.
+            features: The features of each decision, as an array of shape (decisions, N_FEATURES).
+            actions: The action of each decision.
+            masks: The legal actions of each decision, as an array of shape (decisions, N_ACTIONS).
+            reward (float): The result of the battle for the player.
+        """
+        count = len(actions)
+        if not count:
+            return
+        self._buffer["features"].append(np.asarray(features, dtype=np.float32).reshape(count, -1))
+        self._buffer["action"].append(np.asarray(actions, dtype=np.int8))
+        self._buffer["mask"].append(np.asarray(masks, dtype=np.bool_).reshape(count, N_ACTIONS))
+        self._buffer["reward"].append(np.full(count, reward, dtype=np.float32))
+        self._buffer["battle"].append(np.full(count, battle_id(self.prefix + battle), dtype=np.int64))
+        self._buffer["player"].append(np.full(count, player, dtype=np.int8))
+        self._buffer["turn"].append(np.asarray(turns, dtype=np.int32))
+        self._buffered += count
+        self.rows += count
+        if self._buffered >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        """ Writes the buffered rows as a new shard. """
+        if not self._buffered:
+            return
+        columns = {column: np.concatenate(arrays) for column, arrays in self._buffer.items()}
+        name = f'{self.prefix}-{len(self.shards):06d}' if self.prefix else f'{len(self.shards):06d}'
+        self.shards.append(write_shard(self.path, name, columns))
+        LOGGER.debug("Wrote %d rows to %s", self._buffered, self.shards[-1])
+        self._buffer = {column: [] for column in COLUMNS}
+        self._buffered = 0
+
+    def close(self):
+        """ Writes the rows that are still buffered. """
+        self.flush()
+
+
+class TrajectoryStore():
+    """
+    Reads the shards of a store as memory mapped arrays. Only the shards that
+    were complete when the store was opened are read.
+
+    Args:
+        path (str): Directory of the store.
+        names (list):
+            Optional names of the shard directories to read, like the `names`
+            of another store over the same directory, so that several
+            processes can agree on the rows of a store that is still being
+            written to.
+
+    Attributes:
+        names (list): Names of the shard directories that are read, in order.
+        shards (list): The columns of each shard as a dict of memory mapped arrays.
+        offsets (numpy.ndarray): The index of the first row of each shard, followed by the total number of rows.
+    """
+    def __init__(self, path: str, names: list = None):
+        self.path = path
+        if names is None:
+            entries = sorted(os.listdir(path)) if os.path.isdir(path) else []
+            names = [entry for entry in entries if entry.startswith('shard-') and not entry.endswith(('.tmp', '.old'))]
+        self.names = list(names)
+        self.shards = []
+        for name in self.names:
+            shard_dir = os.path.join(path, name)
+            self.shards.append({column: np.load(os.path.join(shard_dir, f'{column}.npy'), mmap_mode='r')
+                                for column in COLUMNS})
+        self.offsets = np.cumsum([0] + [len(shard["action"]) for shard in self.shards])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def rows(self, index, columns=None, out: dict = None) -> dict:
+        """
+        Returns some rows of the store, reading only the pages they are on.
+
+        Args:
+            index: Indices of the rows across the whole store.
+            columns: Names of the columns to read, all of COLUMNS by default.
+            out (dict):
+                Optional arrays to write the rows of each column to, which
+                must have the shape and the dtype of the returned arrays.
+
+        Returns:
+            dict: A contiguous array for each column, with the rows in the order of `index`.
+        """
+        index = np.asarray(index, dtype=np.int64)
+        if index.size and (index.min() < 0 or index.max() >= len(self)):
+            raise IndexError('row index out of range')
+        columns = list(COLUMNS) if columns is None else list(columns)
+        batch = {}
+        for column in columns:
+            dtype, width = COLUMNS[column]
+            shape = index.shape if width is None else index.shape + (width,)
+            if out is not None:
+                batch[column] = out[column]
+                if batch[column].shape != shape or batch[column].dtype != dtype:
+                    raise ValueError(f'out[{column!r}] must be {np.dtype(dtype)} of shape {shape}')
+            else:
+                batch[column] = np.empty(shape, dtype=dtype)
+        shard_of = np.searchsorted(self.offsets, index, side='right') - 1
+        for shard_idx in np.unique(shard_of):
+            positions = np.nonzero(shard_of == shard_idx)[0]
+            local = index[positions] - self.offsets[shard_idx]
+            order = np.argsort(local)
+            shard = self.shards[shard_idx]
+            for column in columns:
+                # Reading the rows of a shard in order keeps the reads sequential
+                batch[column][positions[order]] = shard[column][local[order]]
+        return batch
+
+    def sample(self, size: int, rng: np.random.Generator = None) -> dict:
+        """
+        Returns rows picked uniformly at random, with replacement, from the
+        whole store, in the layout of `rows`.
+
+        Args:
+            size (int): Number of rows.
+            rng (numpy.random.Generator): The random generator to use.
+        """
+        rng = rng or np.random.default_rng()
+        return self.rows(rng.integers(0, len(self), size))
@@ -0,0 +1,174 @@
+"""
+This module builds the type effectiveness of each generation from the
+`TypeChart` table of the dex into dense numpy arrays indexed by the ids of
+`lib.ids`, so that matchups can be read by indexing instead of walking the
+dex every time.
+
+Showdown describes the type chart from the point of view of the defending
+type, where ``damageTaken[attacking type]`` is one of the codes
+
+    0 => normal damage (x1)
+    1 => super effective (x2)
+    2 => resisted (x0.5)
+    3 => immune (x0)
+
+and every other key of ``damageTaken``, like weather or statuses, is ignored.
+Id 0, which stands for an unknown type, species or move, is always neutral.
+
+Every array is built the first time it is needed for a generation, kept for
+the life of the process and marked read-only, since it is shared by all its
+users.
+"""
+
+import numpy as np
+
+import lib.dex
+import lib.ids
+
+_multipliers = {0: 1, 1: 2, 2: 0.5, 3: 0}
+
+_charts = {}
+_species_types = {}
+_type_vs_species = {}
+_move_vs_species = {}
+_species_vs_species = {}
+
+
+def _frozen(array: np.ndarray) -> np.ndarray:
+    array.flags.writeable = False
+    return array
+
+
+def type_chart(gen: str) -> np.ndarray:
+    """
+    Returns the type chart of a generation.
+
+    Args:
+        gen (str): The string representing the gen of the dex like ``gen1``.
+
+    Returns:
+        numpy.ndarray:
+            A float32 array where ``chart[attacking type id, defending type id]``
+            is the damage multiplier of the attacking type against the
+            defending type.
+    """
+    chart = _charts.get(gen)
+    if chart is None:
+        types = lib.ids.table(gen, 'types')
+        chart = np.ones((len(types), len(types)), dtype=np.float32)
+        for defending, entry in lib.dex.dexes[gen]['TypeChart'].items():
+            defending_id = types.id(defending)
+            for attacking, code in entry['damageTaken'].items():
+                attacking_id = types.id(attacking)
+                if attacking_id and defending_id:
+                    chart[attacking_id, defending_id] = _multipliers[code]
+        chart = _charts[gen] = _frozen(chart)
+    return chart
+
+
+def species_types(gen: str) -> np.ndarray:
+    """
+    Returns the type ids of every species of a generation.
+
+    Args:
+        gen (str): The string representing the gen of the dex like ``gen1``.
+
+    Returns:
+        numpy.ndarray:
+            An int array of shape (number of species, 2) holding the type ids
+            of each species by species id, where the second type of a species
+            with a single type is 0.
+    """
+    array = _species_types.get(gen)
+    if array is None:
+        species = lib.ids.table(gen, 'species')
+        types = lib.ids.table(gen, 'types')
+        pokedex = lib.dex.dexes[gen]['Pokedex']
+        array = np.zeros((len(species), 2), dtype=np.int32)
+        for species_id in range(1, len(species)):
+            for idx, name in enumerate(pokedex[species.name(species_id)]['types'][:2]):
+                array[species_id, idx] = types.id(name)
+        array = _species_types[gen] = _frozen(array)
+    return array
+
+
+def type_vs_species(gen: str) -> np.ndarray:
+    """
+    Returns the damage multiplier of every type against every species of a
+    generation, which is the product of its multipliers against each type of
+    the species.
+
+    Args:
+        gen (str): The string representing the gen of the dex like ``gen1``.
+
+    Returns:
+        numpy.ndarray: A float32 array indexed by ``[type id, species id]``.
+    """
+    array = _type_vs_species.get(gen)
+    if array is None:
+        chart = type_chart(gen)
+        types = species_types(gen)
+        array = _type_vs_species[gen] = _frozen(chart[:, types[:, 0]] * chart[:, types[:, 1]])
+    return array
+
+
+def move_vs_species(gen: str) -> np.ndarray:
+    """
+    Returns the type effectiveness of every move against every species of a
+    generation. Only the type of the move is taken into account, so status
+    moves get a multiplier like any other move of their type.
+
+    Args:
+        gen (str): The string representing the gen of the dex like ``gen1``.
+
+    Returns:
+        numpy.ndarray: A float32 array indexed by ``[move id, species id]``.
+    """
+    array = _move_vs_species.get(gen)
+    if array is None:
+        moves = lib.ids.table(gen, 'moves')
+        types = lib.ids.table(gen, 'types')
+        movedex = lib.dex.dexes[gen]['Movedex']
+        move_types = np.zeros(len(moves), dtype=np.int32)
+        for move_id in range(1, len(moves)):
+            move_types[move_id] = types.id(movedex[moves.name(move_id)]['type'])
+        array = _move_vs_species[gen] = _frozen(type_vs_species(gen)[move_types])
+    return array
+
+
+def species_vs_species(gen: str) -> np.ndarray:
+    """
+    Returns the best type effectiveness every species has against every
+    other species of a generation, which is the best multiplier of the
+    types of the attacking species, as used by moves that get the same type
+    attack bonus, against the defending species.
+
+    Args:
+        gen (str): The string representing the gen of the dex like ``gen1``.
+
+    Returns:
+        numpy.ndarray: A float32 array indexed by ``[attacking species id, defending species id]``.
+    """
+    array = _species_vs_species.get(gen)
+    if array is None:
+        types = species_types(gen)
+        # A single typed species attacks with its first type only
+        second = np.where(types[:, 1] != 0, types[:, 1], types[:, 0])
+        matchups = type_vs_species(gen)
+        array = _species_vs_species[gen] = _frozen(np.maximum(matchups[types[:, 0]], matchups[second]))
+    return array
+
+
+def effectiveness(move, pokemon) -> float:
+    """
+    Returns the type effectiveness of a move against a pokemon.
+
+    Args:
+        move (lib.gamestate.Move): The move being used.
+        pokemon (lib.gamestate.Pokemon): The pokemon being hit.
+    """
+    chart = type_chart(move.gen)
+    multiplier = 1.0
+    for type_id in pokemon.type_ids:
+        multiplier *= float(chart[move.type_id, type_id])
+    return multiplier
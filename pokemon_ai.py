@@ -8,9 +8,13 @@ import sys
 import logging
 import coloredlogs
 
+import lib.bench
+import lib.dataset
 import lib.bots
 import lib.showdown
 import lib.local
+import lib.multiplex
+import lib.replay
 
 LOGGER = logging.getLogger('pokemon-ai')
 
@@ -24,16 +28,31 @@ def main():
     parser = argparse.ArgumentParser(
         description="Connect bots locally or externally on showdown."
     )
-    parser.add_argument('command', type=str, choices=['showdown', 'local'])
+    parser.add_argument('command', type=str, choices=['showdown', 'local', 'replay', 'bench', 'dataset'])
     parser.add_argument('--gen', default='gen1', type=str)
     parser.add_argument('--num', default=1, type=int)
+    parser.add_argument('--workers', default=1, type=int)
+    parser.add_argument('--concurrency', default=1, type=int)
+    parser.add_argument('--profile-phases', action='store_true')
     parser.add_argument('--name', default=None, type=str)
     parser.add_argument('--bot1', default='default', type=str)
     parser.add_argument('--bot2', default='default', type=str)
     parser.add_argument('--gamemode', default='gen1randombattle', type=str)
     parser.add_argument('--loglevel', default='INFO', type=str)
     parser.add_argument('--savereplay', default=False, type=bool)
+    parser.add_argument('--replaydir', default='replays', type=str)
+    parser.add_argument('--replay', default='replays/battle-0.jsonl.gz', type=str)
     parser.add_argument('--challenge', type=str)
+    parser.add_argument('--suite', default='battles', type=str,
+                        choices=['battles', 'protocol', 'memory', 'serialize', 'loader'])
+    parser.add_argument('--input', default=[], type=str, nargs='*')
+    parser.add_argument('--output', default='bench.json', type=str)
+    parser.add_argument('--db', default='data/data.db', type=str)
+    parser.add_argument('--datadir', default='data/dataset', type=str)
+    parser.add_argument('--shardsize', default=1000, type=int)
+    parser.add_argument('--batchsize', default=1024, type=int)
+    parser.add_argument('--dataformat', default='jsonl', type=str, choices=['jsonl', 'trajectory'])
+    parser.add_argument('--trajectorydir', default=None, type=str)
     args = parser.parse_args(sys.argv[1:])
 
     numeric_level = getattr(logging, args.loglevel.upper())
@@ -41,17 +60,82 @@ def main():
         raise ValueError('invalid log level: %s' % args.loglevel.upper())
     coloredlogs.install(numeric_level)
 
-    if args.command == 'showdown':
-        LOGGER.info("Starting Showdown")
-        bot1 = lib.bots.Bot("p1", args.gen, args.bot1)
-        lib.showdown.Showdown(bot1, name=args.name, challenge=args.challenge)
+    COMMANDS[args.command](args)
 
-    if args.command == 'local':
-        LOGGER.info("Starting Local")
-        bot1 = lib.bots.Bot("b1", args.gen, args.bot1)
-        bot2 = lib.bots.Bot("b2", args.gen, args.bot2)
-        lib.local.Local([bot1, bot2], args.gamemode, args.num, args.savereplay)
 
+def run_showdown(args):
+    """ Connects a bot to showdown. """
+    LOGGER.info("Starting Showdown")
+    bot1 = lib.bots.Bot("p1", args.gen, args.bot1)
+    lib.showdown.Showdown(bot1, name=args.name, challenge=args.challenge)
+
+
+def run_local(args):
+    """ Runs battles between two bots in the local simulator. """
+    LOGGER.info("Starting Local")
+    if args.workers > 1:
+        results, timer = lib.local.run_parallel(args.gen, [args.bot1, args.bot2], args.gamemode, args.num,
+                                                args.workers, args.concurrency, args.savereplay, args.replaydir,
+                                                args.profile_phases, args.trajectorydir)
+    else:
+        if args.concurrency > 1:
+            runner = lib.multiplex.Multiplex(args.gen, [args.bot1, args.bot2], args.gamemode, args.num,
+                                             args.concurrency, args.savereplay, args.replaydir,
+                                             profile_phases=args.profile_phases,
+                                             trajectory_dir=args.trajectorydir)
+        else:
+            bot1 = lib.bots.Bot("b1", args.gen, args.bot1)
+            bot2 = lib.bots.Bot("b2", args.gen, args.bot2)
+            runner = lib.local.Local([bot1, bot2], args.gamemode, args.num, args.savereplay,
+                                     args.replaydir, profile_phases=args.profile_phases,
+                                     trajectory_dir=args.trajectorydir)
+        results, timer = runner.results, runner.timer
+    LOGGER.info("Ties: %d, b1 wins: %d, b2 wins: %d", *results)
+    if timer:
+        print(timer.summary())
+
+
+def run_replay(args):
+    """ Renders a saved replay to replay.html. """
+    LOGGER.info("Rendering %s to replay.html", args.replay)
+    lib.replay.render(args.replay)
+
+
+def run_bench(args):
+    """ Runs one of the benchmark suites and writes its results. """
+    LOGGER.info("Starting Benchmark")
+    if args.suite == 'battles':
+        results = lib.bench.battles(args.gen, [args.bot1, args.bot2], args.gamemode, args.num,
+                                    args.profile_phases)
+    elif args.suite == 'protocol':
+        results = lib.bench.protocol(args.input)
+    elif args.suite == 'memory':
+        results = lib.bench.memory(args.gen, args.input)
+    elif args.suite == 'serialize':
+        results = lib.bench.serialize(args.gen, args.input)
+    elif args.suite == 'loader':
+        results = lib.bench.loader(args.input[0] if args.input else args.trajectorydir, args.batchsize,
+                                   args.workers)
+    lib.bench.write(results, args.output)
+
+
+def run_dataset(args):
+    """ Builds the training dataset from the replay database. """
+    LOGGER.info("Building the %s dataset from %s", args.gamemode, args.db)
+    summary = lib.dataset.build(args.db, args.gamemode, args.datadir, args.workers, args.shardsize,
+                                args.dataformat)
+    LOGGER.info("Built %d shards from %d replays: %d rows, %d failed replays, %.1fs",
+                summary["shards"], summary["replays"], summary["rows"], summary["failed"], summary["seconds"])
+
+
+# The function running each command
+COMMANDS = {
+    'showdown': run_showdown,
+    'local': run_local,
+    'replay': run_replay,
+    'bench': run_bench,
+    'dataset': run_dataset,
+}
 
 if __name__ == '__main__':
     main()
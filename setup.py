@@ -13,7 +13,7 @@ EMAIL = 'youngjinpark20@gmail.com'
 AUTHOR = 'Young Jin Park'
 REQUIRES_PYTHON = '>=3.6.0'
 VERSION = '0.0.1'
-REQUIRED = ['requests', 'websocket']
+REQUIRED = ['requests', 'websocket', 'numpy']
 EXTRAS = {}
 
 here = os.path.abspath(os.path.dirname(__file__))
@@ -0,0 +1,141 @@
+"""
+Shared fixtures of the tests. Instead of the dex generated by `build_dex.js`,
+the tests use a small dex written to a temporary directory, so they can run
+without node or the showdown data.
+"""
+
+import json
+import os
+
+import pytest
+
+import lib.dex
+import lib.ids
+
+TYPES = ['Bug', 'Dragon', 'Electric', 'Fighting', 'Fire', 'Flying', 'Ghost', 'Grass', 'Ground', 'Ice', 'Normal',
+         'Poison', 'Psychic', 'Rock', 'Water']
+
+
+def _species(num, name, types, stats):
+    return {"num": num, "species": name, "types": types,
+            "baseStats": dict(zip(['hp', 'atk', 'def', 'spa', 'spd', 'spe'], stats))}
+
+
+def _move(num, name, power, category, move_type, pp, accuracy=100, **fields):
+    move = {"num": num, "name": name, "basePower": power, "category": category, "type": move_type, "pp": pp,
+            "accuracy": accuracy, "priority": 0, "target": "normal", "flags": {"protect": 1, "mirror": 1},
+            "secondary": None}
+    move.update(fields)
+    return move
+
+
+def make_dex() -> dict:
+    """ Returns a small gen1 dex, whose tables are deliberately not in sorted order. """
+    chart = {name: {"damageTaken": {attacking: 0 for attacking in TYPES}} for name in reversed(TYPES)}
+    chart['Water']['damageTaken']['Electric'] = 1
+    chart['Water']['damageTaken']['Fire'] = 2
+    chart['Ground']['damageTaken']['Electric'] = 3
+    chart['Ground']['damageTaken']['Water'] = 1
+    chart['Rock']['damageTaken']['Water'] = 1
+    chart['Rock']['damageTaken']['Normal'] = 2
+    chart['Normal']['damageTaken']['Ghost'] = 3
+    chart['Fire']['damageTaken']['Water'] = 1
+    chart['Ghost']['damageTaken']['Normal'] = 3
+    chart['Psychic']['damageTaken']['Psychic'] = 2
+    pokedex = {
+        'starmie': _species(121, 'Starmie', ['Water', 'Psychic'], [60, 75, 85, 100, 100, 115]),
+        'pikachu': _species(25, 'Pikachu', ['Electric'], [35, 55, 30, 50, 50, 90]),
+        'rhydon': _species(112, 'Rhydon', ['Ground', 'Rock'], [105, 130, 120, 45, 45, 40]),
+        'nidoranf': _species(29, 'Nidoran-F', ['Poison'], [55, 47, 52, 40, 40, 41]),
+        'gengar': _species(94, 'Gengar', ['Ghost', 'Poison'], [60, 65, 60, 130, 130, 110]),
+    }
+    movedex = {
+        'thunderbolt': _move(85, 'Thunderbolt', 95, 'Special', 'Electric', 15,
+                             secondary={"chance": 10, "status": "par"}),
+        'psychic': _move(94, 'Psychic', 90, 'Special', 'Psychic', 10),
+        'earthquake': _move(89, 'Earthquake', 100, 'Physical', 'Ground', 10),
+        'doubleedge': _move(38, 'Double-Edge', 100, 'Physical', 'Normal', 15, recoil=[25, 100]),
+        'thunderwave': _move(86, 'Thunder Wave', 0, 'Status', 'Electric', 20, status="par"),
+        'surf': _move(57, 'Surf', 95, 'Special', 'Water', 15),
+        'recover': _move(105, 'Recover', 0, 'Status', 'Normal', 20, accuracy=True, heal=[1, 2], target="self"),
+        'quickattack': _move(98, 'Quick Attack', 40, 'Physical', 'Normal', 30, priority=1,
+                             flags={"contact": 1, "protect": 1, "mirror": 1}),
+        'struggle': _move(165, 'Struggle', 50, 'Physical', 'Normal', 1, recoil=[1, 2], flags={}),
+    }
+    return {"Pokedex": pokedex, "Movedex": movedex, "TypeChart": chart}
+
+
+LOG = """\
+|player|p1|Alice|101
+|player|p2|Bob|102
+|gametype|singles
+|gen|1
+|tier|[Gen 1] Random Battle
+|
+|start
+|switch|p1a: Starmie|Starmie, L74|100/100
+|switch|p2a: Pikachu|Pikachu, L88|100/100
+|turn|1
+|move|p1a: Starmie|Surf|p2a: Pikachu
+|-damage|p2a: Pikachu|45/100
+|move|p2a: Pikachu|Thunder Wave|p1a: Starmie
+|-status|p1a: Starmie|par
+|
+|upkeep
+|turn|2
+|switch|p2a: Rhydon|Rhydon, L70|100/100
+|move|p1a: Starmie|Psychic|p2a: Rhydon
+|-damage|p2a: Rhydon|60/100
+|-unboost|p2a: Rhydon|spa|1
+|
+|upkeep
+|turn|3
+|move|p1a: Starmie|Surf|p2a: Rhydon
+|-damage|p2a: Rhydon|0 fnt
+|faint|p2a: Rhydon
+|
+|upkeep
+|switch|p2a: Pikachu|Pikachu, L88|45/100
+|turn|4
+|move|p2a: Pikachu|Thunderbolt|p1a: Starmie
+|-damage|p1a: Starmie|20/100 par
+|move|p1a: Starmie|Recover|p1a: Starmie
+|-heal|p1a: Starmie|70/100 par
+|
+|upkeep
+|turn|5
+|switch|p1a: Nidoran♀|Nidoran-F, L90|100/100
+|move|p2a: Pikachu|Thunderbolt|p1a: Nidoran♀
+|-damage|p1a: Nidoran♀|50/100
+|
+|upkeep
+|turn|6
+|win|Alice
+"""
+
+
+def reset_dex():
+    """ Forgets every dex and id table loaded so far, so the next use loads them again. """
+    lib.dex.dexes.clear()
+    lib.ids._id_tables.clear()
+
+
+@pytest.fixture(scope='session', autouse=True)
+def dex_dir(tmp_path_factory):
+    """ Points `lib.dex` at the dex of `make_dex` for the whole test session. """
+    path = tmp_path_factory.mktemp('dex')
+    with open(os.path.join(path, 'gen1.json'), 'w') as dex_file:
+        json.dump(make_dex(), dex_file)
+    old_dirs = lib.dex.DEX_DIR, lib.dex.CACHE_DIR
+    lib.dex.DEX_DIR = str(path)
+    lib.dex.CACHE_DIR = os.path.join(path, 'cache')
+    reset_dex()
+    yield path
+    lib.dex.DEX_DIR, lib.dex.CACHE_DIR = old_dirs
+    reset_dex()
+
+
+@pytest.fixture
+def log() -> str:
+    """ A short gen1 battle log between Alice as p1 and Bob as p2. """
+    return LOG
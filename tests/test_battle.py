@@ -0,0 +1,142 @@
+import sys
+import types
+
+import pytest
+
+import lib.bots
+from lib.battle import Battle, ask
+
+START = """\
+update
+|player|p1|b1|
+|player|p2|b2|
+|gametype|singles
+|gen|1
+|
+|start
+|switch|p1a: Starmie|Starmie, L74|100/100
+|switch|p2a: Pikachu|Pikachu, L88|100/100
+|turn|1
+
+"""
+
+TURN = """\
+update
+|
+|move|p1a: Starmie|Surf|p2a: Pikachu
+|-damage|p2a: Pikachu|{hp}/100
+|
+|upkeep
+|turn|{turn}
+
+"""
+
+END = """\
+end
+{"winner":"b1","seed":[1,2,3,4],"turns":3,"p1":"b1","p2":"b2"}
+"""
+
+
+def request(player: int, wait: bool = False) -> str:
+    body = '{"wait":true,"rqid":1}' if wait else '{"active":[{"moves":[]}],"rqid":1}'
+    return f'sideupdate\np{player}\n|request|{body}\n\n'
+
+
+def feed(battle: Battle, text: str) -> list:
+    """ Feeds a chunk of the stream to a battle, returning what `feed` returned for each line. """
+    return [battle.feed(line) for line in text.splitlines(keepends=True)]
+
+
+@pytest.fixture
+def bot_files(monkeypatch):
+    """ Adds a bot file that decides in batches and one that doesn't, counting the calls to each. """
+    calls = {'choose_move': 0, 'batched_move': 0, 'choose_many': []}
+
+    def choose_move(gamestate):
+        calls['choose_move'] += 1
+        return {'type': 'switch', 'id': 2}
+
+    def batched_move(gamestate):
+        calls['batched_move'] += 1
+        return {'type': 'move', 'id': 2}
+
+    def choose_many(gamestates):
+        calls['choose_many'].append(len(gamestates))
+        return [{'type': 'move', 'id': 1} for _ in gamestates]
+
+    single = types.ModuleType('ai.gen1.single')
+    single.choose_move = choose_move
+    batched = types.ModuleType('ai.gen1.batched')
+    batched.choose_move = batched_move
+    batched.choose_many = choose_many
+    monkeypatch.setitem(sys.modules, 'ai.gen1.single', single)
+    monkeypatch.setitem(sys.modules, 'ai.gen1.batched', batched)
+    return calls
+
+
+def battle(first: str = 'batched', second: str = 'single') -> Battle:
+    return Battle([lib.bots.Bot('b1', 'gen1', first), lib.bots.Bot('b2', 'gen1', second)])
+
+
+def test_asks_only_after_the_update_that_follows_the_requests(bot_files):
+    game = battle()
+    assert not any(feed(game, request(1) + request(2)))
+    assert game.pending() == [1, 2]
+    fed = feed(game, START)
+    assert fed[-1] and not any(fed[:-1])
+    commands = ask([game])
+    assert commands == [(game, '>p1 move 2'), (game, '>p2 switch 2')]
+    assert game.pending() == []
+    assert ask([game]) == []
+
+
+def test_no_choice_without_a_request(bot_files):
+    game = battle()
+    assert not any(feed(game, START))
+    assert ask([game]) == []
+    assert not any(feed(game, request(1) + request(2, wait=True) + TURN.format(hp=50, turn=2))[:-1])
+    assert game.pending() == [1]
+    assert ask([game]) == [(game, '>p1 move 2')]
+    assert bot_files == {'choose_move': 0, 'batched_move': 1, 'choose_many': []}
+    assert game.decision_sizes == [1]
+
+
+def test_every_request_gets_one_choice(bot_files):
+    game = battle()
+    feed(game, request(1) + request(2) + START)
+    answered = []
+    for turn, hp in ((2, 80), (3, 60)):
+        answered += [command for _, command in ask([game])]
+        assert not any(feed(game, request(2) + TURN.format(hp=hp, turn=turn))[:-1])
+    answered += [command for _, command in ask([game])]
+    assert answered == ['>p1 move 2', '>p2 switch 2', '>p2 switch 2', '>p2 switch 2']
+    assert feed(game, END) == [False, False]
+    assert game.finished and game.result() == 1
+    assert not feed(game, request(1) + TURN.format(hp=10, turn=4))[-1]
+
+
+def test_batches_by_bot_type(bot_files):
+    games = [battle(), battle(), battle('single', 'batched')]
+    for game in games:
+        feed(game, request(1) + request(2) + START)
+    commands = ask(games)
+    assert [(games.index(game), command) for game, command in commands] == [
+        (0, '>p1 move 1'), (0, '>p2 switch 2'), (1, '>p1 move 1'), (1, '>p2 switch 2'),
+        (2, '>p1 switch 2'), (2, '>p2 move 1')]
+    assert bot_files == {'choose_move': 3, 'batched_move': 0, 'choose_many': [3]}
+    assert games[0].decision_sizes == [3, 1]
+    assert games[1].decision_sizes == [1]
+    assert games[2].decision_sizes == [1]
+    assert all(len(game.decision_times) == len(game.decision_sizes) for game in games)
+    assert all(not game.pending() for game in games)
+
+
+def test_choose_many_falls_back_to_choose(bot_files):
+    bots = [lib.bots.Bot(f'b{i}', 'gen1', bot_type) for i, bot_type in enumerate(['single', 'batched', 'single'])]
+    for bot in bots:
+        bot.gamestate.request_pending = True
+    timings = []
+    assert lib.bots.choose_many(bots, timings) == ['switch 2', 'move 2', 'switch 2']
+    assert bot_files == {'choose_move': 2, 'batched_move': 1, 'choose_many': []}
+    assert [idxs for _, idxs in timings] == [[0], [2], [1]]
+    assert not any(bot.gamestate.request_pending for bot in bots)
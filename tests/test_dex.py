@@ -0,0 +1,115 @@
+import json
+import os
+
+import pytest
+
+import lib.dex
+from conftest import make_dex, reset_dex
+
+
+@pytest.fixture
+def dex_dir(tmp_path, monkeypatch):
+    """ Points `lib.dex` at a dex of its own, so that the test can change its files. """
+    with open(tmp_path / 'gen1.json', 'w') as dex_file:
+        json.dump(make_dex(), dex_file)
+    monkeypatch.setattr(lib.dex, 'DEX_DIR', str(tmp_path))
+    monkeypatch.setattr(lib.dex, 'CACHE_DIR', str(tmp_path / 'cache'))
+    reset_dex()
+    yield tmp_path
+    reset_dex()
+
+
+def table_header(name: str = 'Movedex') -> tuple:
+    with open(lib.dex._table_path('gen1', name), 'rb') as table_file:
+        return lib.dex._header.unpack(table_file.read(lib.dex._header.size))
+
+
+def load(name: str = 'Movedex'):
+    """ Loads a table of gen1 again, as a new process would. """
+    reset_dex()
+    return lib.dex.dexes['gen1'][name]
+
+
+def test_table_reads_like_the_json(dex_dir):
+    movedex = make_dex()['Movedex']
+    table = load()
+    assert isinstance(table, lib.dex.Table)
+    assert len(table) == len(movedex)
+    assert list(table) == sorted(movedex)
+    assert dict(table.items()) == json.loads(json.dumps(movedex))
+    assert 'surf' in table and 'splash' not in table and 1 not in table
+    with pytest.raises(KeyError):
+        table['splash']
+    with pytest.raises(KeyError):
+        lib.dex.lookup('gen1', 'Movedex', 'splash')
+    with pytest.raises(KeyError):
+        lib.dex.lookup('gen9', 'Movedex', 'surf')
+
+
+def test_table_is_reused_while_the_json_is_unchanged(dex_dir):
+    load()
+    path = lib.dex._table_path('gen1', 'Movedex')
+    inode = os.stat(path).st_ino
+    assert isinstance(load(), lib.dex.Table)
+    assert os.stat(path).st_ino == inode
+
+
+def test_rewritten_json_rebuilds_the_table(dex_dir):
+    load()
+    dex = make_dex()
+    dex['Movedex']['splash'] = dict(dex['Movedex']['surf'], name='Splash', basePower=0)
+    with open(dex_dir / 'gen1.json', 'w') as dex_file:
+        json.dump(dex, dex_file)
+    assert load()['splash']['name'] == 'Splash'
+    assert table_header()[2:4] == lib.dex._json_stat('gen1')
+
+
+def test_touched_json_rebuilds_the_table(dex_dir):
+    load()
+    stat = os.stat(dex_dir / 'gen1.json')
+    os.utime(dex_dir / 'gen1.json', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert isinstance(load(), lib.dex.Table)
+    assert table_header()[2] == stat.st_mtime_ns + 10 ** 9
+    assert table_header()[3] == stat.st_size
+
+
+def test_version_mismatch_rebuilds_the_table(dex_dir, monkeypatch):
+    load()
+    monkeypatch.setattr(lib.dex, 'VERSION', lib.dex.VERSION + 1)
+    assert load()['surf']['name'] == 'Surf'
+    assert table_header()[1] == lib.dex.VERSION
+
+
+@pytest.mark.parametrize('damage', [
+    lambda data: data[:len(data) // 2],
+    lambda data: data[:lib.dex._header.size],
+    lambda data: data[:5],
+    lambda data: b'',
+    lambda data: data[:lib.dex._header.size] + b'\xff' * (len(data) - lib.dex._header.size),
+    lambda data: data + b'\0',
+])
+def test_damaged_table_is_rebuilt(dex_dir, damage):
+    load()
+    path = lib.dex._table_path('gen1', 'Movedex')
+    with open(path, 'rb') as table_file:
+        data = table_file.read()
+    with open(path, 'wb') as table_file:
+        table_file.write(damage(data))
+    table = load()
+    assert dict(table.items()) == json.loads(json.dumps(make_dex()['Movedex']))
+    with open(path, 'rb') as table_file:
+        assert table_file.read() == data
+
+
+def test_damaged_table_falls_back_to_the_json(dex_dir, monkeypatch):
+    load()
+    with open(lib.dex._table_path('gen1', 'Movedex'), 'r+b') as table_file:
+        table_file.truncate(100)
+
+    def fail(*args):
+        raise OSError('read-only file system')
+
+    monkeypatch.setattr(lib.dex, '_write_table', fail)
+    table = load()
+    assert not isinstance(table, lib.dex.Table)
+    assert table['surf']['name'] == 'Surf'
@@ -0,0 +1,121 @@
+import json
+
+from lib.gamestate import GameState
+
+
+def parse(lines: list, gamestate: GameState = None) -> GameState:
+    if gamestate is None:
+        gamestate = GameState('gen1', None)
+        gamestate.player_idx = 0
+    for line in lines:
+        gamestate.parse(line)
+    return gamestate
+
+
+def state(gamestate: GameState) -> str:
+    return json.dumps(gamestate.to_dict(), sort_keys=True)
+
+
+def split(log: str, marker: str) -> (list, list):
+    lines = log.splitlines()
+    idx = lines.index(marker)
+    return lines[:idx], lines[idx:]
+
+
+def test_clone_is_not_changed_by_parsing_the_original(log):
+    head, tail = split(log, '|turn|3')
+    gamestate = parse(head)
+    before = state(gamestate)
+    clone = gamestate.clone()
+    parse(tail, gamestate)
+    assert state(clone) == before
+    assert state(gamestate) != before
+
+
+def test_original_is_not_changed_by_changing_the_clone(log):
+    head, tail = split(log, '|turn|3')
+    gamestate = parse(head)
+    before = state(gamestate)
+    clone = gamestate.clone()
+    parse(tail + ['|-damage|p1a: Nidoran♀|10/100 par', '|-boost|p2a: Pikachu|atk|2',
+                  '|switch|p2a: Gengar|Gengar, L80|100/100'], clone)
+    assert state(gamestate) == before
+    assert state(clone) != state(parse(tail, parse(head)))
+
+
+def test_clones_of_clones_are_isolated(log):
+    head, tail = split(log, '|turn|3')
+    first = parse(head).clone()
+    second = first.clone()
+    before = state(first)
+    parse(tail + ['|faint|p2a: Pikachu'], second)
+    assert state(first) == before
+
+
+def test_undo_restores_the_state_exactly(log):
+    head, _ = split(log, '|turn|3')
+    gamestate = parse(head)
+    before = state(gamestate)
+    checkpoint = gamestate.checkpoint()
+    gamestate.apply_damage(1, 0.25, status=['brn'])
+    gamestate.apply_status(0, 'slp')
+    gamestate.apply_boost(0, 'spe', -2)
+    gamestate.apply_switch(1, 'gengar', 80)
+    gamestate.apply_boost(1, 'spa', 1)
+    gamestate.apply_faint(1)
+    gamestate.apply_switch(0, 'starmie')
+    assert state(gamestate) != before
+    gamestate.undo(checkpoint)
+    assert state(gamestate) == before
+    assert gamestate.checkpoint() == checkpoint
+
+
+def test_undo_without_checkpoint_reverts_the_last_change(log):
+    head, _ = split(log, '|turn|3')
+    gamestate = parse(head)
+    gamestate.apply_boost(0, 'atk', 1)
+    after_boost = state(gamestate)
+    gamestate.apply_damage(0, 0.5)
+    gamestate.undo()
+    assert state(gamestate) == after_boost
+
+
+def test_undo_on_a_clone_leaves_the_original_alone(log):
+    head, _ = split(log, '|turn|3')
+    gamestate = parse(head)
+    before = state(gamestate)
+    clone = gamestate.clone()
+    checkpoint = clone.checkpoint()
+    clone.apply_switch(1, 'gengar', 80)
+    clone.apply_damage(1, 0.5)
+    clone.undo(checkpoint)
+    assert state(clone) == before
+    assert state(gamestate) == before
+
+
+def test_applying_to_a_clone_leaves_the_original_alone(log):
+    head, _ = split(log, '|turn|3')
+    gamestate = parse(head)
+    before = state(gamestate)
+    clone = gamestate.clone()
+    clone.apply_damage(0, 0.1, status=['par'])
+    clone.apply_boost(1, 'atk', 2)
+    clone.apply_switch(1, 'gengar', 80)
+    clone.apply_faint(1)
+    assert state(gamestate) == before
+
+
+def test_nested_checkpoints(log):
+    head, _ = split(log, '|turn|3')
+    gamestate = parse(head)
+    before = state(gamestate)
+    outer = gamestate.checkpoint()
+    gamestate.apply_damage(0, 0.3)
+    middle = state(gamestate)
+    inner = gamestate.checkpoint()
+    gamestate.apply_switch(1, 'gengar', 80)
+    gamestate.apply_status(1, 'frz')
+    gamestate.undo(inner)
+    assert state(gamestate) == middle
+    gamestate.undo(outer)
+    assert state(gamestate) == before
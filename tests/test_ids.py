@@ -0,0 +1,43 @@
+import shutil
+
+import lib.dex
+import lib.ids
+from conftest import make_dex, reset_dex
+
+
+def id_names() -> dict:
+    return {kind: lib.ids.table('gen1', kind).names for kind in ('species', 'moves', 'types')}
+
+
+def test_ids_follow_the_sorted_names():
+    reset_dex()
+    dex = make_dex()
+    names = id_names()
+    assert names['species'] == ('',) + tuple(sorted(dex['Pokedex']))
+    assert names['moves'] == ('',) + tuple(sorted(dex['Movedex']))
+    assert names['types'] == ('',) + tuple(sorted(dex['TypeChart']))
+
+
+def test_ids_are_the_same_whichever_way_the_dex_is_loaded(monkeypatch):
+    reset_dex()
+    from_table_files = id_names()
+    assert isinstance(lib.dex.dexes['gen1']['Pokedex'], lib.dex.Table)
+
+    def fail(*args):
+        raise OSError('read-only file system')
+
+    reset_dex()
+    shutil.rmtree(lib.dex.CACHE_DIR, ignore_errors=True)
+    monkeypatch.setattr(lib.dex, '_write_table', fail)
+    try:
+        from_json = id_names()
+        assert not isinstance(lib.dex.dexes['gen1']['Pokedex'], lib.dex.Table)
+    finally:
+        reset_dex()
+    assert from_json == from_table_files
+
+
+def test_unknown_names_have_id_0():
+    assert lib.ids.species_id('gen1', 'missingno') == 0
+    assert lib.ids.table('gen1', 'species').name(0) == ''
+    assert lib.ids.status_id('par') == lib.ids.STATUSES.index('par') + 1
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+import lib.loader
+import lib.trajectory
+from test_trajectory import columns
+
+
+@pytest.fixture
+def store(tmp_path):
+    lib.trajectory.write_shard(str(tmp_path), 'a', columns(0, 23))
+    lib.trajectory.write_shard(str(tmp_path), 'b', columns(23, 18))
+    return str(tmp_path)
+
+
+def batches(store: str, workers: int, **kwargs) -> list:
+    loader = lib.loader.Loader(store, batch_size=8, workers=workers, prefetch=2, columns=['battle', 'features'],
+                               seed=3, **kwargs)
+    return [batch for batch in loader]
+
+
+def test_same_batches_with_and_without_workers(store):
+    inline = batches(store, 0)
+    for workers in (1, 2, 3):
+        parallel = batches(store, workers)
+        assert len(parallel) == len(inline) == 6
+        for expected, batch in zip(inline, parallel):
+            np.testing.assert_array_equal(batch["battle"], expected["battle"])
+            np.testing.assert_array_equal(batch["features"], expected["features"])
+
+
+def test_every_row_once_per_epoch(store):
+    for batch in batches(store, 2):
+        assert batch["features"].flags.c_contiguous
+        np.testing.assert_array_equal(batch["features"][:, 0], batch["battle"])
+    rows = np.concatenate([batch["battle"] for batch in batches(store, 2)])
+    np.testing.assert_array_equal(np.sort(rows), np.arange(41))
+
+
+def test_epochs_are_shuffled_differently(store):
+    loader = lib.loader.Loader(store, batch_size=41, workers=0, columns=['battle'], seed=3)
+    first = next(iter(loader))["battle"]
+    second = next(iter(loader))["battle"]
+    assert not np.array_equal(first, second)
+
+
+def test_drop_last(store):
+    kept = batches(store, 2, drop_last=True)
+    assert [len(batch["battle"]) for batch in kept] == [8] * 5
+
+
+def test_worker_errors_are_raised(store, tmp_path):
+    loader = lib.loader.Loader(store, batch_size=8, workers=2)
+    (tmp_path / 'shard-a' / 'features.npy').unlink()
+    with pytest.raises(RuntimeError):
+        list(loader)
+
+
+def test_unshuffled_batches_are_in_order(store):
+    loader = lib.loader.Loader(store, batch_size=10, workers=2, columns=['battle'], shuffle=False)
+    assert len(loader) == 5
+    np.testing.assert_array_equal(np.concatenate([batch["battle"] for batch in loader]), np.arange(41))
+
+
+def test_invalid_arguments(store):
+    with pytest.raises(ValueError):
+        lib.loader.Loader(store, columns=['features', 'value'])
+    with pytest.raises(ValueError):
+        lib.loader.Loader(store, batch_size=0)
+    with pytest.raises(ValueError):
+        lib.loader.Loader(store, workers=-1)
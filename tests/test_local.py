@@ -0,0 +1,68 @@
+import pytest
+
+import lib.local
+
+
+class Pool():
+    """ Stands in for `multiprocessing.Pool`, running the jobs in this process. """
+    def __init__(self, processes):
+        self.processes = processes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def map(self, function, jobs):
+        return [function(job) for job in jobs]
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    """ Records the jobs of `run_parallel` instead of running any battles. """
+    jobs = []
+
+    def run_shard(job):
+        jobs.append(job)
+        num = job[3]
+        return [num, 0, num * 2], None
+
+    monkeypatch.setattr(lib.local.multiprocessing, 'Pool', Pool)
+    monkeypatch.setattr(lib.local, '_run_shard', run_shard)
+    return jobs
+
+
+@pytest.mark.parametrize('num, workers', [(1, 1), (10, 1), (10, 3), (3, 8), (12, 4), (101, 7)])
+def test_shards_cover_every_battle_once(jobs, num, workers):
+    results, timer = lib.local.run_parallel('gen1', ['random', 'random'], 'gen1randombattle', num, workers)
+    shards = [(job[7], job[3]) for job in jobs]
+    assert len(shards) == min(num, workers)
+    assert all(size > 0 for _, size in shards)
+    assert max(size for _, size in shards) - min(size for _, size in shards) <= 1
+    assert sum(size for _, size in shards) == num
+    battle_ids = [first_id + i for first_id, size in shards for i in range(size)]
+    assert sorted(battle_ids) == list(range(num))
+    assert results == [num, 0, num * 2]
+    assert timer is None
+
+
+def test_jobs_pass_the_arguments_through(jobs):
+    lib.local.run_parallel('gen1', ['a', 'b'], 'gen1ou', 4, 2, concurrency=3, save_replay=True, replay_dir='out',
+                           trajectory_dir='trajectories')
+    assert jobs == [('gen1', ['a', 'b'], 'gen1ou', 2, 3, True, 'out', 0, False, 'trajectories'),
+                    ('gen1', ['a', 'b'], 'gen1ou', 2, 3, True, 'out', 2, False, 'trajectories')]
+
+
+def test_no_battles_skips_the_pool(jobs):
+    results, timer = lib.local.run_parallel('gen1', ['a', 'b'], 'gen1ou', 0, 4, profile_phases=True)
+    assert results == [0, 0, 0]
+    assert timer is not None
+    assert jobs == []
+
+
+@pytest.mark.parametrize('num, workers, concurrency', [(-1, 1, 1), (1, 0, 1), (1, -2, 1), (1, 1, 0)])
+def test_invalid_arguments(jobs, num, workers, concurrency):
+    with pytest.raises(ValueError):
+        lib.local.run_parallel('gen1', ['a', 'b'], 'gen1ou', num, workers, concurrency=concurrency)
+    assert jobs == []
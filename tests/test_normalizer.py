@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+import lib.normalizer
+from lib.gamestate import GameState
+
+
+def decision_points(log: str) -> (list, list):
+    """ Returns a copy of the gamestate of both players at every turn of the log, along with their player index. """
+    gamestates, players = [], []
+    for name in ('Alice', 'Bob'):
+        gamestate = GameState('gen1', name)
+        for line in log.splitlines():
+            gamestate.parse(line)
+            if line.startswith('|turn|') and all(player.get_active() for player in gamestate.players[:2]):
+                gamestates.append(gamestate.clone())
+                players.append(gamestate.player_idx)
+    return gamestates, players
+
+
+def test_normalize_array_matches_normalize(log):
+    gamestates, players = decision_points(log)
+    assert len(gamestates) == 12
+    for gamestate, player in zip(gamestates, players):
+        features = lib.normalizer.normalize(gamestate, player)
+        array = lib.normalizer.normalize_array(gamestate, player)
+        assert array.dtype == np.float32 and array.shape == (lib.normalizer.N_FEATURES,)
+        for name, value in features.items():
+            assert array[lib.normalizer.INDEX[name]] == pytest.approx(value, rel=1e-6)
+        # Only the features of unknown moves are left out of the dict, and they are 0 in the array
+        for name in set(lib.normalizer.FEATURES) - set(features):
+            assert name.startswith('move')
+            assert array[lib.normalizer.INDEX[name]] == 0
+
+
+def test_layout():
+    assert lib.normalizer.N_FEATURES == 105
+    assert lib.normalizer.INDEX['player_faster_than_opp'] == 0
+    assert lib.normalizer.INDEX['percent_known_of_player'] == 1
+    assert lib.normalizer.INDEX['percent_known_of_opponent'] == 53
+    assert lib.normalizer.INDEX['is_recharging_player_active'] == 19
+    assert lib.normalizer.INDEX['type_bug_player_active'] == 26
+    assert lib.normalizer.INDEX['move0_power_player_active'] == 41
+    assert lib.normalizer.INDEX['move3_acc_opponent_active'] == 104
+
+
+def test_normalize_array_fills_out(log):
+    gamestates, players = decision_points(log)
+    out = np.full(lib.normalizer.N_FEATURES + 2, -1, dtype=np.float32)
+    lib.normalizer.normalize_array(gamestates[0], players[0], out=out[1:-1])
+    np.testing.assert_array_equal(out[1:-1], lib.normalizer.normalize_array(gamestates[0], players[0]))
+    assert out[0] == -1 and out[-1] == -1
+
+
+def test_normalize_batch_matches_normalize_array(log):
+    gamestates, players = decision_points(log)
+    expected = np.stack([lib.normalizer.normalize_array(g, p) for g, p in zip(gamestates, players)])
+    batch = lib.normalizer.normalize_batch(gamestates, players)
+    assert batch.dtype == np.float32 and batch.shape == (len(gamestates), lib.normalizer.N_FEATURES)
+    np.testing.assert_array_equal(batch, expected)
+    np.testing.assert_array_equal(lib.normalizer.normalize_batch(gamestates, 0),
+                                  np.stack([lib.normalizer.normalize_array(g, 0) for g in gamestates]))
+
+
+def test_normalize_batch_fills_out(log):
+    gamestates, players = decision_points(log)
+    out = np.full((len(gamestates) + 2, lib.normalizer.N_FEATURES), -1, dtype=np.float32)
+    lib.normalizer.normalize_batch(gamestates, players, out=out[1:-1])
+    np.testing.assert_array_equal(out[1:-1], lib.normalizer.normalize_batch(gamestates, players))
+    assert (out[0] == -1).all() and (out[-1] == -1).all()
+    assert lib.normalizer.normalize_batch([], []).shape == (0, lib.normalizer.N_FEATURES)
+
+
+def test_cache_does_not_change_the_features(log):
+    cache = lib.normalizer.FeatureCache()
+    for _ in range(2):
+        for gamestate, player in zip(*decision_points(log)):
+            np.testing.assert_array_equal(lib.normalizer.normalize_array(gamestate, player, cache=cache),
+                                          lib.normalizer.normalize_array(gamestate, player))
+            assert lib.normalizer.normalize(gamestate, player, cache=cache) == lib.normalizer.normalize(gamestate, player)
+    assert cache.hits and cache.static_hits and cache.misses
+
+
+def test_cache_only_recomputes_what_changed(log):
+    gamestate = decision_points(log)[0][1]
+    cache = lib.normalizer.FeatureCache()
+    first = lib.normalizer.normalize_array(gamestate, 0, cache=cache)
+    assert (cache.hits, cache.static_hits, cache.misses) == (0, 0, 2)
+    lib.normalizer.normalize_array(gamestate, 0, cache=cache)
+    assert (cache.hits, cache.static_hits, cache.misses) == (2, 0, 2)
+    stamp = gamestate.players[1].get_active().stamp
+    gamestate.apply_damage(1, 0.2, status=['par'])
+    assert gamestate.players[1].get_active().stamp != stamp
+    changed = lib.normalizer.normalize_array(gamestate, 0, cache=cache)
+    assert (cache.hits, cache.static_hits, cache.misses) == (3, 1, 2)
+    np.testing.assert_array_equal(changed, lib.normalizer.normalize_array(gamestate, 0))
+    assert changed[lib.normalizer.INDEX['is_par_opponent_active']] == 1
+    assert not np.array_equal(changed, first)
+
+
+def test_cache_is_bounded(log):
+    cache = lib.normalizer.FeatureCache(size=2)
+    for gamestate, player in zip(*decision_points(log)):
+        lib.normalizer.normalize_array(gamestate, player, cache=cache)
+        assert len(cache._pokemon) <= 2 and len(cache._static) <= 2
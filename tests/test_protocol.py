@@ -0,0 +1,75 @@
+import pytest
+
+import lib.bench
+import lib.protocol
+
+LINES = [
+    '|move|p1a: Starmie|Surf|p2a: Pikachu\n',
+    '|move|p1a: Starmie|Surf|p2a: Pikachu|[miss]',
+    '|-damage|p2a: Pikachu|45/100\n',
+    '|switch|p1a: Nidoran♀|Nidoran-F, L90, F|100/100\n',
+    '|\n',
+    '|split|p1\n',
+    '|-message|a|b||c\n',
+    '  |turn|2  \n',
+]
+
+NAMES = ['Starmie', 'Nidoran♀', 'Mr. Mime', "Farfetch’d", 'U-turn', 'Porygon2', 'Type: Null', '']
+
+IDENTS = ['p1a: Starmie', 'p2b: Mr. Mime', 'p1: Alice', 'p2: Type: Null', 'p1a: Farfetch’d']
+
+DETAILS = ['Starmie, L74', 'Nidoran-F, L90, F', 'Pikachu, L88, M', 'Gengar, L80, shiny', 'Rhydon, L5, M, shiny',
+           'Mr. Mime, L100']
+
+CONDITIONS = ['100/100', '20/100 par', '45/100 slp', '261/261', '0 fnt', '7/305 tox', '1/100 brn']
+
+
+@pytest.mark.parametrize('line', LINES)
+def test_tokenize(line):
+    assert lib.protocol.tokenize(line) == lib.bench._legacy_tokenize(line)
+
+
+@pytest.mark.parametrize('name', NAMES)
+def test_standardize_string(name):
+    assert lib.protocol.standardize_string(name) == lib.bench._legacy_standardize_string(name)
+    assert lib.protocol.standardize_string(name) is lib.protocol.standardize_string(name)
+
+
+def test_standardize_string_bounds_its_cache(monkeypatch):
+    monkeypatch.setattr(lib.protocol, 'MAX_CACHED_NAMES', 2)
+    monkeypatch.setattr(lib.protocol, '_standardized', {})
+    for name in NAMES:
+        assert lib.protocol.standardize_string(name) == lib.bench._legacy_standardize_string(name)
+        assert len(lib.protocol._standardized) <= 2
+
+
+@pytest.mark.parametrize('ident', IDENTS)
+def test_read_ident(ident):
+    assert lib.protocol.read_ident(ident) == lib.bench._legacy_read_ident(ident)
+
+
+@pytest.mark.parametrize('details', DETAILS)
+def test_read_details(details):
+    assert lib.protocol.read_details(details) == lib.bench._legacy_read_details(details)
+
+
+@pytest.mark.parametrize('details, name', [('Mewtwo', 'Mewtwo'), ('Pikachu, M', 'Pikachu'),
+                                           ('Gengar, F, shiny', 'Gengar'), ('Mr. Mime, shiny', 'Mr. Mime')])
+def test_read_details_without_level(details, name):
+    # The legacy decoder can't read these at all, since showdown leaves the level out at level 100
+    with pytest.raises(AttributeError):
+        lib.bench._legacy_read_details(details)
+    assert lib.protocol.read_details(details) == (name, 100)
+
+
+@pytest.mark.parametrize('condition', CONDITIONS)
+def test_read_condition(condition):
+    assert lib.protocol.read_condition(condition) == lib.bench._legacy_read_condition(condition)
+
+
+def test_decoded_log_matches_legacy(log):
+    lines = log.splitlines(keepends=True)
+    decoded, legacy = [], []
+    lib.bench._decode(lines, lib.bench.DECODERS, decoded)
+    lib.bench._decode(lines, lib.bench.LEGACY_DECODERS, legacy)
+    assert decoded == legacy
@@ -0,0 +1,43 @@
+import json
+
+import lib.normalizer
+import lib.replay
+from lib.gamestate import GameState
+
+
+def plain(value):
+    """ Returns a value the way it reads back from json. """
+    return json.loads(json.dumps(value))
+
+
+def test_written_replay_reads_back_as_timelines(tmp_path, log):
+    path = str(tmp_path / 'battle.jsonl.gz')
+    writer = lib.replay.ReplayWriter(path)
+    gamestates = {1: GameState('gen1', 'Alice'), 2: GameState('gen1', 'Bob')}
+    lines = []
+    snapshots = {1: [], 2: []}
+    for line in log.splitlines(keepends=True):
+        for gamestate in gamestates.values():
+            gamestate.parse(line)
+        writer.log(line)
+        lines.append(line)
+        if line.startswith('|turn|'):
+            for bot_idx, gamestate in gamestates.items():
+                norm = lib.normalizer.normalize(gamestate, gamestate.player_idx)
+                writer.snapshot(bot_idx, gamestate, norm)
+                snapshots[bot_idx].append((plain(gamestate.to_dict()), plain(norm)))
+    writer.result('Alice')
+    writer.close()
+
+    records = list(lib.replay.read(path))
+    assert [record["type"] for record in records].count("state") == 2
+    assert [record["type"] for record in records].count("delta") == 2 * (len(snapshots[1]) - 1)
+    assert records[-1] == {"type": "result", "winner": "Alice"}
+
+    replay_log, gamestate_timelines, norm_timelines = lib.replay.timelines(path)
+    assert replay_log == lines
+    for bot_idx, expected in snapshots.items():
+        assert len(gamestate_timelines[bot_idx]) == len(norm_timelines[bot_idx]) == len(expected)
+        for idx, (state, norm) in enumerate(expected):
+            assert gamestate_timelines[bot_idx].state_at(idx) == state
+            assert norm_timelines[bot_idx].state_at(idx) == norm
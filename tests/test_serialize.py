@@ -0,0 +1,81 @@
+import io
+import marshal
+
+import pytest
+
+import lib.ids
+import lib.serialize
+from lib.gamestate import GameState
+
+
+def states(log: str) -> list:
+    """ Returns a copy of the gamestate of both players at every turn of the log. """
+    copies = []
+    for name in ('Alice', 'Bob'):
+        gamestate = GameState('gen1', name)
+        for line in log.splitlines():
+            gamestate.parse(line)
+            if line.startswith('|turn|'):
+                copies.append(gamestate.clone())
+    return copies
+
+
+def to_v1(data: bytes) -> bytes:
+    """ Rewrites an encoded gamestate in the format of version 1, which named the templates instead of their ids. """
+    def move(data):
+        gen, name, pp, template = data
+        return gen, name, pp, lib.ids.table(gen, 'moves').name(template)
+
+    def pokemon(data):
+        fields, template, moves, status, transformed_as = data
+        return (fields, lib.ids.table(fields[0], 'species').name(template),
+                tuple((name, move(value)) for name, value in moves), status,
+                None if transformed_as is None else pokemon(transformed_as))
+
+    def player(data):
+        active, boosts, volatile_status, team, secret, is_player, status = data
+        return (active, boosts, volatile_status, tuple((name, pokemon(value)) for name, value in team),
+                tuple((name, pokemon(value)) for name, value in secret), is_player, status)
+
+    fields, players = marshal.loads(data[lib.serialize._header.size:])
+    tree = (fields, tuple(player(value) for value in players))
+    return lib.serialize._header.pack(lib.serialize.MAGIC, 1) + marshal.dumps(tree, 4)
+
+
+def test_round_trip(log):
+    for gamestate in states(log):
+        assert lib.serialize.loads(lib.serialize.dumps(gamestate)).to_dict() == gamestate.to_dict()
+
+
+def test_version_1_still_decodes(log):
+    for gamestate in states(log):
+        data = to_v1(lib.serialize.dumps(gamestate))
+        assert lib.serialize.loads(data).to_dict() == gamestate.to_dict()
+
+
+def test_decoded_gamestate_can_be_changed_and_cloned(log):
+    gamestate = states(log)[2]
+    decoded = lib.serialize.loads(lib.serialize.dumps(gamestate))
+    clone = decoded.clone()
+    decoded.apply_damage(0, 0.1)
+    assert clone.to_dict() == gamestate.to_dict()
+
+
+def test_rejects_unknown_versions(log):
+    data = bytearray(lib.serialize.dumps(states(log)[0]))
+    data[4:6] = (99).to_bytes(2, 'little')
+    with pytest.raises(ValueError):
+        lib.serialize.loads(bytes(data))
+    with pytest.raises(ValueError):
+        lib.serialize.loads(b'PK')
+
+
+def test_stream_round_trip(log):
+    gamestates = states(log)
+    stream = io.BytesIO()
+    for gamestate in gamestates:
+        lib.serialize.write(stream, gamestate)
+    data = stream.getvalue()
+    assert [g.to_dict() for g in lib.serialize.read(io.BytesIO(data))] == [g.to_dict() for g in gamestates]
+    with pytest.raises(ValueError):
+        list(lib.serialize.read(io.BytesIO(data[:-1])))
@@ -0,0 +1,61 @@
+import copy
+
+import pytest
+
+import lib.templates
+from lib.gamestate import Move, Pokemon
+
+
+def test_move_template_reads_priority_and_flags():
+    template = lib.templates.move_template('gen1', 'quickattack')
+    assert template.priority == 1
+    assert template.flags['contact'] and template.flags['protect'] and template.flags['mirror']
+    assert not template.flags['sound'] and not template.flags['punch']
+    assert set(template.flags) == set(lib.templates.FLAGS)
+    assert lib.templates.move_template('gen1', 'surf').priority == 0
+
+
+def test_move_without_flags_has_every_flag_unset():
+    template = lib.templates.move_template('gen1', 'struggle')
+    assert not any(template.flags.values())
+    assert template.flags is lib.templates.DEFAULT_MOVE.flags
+
+
+def test_flags_are_read_only_and_shared():
+    flags = lib.templates.move_template('gen1', 'surf').flags
+    assert flags is lib.templates.move_template('gen1', 'psychic').flags
+    with pytest.raises(TypeError):
+        flags['sound'] = True
+
+
+def test_templates_are_built_once_and_never_copied():
+    template = lib.templates.move_template('gen1', 'thunderbolt')
+    assert lib.templates.move_template('gen1', 'thunderbolt') is template
+    assert copy.copy(template) is template and copy.deepcopy(template) is template
+    species = lib.templates.species_template('gen1', 'starmie')
+    assert lib.templates.species_template('gen1', 'starmie') is species
+    assert copy.deepcopy(species) is species
+
+
+def test_move_reads_its_template():
+    move = Move('gen1')
+    move.name = 'Quick Attack'
+    move.find_move()
+    assert (move.priority, move.power, move.pp_max, move.type) == (1, 40, 30, 'Normal')
+    assert move.flags['contact']
+    assert move.accuracy == 1
+    recover = Move('gen1')
+    recover.name = 'recover'
+    recover.find_move()
+    assert (recover.heal, recover.accuracy, recover.target) == (1 / 2, 1, 'self')
+
+
+def test_species_template():
+    template = lib.templates.species_template('gen1', 'starmie')
+    assert template.types == ('Water', 'Psychic')
+    assert (template.base_hp, template.base_spe) == (60, 115)
+    assert template.type_mask == sum(1 << type_id for type_id in template.type_ids)
+    pokemon = Pokemon('gen1', 0)
+    pokemon.name = 'Starmie'
+    pokemon.find_pokemon(False)
+    assert pokemon.template is template
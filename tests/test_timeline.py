@@ -0,0 +1,105 @@
+import copy
+
+import pytest
+
+from lib.timeline import Timeline, diff, patch
+
+PAIRS = [
+    ({}, {}),
+    ({"a": 1}, {"a": 2}),
+    ({"a": 1, "b": 2}, {"a": 1}),
+    ({"a": 1}, {"a": 1, "b": {"c": [1, 2]}}),
+    ({"a": {"b": {"c": 1, "d": [1, {"e": 2}]}}}, {"a": {"b": {"c": 1, "d": [1, {"e": 3, "f": None}]}}}),
+    ({"a": [1, 2, 3]}, {"a": [1, 2]}),
+    ({"a": [[1, 2], [3]]}, {"a": [[1, 5], [3]]}),
+    ({"a": [1, 2]}, {"a": {"0": 1}}),
+    ({"a": 1}, {"a": 1.0}),
+    ({"a": 1}, {"a": True}),
+    ({"a": None}, {"a": {"b": 1}}),
+    (None, {"a": [1, {"b": 2}]}),
+    ({"a": 1}, None),
+    ([1, 2], [1, 3]),
+    (1, "1"),
+]
+
+
+@pytest.mark.parametrize('old, new', PAIRS)
+def test_patch_of_diff_gives_new(old, new):
+    delta = diff(old, new)
+    result = patch(copy.deepcopy(old), delta)
+    assert result == new
+    assert type(result) is type(new)
+    assert diff(new, patch(copy.deepcopy(old), delta)) == []
+
+
+def test_diff_keeps_the_type_of_equal_values():
+    assert diff({"a": 1}, {"a": 1.0}) == [[["a"], 1.0]]
+    assert diff({"a": 1}, {"a": True}) == [[["a"], True]]
+
+
+def test_diff_of_removed_key():
+    assert diff({"a": {"b": 1, "c": 2}}, {"a": {"b": 1}}) == [[["a", "c"]]]
+
+
+def test_patch_copies_the_values_it_sets():
+    old = {"a": 1}
+    new = {"a": 1, "b": {"c": [1]}}
+    delta = diff(old, new)
+    first = patch(copy.deepcopy(old), delta)
+    first["b"]["c"].append(2)
+    assert patch(copy.deepcopy(old), delta) == new
+    assert delta == [[["b"], {"c": [1]}]]
+
+
+def snapshots() -> list:
+    states = [{"turn": 0, "players": [{"hp": 1.0, "boosts": {}}, {"hp": 1.0, "boosts": {}}], "log": []}]
+    for turn in range(1, 6):
+        state = copy.deepcopy(states[-1])
+        state["turn"] = turn
+        state["players"][turn % 2]["hp"] -= 0.1
+        state["players"][0]["boosts"]["atk"] = turn
+        if turn == 3:
+            del state["players"][0]["boosts"]["atk"]
+        state["log"].append(f'turn {turn}')
+        states.append(state)
+    return states
+
+
+def test_record_and_state_at():
+    states = snapshots()
+    timeline = Timeline()
+    assert len(timeline) == 0
+    for state in states:
+        timeline.record(state)
+    assert len(timeline) == len(states)
+    for idx, state in enumerate(states):
+        assert timeline.state_at(idx) == state
+    with pytest.raises(IndexError):
+        timeline.state_at(len(states))
+
+
+def test_append_rebuilds_the_same_timeline():
+    states = snapshots()
+    recorded = Timeline()
+    for state in states:
+        recorded.record(state)
+    base = copy.deepcopy(states[0])
+    appended = Timeline(base)
+    for delta in recorded.deltas:
+        appended.append(delta)
+    assert base == states[0]
+    assert [appended.state_at(idx) for idx in range(len(states))] == states
+    assert appended.to_dict() == recorded.to_dict()
+
+
+def test_append_leaves_recorded_snapshots_alone():
+    states = snapshots()
+    kept = copy.deepcopy(states)
+    timeline = Timeline()
+    timeline.record(states[0])
+    timeline.record(states[1])
+    for old, new in zip(kept[1:], kept[2:]):
+        timeline.append(diff(old, new))
+    timeline.record(states[-1])
+    assert states == kept
+    assert [timeline.state_at(idx) for idx in range(len(timeline))] == kept + [kept[-1]]
@@ -0,0 +1,70 @@
+import os
+
+import numpy as np
+
+import lib.normalizer
+import lib.trajectory
+
+
+def columns(start: int, rows: int) -> dict:
+    battle = np.arange(start, start + rows)
+    return {
+        "features": np.repeat(battle[:, None], lib.normalizer.N_FEATURES, axis=1).astype(np.float32),
+        "action": battle % lib.trajectory.N_ACTIONS,
+        "mask": np.ones((rows, lib.trajectory.N_ACTIONS), dtype=np.bool_),
+        "reward": np.ones(rows),
+        "battle": battle,
+        "player": np.zeros(rows),
+        "turn": battle,
+    }
+
+
+def test_write_shard_replaces_a_shard_of_the_same_name(tmp_path):
+    path = str(tmp_path)
+    lib.trajectory.write_shard(path, 'a', columns(0, 5))
+    os.makedirs(os.path.join(path, 'shard-a.tmp'))
+    with open(os.path.join(path, 'shard-a.tmp', 'stale.npy'), 'w') as stale:
+        stale.write('stale')
+    lib.trajectory.write_shard(path, 'a', columns(100, 3))
+    assert sorted(os.listdir(path)) == ['shard-a']
+    assert 'stale.npy' not in os.listdir(os.path.join(path, 'shard-a'))
+    store = lib.trajectory.TrajectoryStore(path)
+    np.testing.assert_array_equal(store.rows(np.arange(len(store)))["battle"], [100, 101, 102])
+
+
+def test_rows_gathers_across_shards_in_order(tmp_path):
+    path = str(tmp_path)
+    lib.trajectory.write_shard(path, 'a', columns(0, 5))
+    lib.trajectory.write_shard(path, 'b', columns(5, 7))
+    store = lib.trajectory.TrajectoryStore(path)
+    index = [11, 0, 6, 4, 5, 3]
+    batch = store.rows(index, ['battle', 'features'])
+    assert set(batch) == {'battle', 'features'}
+    np.testing.assert_array_equal(batch["battle"], index)
+    np.testing.assert_array_equal(batch["features"][:, -1], index)
+
+
+def test_action_id():
+    assert [lib.trajectory.action_id(choice) for choice in ('move 1', 'move 4', 'switch 1', 'switch 6')] == [0, 3, 4, 9]
+    assert [lib.trajectory.action_id(choice) for choice in ('default', 'move thunderbolt', 'switch 7')] == [-1, -1, -1]
+
+
+def test_writer_flushes_full_shards(tmp_path):
+    path = str(tmp_path / 'store')
+    writer = lib.trajectory.TrajectoryWriter(path, shard_size=4, prefix='w')
+    masks = np.ones((3, lib.trajectory.N_ACTIONS))
+    for battle in range(3):
+        features = np.full((3, lib.normalizer.N_FEATURES), battle)
+        writer.append(str(battle), battle % 2, [1, 2, 3], features, [0, 4, 9], masks, 1 - battle)
+    writer.append('empty', 0, [], np.zeros((0, lib.normalizer.N_FEATURES)), [], np.zeros((0, 10)), 0)
+    assert len(writer.shards) == 1
+    writer.close()
+    assert len(writer.shards) == 2 and writer.rows == 9
+    store = lib.trajectory.TrajectoryStore(path)
+    rows = store.rows(np.arange(len(store)))
+    np.testing.assert_array_equal(rows["turn"], [1, 2, 3] * 3)
+    np.testing.assert_array_equal(rows["action"], [0, 4, 9] * 3)
+    np.testing.assert_array_equal(rows["reward"], np.repeat([1, 0, -1], 3))
+    np.testing.assert_array_equal(rows["features"][:, 0], np.repeat([0, 1, 2], 3))
+    assert len(set(rows["battle"])) == 3
+    assert rows["battle"][0] == lib.trajectory.battle_id('w0')
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+import lib.ids
+import lib.typechart
+from lib.gamestate import Move, Pokemon
+
+
+def type_id(name: str) -> int:
+    return lib.ids.type_id('gen1', name)
+
+
+def species_id(name: str) -> int:
+    return lib.ids.species_id('gen1', name)
+
+
+@pytest.mark.parametrize('attacking, defending, multiplier', [
+    ('Ghost', 'Normal', 0),
+    ('Normal', 'Ghost', 0),
+    ('Electric', 'Ground', 0),
+    ('Water', 'Fire', 2),
+    ('Electric', 'Water', 2),
+    ('Fire', 'Water', 0.5),
+    ('Psychic', 'Psychic', 0.5),
+    ('Normal', 'Rock', 0.5),
+    ('Fire', 'Grass', 1),
+])
+def test_type_chart(attacking, defending, multiplier):
+    assert lib.typechart.type_chart('gen1')[type_id(attacking), type_id(defending)] == multiplier
+
+
+def test_unknown_type_is_neutral():
+    chart = lib.typechart.type_chart('gen1')
+    assert chart.shape == (len(lib.ids.table('gen1', 'types')),) * 2
+    assert (chart[0] == 1).all() and (chart[:, 0] == 1).all()
+
+
+def found(cls, name: str, *args):
+    value = cls('gen1', *args)
+    value.name = name
+    if cls is Move:
+        value.find_move()
+    else:
+        value.find_pokemon(False)
+    return value
+
+
+@pytest.mark.parametrize('move, pokemon, multiplier', [
+    ('surf', 'rhydon', 4),
+    ('thunderbolt', 'rhydon', 0),
+    ('doubleedge', 'rhydon', 0.5),
+    ('thunderbolt', 'starmie', 2),
+    ('psychic', 'starmie', 0.5),
+    ('doubleedge', 'gengar', 0),
+    ('earthquake', 'pikachu', 1),
+])
+def test_effectiveness(move, pokemon, multiplier):
+    assert lib.typechart.effectiveness(found(Move, move), found(Pokemon, pokemon, 0)) == multiplier
+
+
+def test_type_vs_species():
+    array = lib.typechart.type_vs_species('gen1')
+    assert array.shape == (len(lib.ids.table('gen1', 'types')), len(lib.ids.table('gen1', 'species')))
+    assert array[type_id('Water'), species_id('rhydon')] == 4
+    assert array[type_id('Electric'), species_id('rhydon')] == 0
+    assert array[type_id('Psychic'), species_id('starmie')] == 0.5
+    assert array[type_id('Normal'), species_id('gengar')] == 0
+    assert (array[:, 0] == 1).all()
+
+
+def test_move_vs_species():
+    array = lib.typechart.move_vs_species('gen1')
+    moves = lib.ids.table('gen1', 'moves')
+    assert array.shape == (len(moves), len(lib.ids.table('gen1', 'species')))
+    for name, row in (('surf', 'Water'), ('thunderwave', 'Electric'), ('recover', 'Normal')):
+        np.testing.assert_array_equal(array[moves.id(name)], lib.typechart.type_vs_species('gen1')[type_id(row)])
+    assert (array[0] == 1).all()
+
+
+def test_species_vs_species():
+    array = lib.typechart.species_vs_species('gen1')
+    assert array[species_id('starmie'), species_id('rhydon')] == 4
+    assert array[species_id('pikachu'), species_id('rhydon')] == 0
+    assert array[species_id('gengar'), species_id('starmie')] == 1
+
+
+def test_species_types():
+    array = lib.typechart.species_types('gen1')
+    assert tuple(array[species_id('starmie')]) == (type_id('Water'), type_id('Psychic'))
+    assert tuple(array[species_id('pikachu')]) == (type_id('Electric'), 0)
+
+
+@pytest.mark.parametrize('build', [lib.typechart.type_chart, lib.typechart.species_types, lib.typechart.type_vs_species,
+                                   lib.typechart.move_vs_species, lib.typechart.species_vs_species])
+def test_arrays_are_shared_and_read_only(build):
+    array = build('gen1')
+    assert build('gen1') is array
+    assert not array.flags.writeable
+    with pytest.raises(ValueError):
+        array[0, 0] = 2
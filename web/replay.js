@@ -34,6 +34,40 @@ requireScript(PREFIX+'/data/teambuilder-tables.js');
 requireScript(PREFIX+'/js/battle-tooltips.js');
 requireScript(PREFIX+'/js/battle.js');
 
+// Gamestates are embedded as a base snapshot followed by the changes made at
+// every later snapshot, in the format written by lib/timeline.py. A Timeline
+// rebuilds the full snapshots from those as they are stepped through.
+function Timeline(data) {
+	this.base = data.base
+	this.deltas = data.deltas
+	this.states = [data.base]
+	this.length = data.base === null ? 0 : data.deltas.length + 1
+}
+
+Timeline.prototype.patch = function (state, delta) {
+	for (const op of delta) {
+		const path = op[0]
+		if (path.length == 0) {
+			state = JSON.parse(JSON.stringify(op[1]))
+			continue
+		}
+		let target = state
+		for (let i = 0; i < path.length - 1; i++) target = target[path[i]]
+		if (op.length > 1) target[path[path.length - 1]] = JSON.parse(JSON.stringify(op[1]))
+		else delete target[path[path.length - 1]]
+	}
+	return state
+}
+
+Timeline.prototype.at = function (idx) {
+	if (idx < 0 || idx >= this.length) return {}
+	for (let i = this.states.length; i <= idx; i++) {
+		const state = JSON.parse(JSON.stringify(this.states[i - 1]))
+		this.states.push(this.patch(state, this.deltas[i - 1]))
+	}
+	return this.states[idx]
+}
+
 var Replay = {
 	init: function () {
 		// Showdown
@@ -49,10 +83,10 @@ var Replay = {
 			mode: "view",
 			mainMenuBar: false,
 		}
-		this.gs1 = JSON.parse($("#bot1").text())
-		this.gs2 = JSON.parse($("#bot2").text())
-		this.gs1norm = JSON.parse($("#bot1-norm").text())
-		this.gs2norm = JSON.parse($("#bot2-norm").text())
+		this.gs1 = new Timeline(JSON.parse($("#bot1").text()))
+		this.gs2 = new Timeline(JSON.parse($("#bot2").text()))
+		this.gs1norm = new Timeline(JSON.parse($("#bot1-norm").text()))
+		this.gs2norm = new Timeline(JSON.parse($("#bot2-norm").text()))
 
 		var b1 = document.getElementById("bot1-viewer")
 		var b2 = document.getElementById("bot2-viewer")
@@ -93,10 +127,10 @@ var Replay = {
 	setEditors: function (idx) {
 		this.editor = idx
 		if (idx != null) {
-			this.gs1Editor.set(this.gs1[idx])
-			this.gs2Editor.set(this.gs2[idx])
-			this.gs1NormEditor.set(this.gs1norm[idx])
-			this.gs2NormEditor.set(this.gs2norm[idx])
+			this.gs1Editor.set(this.gs1.at(idx))
+			this.gs2Editor.set(this.gs2.at(idx))
+			this.gs1NormEditor.set(this.gs1norm.at(idx))
+			this.gs2NormEditor.set(this.gs2norm.at(idx))
 		}
 		else {
 			this.gs1Editor.set({})